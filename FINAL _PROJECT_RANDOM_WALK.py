@@ -37,7 +37,7 @@ for i in range(num_walks):
 ave_dist2 = np.average(last_pos**2)
 #***********************************88
 
-print ' For %d steps, average distance squared from center = %5.1f' %( num_steps, ave_dist2)
+print(' For %d steps, average distance squared from center = %5.1f' %( num_steps, ave_dist2))
 #  Set plot title , legend, and grid 
 plt.title('Histogram of 1D walk , #steps = %i, <x**2> = %6.1f' % (num_steps, ave_dist2))
 plt.hist(last_pos, bins=50, color='red') 
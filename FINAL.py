@@ -2,47 +2,41 @@
 #  Simple python random walk in 1D
 #  Plots histogram of ending positions
 #
-import random
+#  The end positions of all walks are drawn at once
+#  (see randwalk1d.py) and <x**2> is checked against
+#  its exact value, the number of steps.
+#
 import numpy as np
-import matplotlib.pyplot as plt
-
-def random_walk(steps):
-    """  Performs 1D random walk with number steps = steps """
-    walk = np.zeros(steps+1)
-    for i in range(steps):
-        if random.uniform(0, 1) < .5:
-            step =  1
-        else:
-            step = -1
-        walk[i+1] = walk[i] + random.choice([-1,1])
-    return walk
+import randwalk1d
+import randwalk3d_plot as rwplot
 
-num_walks = int(input("
-num_steps = 1000 
+num_walks = int(input('Enter number of walks to simulate:  '))
+num_steps = 1000
 #
 #  Perform random walks and saves ending step
-# 
-last_pos = np.zeros(num_walks)
-for i in range(num_walks):      
-    walk = random_walk(num_steps)
-    last_pos[i] = walk[-1] 
+#
+last_pos = randwalk1d.end_positions(num_walks, num_steps)
 #************************************
 #   YOUR CODE goes HERE:
 #    Compute the average of the last
 #    positions (from last position array
 #    above) and store in variable called:
-#      'ave_dist2' . This variable is 
-#   used in plot below   
+#      'ave_dist2' . This variable is
+#   used in plot below
 #
 ave_dist2 = np.average(last_pos**2)
 #***********************************88
 
-print ' For %d steps, average distance squared from center = %5.1f' %( num_steps, ave_dist2)
-#  Set plot title , legend, and grid 
-plt.title('Histogram of 1D walk , #steps = %i, <x**2> = %6.1f' % (num_steps, ave_dist2))
-plt.hist(last_pos, bins=50, color='red') 
-plt.xlabel(' Number of steps')
-plt.ylabel(' Frequency')
-plt.savefig('hist' + str(num_steps) + '.png')
-plt.grid(True)
-plt.show() 
+print(' For %d steps, average distance squared from center = %5.1f' %( num_steps, ave_dist2))
+ave_dist2, expected, std_error, agrees = randwalk1d.check_mean_square(last_pos, num_steps)
+print(' Expected %d, difference %+.1f (%.1f standard errors)%s' % (expected, ave_dist2 - expected,
+      abs(ave_dist2 - expected) / std_error, '' if agrees else '  MISMATCH'))
+#  Set plot title , legend, and grid
+fig = rwplot.new_figure()
+ax = fig.add_subplot(1, 1, 1)
+ax.set_title('Histogram of 1D walk , #steps = %i, <x**2> = %6.1f' % (num_steps, ave_dist2))
+ax.hist(last_pos, bins=50, color='red')
+ax.set_xlabel(' Number of steps')
+ax.set_ylabel(' Frequency')
+ax.grid(True)
+print(' Histogram saved to %s' % rwplot.save_figure(fig, 'hist' + str(num_steps) + '.png'))
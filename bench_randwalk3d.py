@@ -0,0 +1,284 @@
+#
+#  Benchmarks for the 3D random walk modules
+#
+#  Measures
+#    - steps per second of RandomWalk3d.conduct_walk for every step
+#      function (and of the compiled kernel when it is available),
+#    - the cost per point of the containment checks of every shape in
+#      shapes3d_class: the scalar check_inside called once per point (as
+#      in conduct_walk) against the vectorized contains called on a whole
+#      batch of points,
+#    - the end-to-end time of a small 3dbet-style sweep,
+#    - the memory per walk with path recording on and off.
+#
+#  'run' prints the tables and can save all numbers with machine metadata
+#  to a JSON file; 'compare' checks such a file against a stored baseline
+#  and exits with status 1 if a benchmark got slower (or larger) by more
+#  than the tolerance:
+#
+#     python bench_randwalk3d.py run -o baseline.json
+#     ... change the code ...
+#     python bench_randwalk3d.py run -o current.json
+#     python bench_randwalk3d.py compare baseline.json current.json
+#
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import numpy as np
+import shapes3d_class as shapes
+import randwalk3d_class as rw3d
+import randwalk3d_kernel as kernel
+import randwalk3d_steps as rwsteps
+import randwalk3d_sweep as sweep
+
+num_points = 100000
+num_steps  = 200000
+TOLERANCE  = 0.10       # Relative change that 'compare' reports as a regression
+
+shape_list = [shapes.Rectangle3d((0.0, 0.0, 0.0), 20, 20, 40),
+              shapes.Sphere((0.0, 0.0, 0.0), 30),
+              shapes.Ellipsoid((0.0, 0.0, 0.0), 20, 40, 20),
+              shapes.Rectangle3d((0.0, 0.0, 0.0), 20, 20, 40, (30, 45, 60)),
+              shapes.Ellipsoid((0.0, 0.0, 0.0), 20, 40, 20, (30, 45, 60))]
+
+#  Small version of sweeps/sphere_radius.json (the 3dbet.py sweep)
+SWEEP_CONFIG = {'name': 'bench_sweep', 'num_sim': 40, 'max_steps': 10**7, 'seed': 2017,
+                'step': 'direct', 'start_loc': [0.0, 0.0, 0.0], 'move_target': False,
+                'boundary': {'shape': 'Sphere', 'location': [0.0, 0.0, 0.0],
+                             'radius': 'radius'},
+                'target': {'shape': 'Sphere',
+                           'location': ['radius / 2', 'radius / 2', 'radius / 2'],
+                           'radius': 'radius / 6'},
+                'grid': {'radius': [5.0, 10.0]}}
+
+def time_per_point(func, num, repeat=3):
+    """
+    Returns best time (seconds) per point of calling func, which
+    processes num points per call
+    """
+    return min(timeit.repeat(func, number=1, repeat=repeat)) / num
+
+def shape_name(shape):
+    """
+    Returns name of shape for the result tables
+    """
+    return type(shape).__name__ + (' (rot)' if shape.is_rotated() else '')
+
+def step_functions(seed=0):
+    """
+    Returns list of (name, step function) pairs to benchmark conduct_walk with
+    """
+    return [('rand_grid', rw3d.rand_grid),
+            ('rand_direct', rw3d.rand_direct),
+            ('StepSource3d grid', rwsteps.StepSource3d('grid', seed)),
+            ('StepSource3d direct', rwsteps.StepSource3d('direct', seed))]
+
+def bench_steps(num_steps=num_steps, seed=0, repeat=3):
+    """
+    Returns list of (step function name, steps per second) of conduct_walk
+    for walks of num_steps steps inside a sphere too large to be left,
+    without target and path recording
+    """
+    random.seed(seed)
+    boundary = shapes.Sphere((0.0, 0.0, 0.0), 10.0 * np.sqrt(num_steps))
+    results = []
+    for name, rand_function in step_functions(seed):
+        walk_time = lambda: rw3d.RandomWalk3d((0.0, 0.0, 0.0), num_steps, rand_function,
+                                              boundary, record='none').conduct_walk()
+        results.append((name, 1.0 / time_per_point(walk_time, num_steps, repeat)))
+    if kernel.is_available():
+        for name, rand_function in step_functions(seed)[:2]:
+            walk_time = lambda: kernel.make_walk((0.0, 0.0, 0.0), num_steps * 10, rand_function,
+                                                 boundary, record='none', rng=seed).conduct_walk()
+            results.append((name + ' (kernel)',
+                            1.0 / time_per_point(walk_time, num_steps * 10, repeat)))
+    return results
+
+def bench_contains(num_points=num_points, seed=0):
+    """
+    Returns list of (shape name, scalar time per point, vectorized time
+    per point) for each shape in shape_list
+    """
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-40.0, 40.0, size=(num_points, 3))
+    point_list = [tuple(p) for p in points.tolist()]
+    results = []
+    for shape in shape_list:
+        scalar = time_per_point(lambda: [shape.check_inside(p) for p in point_list],
+                                num_points)
+        vector = time_per_point(lambda: shape.contains(points), num_points)
+        results.append((shape_name(shape), scalar, vector))
+    return results
+
+def bench_sweep(config=SWEEP_CONFIG, workers=1):
+    """
+    Returns wall-clock seconds of running sweep config from scratch (in a
+    temporary directory) and the total number of walks in it
+    """
+    directory = tempfile.mkdtemp(prefix='bench_sweep')
+    try:
+        start = time.perf_counter()
+        rows = sweep.run_sweep(config, os.path.join(directory, 'results.csv'), workers)
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+    return seconds, sum(int(row['num_sim']) for row in rows)
+
+def bench_memory(num_steps=num_steps // 4, seed=0):
+    """
+    Returns list of (record mode, peak bytes) traced while conducting one
+    unconfined walk of num_steps steps and keeping it, for each of
+    RECORD_MODES (steps come from rand_direct, which allocates no blocks)
+    """
+    results = []
+    for record in rw3d.RECORD_MODES:
+        random.seed(seed)
+        tracemalloc.start()
+        walk = rw3d.RandomWalk3d((0.0, 0.0, 0.0), num_steps, rw3d.rand_direct, record=record,
+                                 record_every=100)
+        walk.conduct_walk()
+        if record != 'none':
+            walk.get_walk()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results.append((record, peak))
+    return results
+
+def git_commit():
+    """
+    Returns commit hash of the source tree (None outside a git checkout)
+    """
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+def machine_metadata():
+    """
+    Returns dictionary describing the machine and software the benchmarks ran on
+    """
+    return {'time'     : time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'host'     : platform.node(),
+            'platform' : platform.platform(),
+            'machine'  : platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'kernel'   : kernel.is_available(),
+            'commit'   : git_commit()}
+
+def run_benchmarks(quick=False):
+    """
+    Runs all benchmarks, printing their tables, and returns the results as
+    dictionary with 'metadata' and 'benchmarks'. Every benchmark is a
+    dictionary of value, unit and whether higher values are better.
+    quick=True runs a tenth of the steps and points.
+    """
+    scale = 10 if quick else 1
+    benchmarks = {}
+    def add(name, value, unit, higher_is_better):
+        benchmarks[name] = {'value': value, 'unit': unit,
+                            'higher_is_better': higher_is_better}
+
+    print('conduct_walk throughput (%d steps)' % (num_steps // scale))
+    print('   %-28s %14s' % ('Step function', 'Steps/s'))
+    for name, rate in bench_steps(num_steps // scale):
+        print('   %-28s %14.0f' % (name, rate))
+        add('steps/' + name, rate, 'steps/s', True)
+
+    print('\nContainment check cost per point (%d points)' % (num_points // scale))
+    print('   %-18s %14s %14s %8s' % ('Shape', 'check_inside', 'contains', 'Speedup'))
+    for name, scalar, vector in bench_contains(num_points // scale):
+        print('   %-18s %11.1f ns %11.1f ns %7.1fx' % (name, scalar * 1e9, vector * 1e9,
+                                                     scalar / vector))
+        add('check_inside/' + name, 1.0 / scalar, 'points/s', True)
+        add('contains/' + name, 1.0 / vector, 'points/s', True)
+
+    seconds, walks = bench_sweep()
+    print('\nSmall sphere radius sweep: %d walks in %.2f s' % (walks, seconds))
+    add('sweep/sphere_radius', seconds, 's', False)
+
+    print('\nPeak memory per walk (%d steps)' % (num_steps // 4 // scale))
+    print('   %-18s %14s' % ('Record mode', 'Peak'))
+    for record, peak in bench_memory(num_steps // 4 // scale):
+        print('   %-18s %11.1f kB' % (record, peak / 1024.0))
+        add('memory/' + record, peak, 'bytes', False)
+    return {'metadata': machine_metadata(), 'quick': quick, 'benchmarks': benchmarks}
+
+def compare(baseline, current, tolerance=TOLERANCE):
+    """
+    Compares two results of run_benchmarks. Returns list of (name, baseline
+    value, current value, relative change, regression flag) for benchmarks
+    in both, where the relative change is positive for an improvement and
+    a regression is a loss of more than tolerance.
+    """
+    rows = []
+    for name, base in sorted(baseline['benchmarks'].items()):
+        if name not in current['benchmarks']:
+            continue
+        value = current['benchmarks'][name]['value']
+        if base['higher_is_better']:
+            change = value / base['value'] - 1.0
+        else:
+            change = base['value'] / value - 1.0
+        rows.append((name, base['value'], value, change, change < -tolerance))
+    return rows
+
+def print_comparison(rows, baseline, current):
+    """
+    Prints table of compare() rows, warning if the machines differ
+    """
+    for key in ('platform', 'processor', 'cpu_count', 'python', 'numpy'):
+        if baseline['metadata'].get(key) != current['metadata'].get(key):
+            print('Warning: %s differs (%s vs %s)' % (key, baseline['metadata'].get(key),
+                                                      current['metadata'].get(key)))
+    if baseline.get('quick') != current.get('quick'):
+        print('Warning: comparing a quick run with a full run')
+    print('   %-34s %14s %14s %9s' % ('Benchmark', 'Baseline', 'Current', 'Change'))
+    for name, base, value, change, regression in rows:
+        print('   %-34s %14.4g %14.4g %+8.1f%%%s' % (name, base, value, 100.0 * change,
+                                                   '  REGRESSION' if regression else ''))
+
+def main(argv=None):
+    """
+    Command line entry point: 'run' the benchmarks or 'compare' two results
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks of the 3D random walk modules')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='run the benchmarks')
+    run.add_argument('-o', '--output', help='JSON file to save the results to')
+    run.add_argument('--quick', action='store_true', help='run a tenth of the work')
+    comp = commands.add_parser('compare', help='flag regressions against a baseline')
+    comp.add_argument('baseline')
+    comp.add_argument('current')
+    comp.add_argument('-t', '--tolerance', type=float, default=TOLERANCE,
+                      help='relative slowdown to flag (default: %g)' % TOLERANCE)
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        results = run_benchmarks(args.quick)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=1)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.tolerance)
+    print_comparison(rows, baseline, current)
+    return 1 if any(row[4] for row in rows) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
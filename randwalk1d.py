@@ -0,0 +1,86 @@
+"""
+  Simple 1D random walks (unit steps left or right with equal probability),
+  many walks at once.
+
+  end_positions draws the end points of many walks without walking them:
+  the number of right steps of an n-step walk is binomial(n, 1/2), so the
+  end point is 2*binomial(n, 1/2) - n. With method='steps' the walks are
+  taken step by step from int8 steps (+1/-1), in blocks of walks so the
+  step array stays small. random_paths returns full paths, stored in the
+  smallest integer type that holds them.
+
+  For an n-step walk <x> = 0 and <x**2> = n exactly; check_mean_square
+  compares the simulated <x**2> with n using the exact variance of x**2,
+  2n(n-1).
+"""
+
+import numpy as np
+
+END_METHODS = ('binomial', 'steps')
+BLOCK_BYTES = 1 << 24   # Size of the int8 step blocks of method 'steps'
+
+def random_steps(num_walks, num_steps, rng=None):
+    """
+    Returns (num_walks, num_steps) int8 array of random steps +1/-1
+    """
+    rng = np.random.default_rng(rng)
+    steps = rng.integers(0, 2, size=(num_walks, num_steps), dtype=np.int8)
+    steps *= 2
+    steps -= 1
+    return steps
+
+def path_dtype(num_steps):
+    """
+    Returns smallest signed integer type that holds positions -num_steps
+    to num_steps
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if num_steps <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+def random_paths(num_walks, num_steps, rng=None):
+    """
+    Returns (num_walks, num_steps+1) array of the positions of num_walks
+    walks starting at 0, in the smallest integer type that holds them
+    """
+    dtype = path_dtype(num_steps)
+    paths = np.zeros((num_walks, num_steps + 1), dtype=dtype)
+    np.cumsum(random_steps(num_walks, num_steps, rng), axis=1, dtype=dtype, out=paths[:, 1:])
+    return paths
+
+def random_walk(steps, rng=None):
+    """
+    Returns positions of one 1D random walk with number steps = steps
+    """
+    return random_paths(1, steps, rng)[0]
+
+def end_positions(num_walks, num_steps, rng=None, method='binomial'):
+    """
+    Returns int64 array of the end positions of num_walks walks of
+    num_steps steps starting at 0. method is one of END_METHODS: 'binomial'
+    draws the end points directly, 'steps' sums int8 steps.
+    """
+    rng = np.random.default_rng(rng)
+    if method == 'binomial':
+        return 2 * rng.binomial(num_steps, 0.5, size=num_walks).astype(np.int64) - num_steps
+    if method != 'steps':
+        raise ValueError('method must be one of ' + ', '.join(END_METHODS))
+    end = np.empty(num_walks, dtype=np.int64)
+    block = max(1, BLOCK_BYTES // max(num_steps, 1))
+    for start in range(0, num_walks, block):
+        stop = min(start + block, num_walks)
+        end[start:stop] = random_steps(stop - start, num_steps, rng).sum(axis=1, dtype=np.int64)
+    return end
+
+def check_mean_square(end, num_steps, num_sigma=4.0):
+    """
+    Compares <x**2> of end positions end with the exact value num_steps.
+    Returns (<x**2>, num_steps, standard error, True if they agree within
+    num_sigma standard errors).
+    """
+    end = np.asarray(end, dtype=float)
+    mean_square = float(np.mean(end**2))
+    std_error = float(np.sqrt(2.0 * num_steps * (num_steps - 1) / end.size))
+    return (mean_square, num_steps, std_error,
+            bool(abs(mean_square - num_steps) <= num_sigma * std_error))
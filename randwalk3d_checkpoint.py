@@ -0,0 +1,153 @@
+"""
+  Checkpoints for long random walk campaigns.
+
+  A simulation is split into chunks with fixed random streams (see
+  randwalk3d_montecarlo.chunk_tasks), so the random state of an unfinished
+  simulation is fully described by which chunks are done. ChunkMerger
+  collects the WalkStatistics of finished chunks and merges them strictly in
+  chunk order; chunks that finish early wait until all chunks before them
+  are in. Saving its state and running only the missing chunks after a
+  restart therefore gives exactly the numbers of an uninterrupted run.
+
+  Checkpoints are JSON files written atomically (temporary file, fsync,
+  rename), so a crash while saving leaves the previous checkpoint intact.
+"""
+
+import json
+import os
+import tempfile
+from randwalk3d_stats import WalkStatistics
+
+CHECKPOINT_VERSION = 1
+
+def atomic_write(path, text):
+    """
+    Writes text (str or bytes) to file path so that it holds either the old
+    or the new contents, never a partial write
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path))
+    try:
+        if isinstance(text, bytes):
+            f = os.fdopen(handle, 'wb')
+        else:
+            f = os.fdopen(handle, 'w', newline='')
+        with f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def save_checkpoint(path, state):
+    """
+    Atomically saves checkpoint dictionary state (JSON-compatible values)
+    """
+    state = dict(state, version=CHECKPOINT_VERSION)
+    atomic_write(path, json.dumps(state, indent=1))
+
+def load_checkpoint(path):
+    """
+    Returns checkpoint dictionary saved at path (None if there is none)
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError('Checkpoint %s has unsupported version %r' % (path, state.get('version')))
+    return state
+
+
+class ChunkMerger:
+    """
+    Class to represent the merged statistics of a simulation whose chunks
+    finish in any order
+    """
+
+    def __init__(self, num_chunks, bin_edges=None):
+        """
+        Initializes the ChunkMerger class object:
+            num_chunks : number of chunks in the simulation
+            bin_edges  : histogram bin edges of the chunk statistics
+            next       : index of the first chunk not merged yet
+            stats      : WalkStatistics of chunks 0 .. next-1
+            waiting    : statistics of finished chunks after next, by index
+            cpu_time   : seconds spent on the finished chunks
+        """
+        self._num_chunks = num_chunks
+        self._next       = 0
+        self._stats      = WalkStatistics(bin_edges)
+        self._waiting    = {}
+        self._cpu_time   = 0.0
+
+    def add(self, index, stats, seconds=0.0):
+        """
+        Adds WalkStatistics of finished chunk index, taking seconds of CPU time
+        """
+        if index < self._next or index in self._waiting:
+            raise ValueError('Chunk %d was already added' % index)
+        self._waiting[index] = stats
+        self._cpu_time += seconds
+        while self._next in self._waiting:
+            self._stats.merge(self._waiting.pop(self._next))
+            self._next += 1
+
+    def is_done(self, index=None):
+        """
+        Returns True if chunk index has finished (None => all chunks)
+        """
+        if index is None:
+            return self._next == self._num_chunks
+        return index < self._next or index in self._waiting
+
+    def get_num_merged(self):
+        """
+        Returns number of chunks merged so far (chunks 0 .. n-1)
+        """
+        return self._next
+
+    def get_num_chunks(self):
+        """
+        Returns number of chunks in the simulation
+        """
+        return self._num_chunks
+
+    def get_statistics(self):
+        """
+        Returns WalkStatistics of all chunks merged in order so far
+        """
+        return self._stats
+
+    def get_cpu_time(self):
+        """
+        Returns seconds spent on the finished chunks
+        """
+        return self._cpu_time
+
+    def to_dict(self):
+        """
+        Returns state of the merger as dictionary of plain Python values
+        """
+        return {'num_chunks': self._num_chunks,
+                'next'      : self._next,
+                'stats'     : self._stats.to_dict(),
+                'waiting'   : dict((str(index), stats.to_dict())
+                                   for index, stats in self._waiting.items()),
+                'cpu_time'  : self._cpu_time}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Returns ChunkMerger object with the state given by to_dict()
+        """
+        merger = cls(int(data['num_chunks']))
+        merger._next     = int(data['next'])
+        merger._stats    = WalkStatistics.from_dict(data['stats'])
+        merger._waiting  = dict((int(index), WalkStatistics.from_dict(stats))
+                                for index, stats in data['waiting'].items())
+        merger._cpu_time = float(data['cpu_time'])
+        return merger
@@ -9,13 +9,26 @@
 
   Possible boundary and target shapes are described in the 
   shapes_class.py module   
+
+  The path of a walk can be recorded in full, every k-th step, by its end
+  points only, or not at all (see RECORD_MODES), so that long statistics
+  runs do not have to keep every step in memory.
+
+  With unit steps, a walk skips the target test while the target's bounding
+  sphere is further away than the steps left to cover (target_skip), so the
+  full check_inside of the target only runs near the target. The skip is
+  exact: no trial step that could land inside the target is skipped.
 """
 
+import math
 import random
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 random.seed(None)        # Seed generator, None => system clock
 
+RECORD_MODES = ('none', 'endpoints', 'every_k', 'full')
+SKIP_MARGIN  = 1e-6     # Slack for rounding in target_skip distances
+
 def rand_grid():
     """  
     Performs unit 3D random step on an (x,y) grid 
@@ -34,6 +47,123 @@ def rand_direct():
     x,y,z = x/norm_factor, y/norm_factor, z/norm_factor
     return x, y, z
 
+def is_unit_step(rand_function):
+    """
+    Returns True if rand_function is known to return steps of length one
+    (rand_grid, rand_direct or a StepSource3d)
+    """
+    return rand_function in (rand_grid, rand_direct) or hasattr(rand_function, 'next_block')
+
+def target_skip(target, point, move_target=False):
+    """
+    Returns number of unit trial steps after a trial step to point which
+    cannot land inside target, from the distance to the bounding sphere of
+    target (or the point_clearance of a TargetSet3d), or -1 if point itself
+    may be inside target. A moving target steps too, closing the gap by up
+    to two per step.
+    """
+    if hasattr(target, 'point_clearance'):
+        gap = target.point_clearance(point) - SKIP_MARGIN
+    else:
+        (xc, yc, zc), radius = target.get_bounding_sphere()
+        x, y, z = point
+        gap = math.sqrt((x - xc)**2 + (y - yc)**2 + (z - zc)**2) - radius - SKIP_MARGIN
+    if gap <= 0.0:
+        return -1
+    # The walker may stay put, so later trials start up to one step nearer
+    gap = 0.5 * (gap - 1.0) if move_target else gap - 1.0
+    return max(int(math.ceil(gap)) - 1, 0)
+
+class PathBuffer:
+    """
+    Growable float64 array of (x,y,z) points for recording walk paths.
+    Points are staged in a short list and copied into the array in blocks,
+    which keeps the cost per step low and the memory at 24 bytes per point.
+    """
+
+    def __init__(self, start_loc, every=1, block_size=4096):
+        """
+        Initializes the PathBuffer class object:
+            start_loc : first point of the path
+            every     : append() stores only every 'every'-th point
+            block_size: number of staged points copied into the array at once
+        """
+        self._every      = every
+        self._block_size = block_size
+        self._points     = np.empty((block_size, 3))
+        self._size       = 0
+        self._staged     = []
+        self._count      = 0
+        self._skipped    = False
+        self.store(start_loc)
+
+    def store(self, point):
+        """
+        Stores point at end of path
+        """
+        self._staged.append(point)
+        self._skipped = False
+        if len(self._staged) >= self._block_size:
+            self._flush()
+
+    def append(self, point):
+        """
+        Records next step of walk, storing it if it is an 'every'-th step
+        """
+        self._count += 1
+        if self._count % self._every:
+            self._skipped = True
+        else:
+            self.store(point)
+
+    def extend(self, points, num_steps):
+        """
+        Records a block of num_steps steps of which points, (n,3) array, are
+        the every 'every'-th ones already picked out by the caller
+        """
+        if len(points):
+            if self._staged:
+                self._flush()
+            self._copy(points)
+            self._skipped = False
+        if num_steps:
+            self._count += num_steps
+            self._skipped = self._count % self._every != 0
+
+    def finish(self, point):
+        """
+        Stores final point of walk if it was skipped by append()
+        """
+        if self._skipped:
+            self.store(point)
+
+    def _flush(self):
+        """
+        Copies staged points into the array
+        """
+        self._copy(self._staged)
+        self._staged = []
+
+    def _copy(self, points):
+        """
+        Copies points to end of the array, growing it when full
+        """
+        num = len(points)
+        if self._size + num > len(self._points):
+            capacity = max(2 * len(self._points), self._size + num)
+            self._points = np.resize(self._points, (capacity, 3))
+        self._points[self._size:self._size + num] = points
+        self._size  += num
+
+    def get_points(self):
+        """
+        Returns (n,3) array of recorded points
+        """
+        if self._staged:
+            self._flush()
+        return self._points[:self._size]
+
+
 class RandomWalk3d:
     """
     Class to represent a 3D random walk.
@@ -41,7 +171,8 @@ class RandomWalk3d:
     walk is the sequence of random steps taken by walker
     """
     
-    def __init__(self,start_loc, max_steps, rand_function, boundary= None,target = None, move_target=False ):
+    def __init__(self,start_loc, max_steps, rand_function, boundary= None,target = None, move_target=False,
+                 record='full', record_every=1):
         """
         Initializes the RandomWalk3d class object:
             start_loc: starting location for walk
@@ -53,7 +184,13 @@ class RandomWalk3d:
                   used for the walk (e.g walk is unconfined or has no target)
             move_target: False means target will remain at initial location during
                          walk, True means target will move randomly inside boundary 
-            walk       : list which records step of random walk 
+            record     : how the path is recorded, one of RECORD_MODES:
+                         'full' every step, 'every_k' every record_every-th step
+                         (plus the end point), 'endpoints' start and end only,
+                         'none' no path (counters only)
+            walk       : PathBuffer which records steps of random walk 
+                         (None when record is 'none')
+            end_loc    : final location of walker
             num_steps  : number of steps required to reach target
             target_hit : True if target is reached during walk before maximum 
                          steps exceeded; False otherwise        
@@ -64,8 +201,18 @@ class RandomWalk3d:
         self._boundary    = boundary
         self._target      = target
         self._move_target = move_target
-        self._walk        = []
-        self._walk.append(start_loc)
+        if record not in RECORD_MODES:
+            raise ValueError('record must be one of ' + ', '.join(RECORD_MODES))
+        self._record      = record
+        if record == 'none':
+            self._walk    = None
+        elif record == 'every_k':
+            self._walk    = PathBuffer(start_loc, record_every)
+        elif record == 'endpoints':
+            self._walk    = PathBuffer(start_loc, block_size=2)
+        else:
+            self._walk    = PathBuffer(start_loc)
+        self._end_loc     = start_loc
         self._num_steps = 0 
         self._target_hit  = False 
  
@@ -102,69 +249,168 @@ class RandomWalk3d:
         """
         return self._target_hit
 
+    def get_target_index(self):
+        """
+        Returns number of the target that absorbed the walk when the target
+        is a TargetSet3d (randwalk3d_targets.py), 0 for other targets, -1 if
+        the target was not reached
+        """
+        if not self._target_hit:
+            return -1
+        if hasattr(self._target, 'find_point'):
+            return self._target.find_point(self._end_loc)
+        return 0
+
+    def get_record(self):
+        """
+        Returns path recording mode of the walk
+        """
+        return self._record
+
+    def get_end_loc(self):
+        """
+        Returns final location (x,y,z) of completed walk
+        """
+        return self._end_loc
+
     def get_walk(self):
         """
-        Returns list of all steps for completed walk, (x,y) tuple is recorded 
-        for each step taken.
+        Returns (n,3) array of recorded steps for completed walk, one (x,y,z)
+        row for each step recorded.
         """ 
-        return self._walk
+        if self._walk is None:
+            raise ValueError("Walk path is not recorded with record='none'")
+        return self._walk.get_points()
 
-    def conduct_walk(self):
+    def conduct_walk(self, profile=None):
         """  
         Performs a random walk inside a boundary with target. 
         Walk proceeds until target is reached or max steps is exceeded 
+        profile: WalkProfile (randwalk3d_profile.py) to count events and time
+                 the phases of sampled steps in, None for no instrumentation
         """
-            
+        if profile is not None:
+            started = time.perf_counter()
         xpos,ypos,zpos = self._start_loc
+        record = self._walk.append if self._record in ('full', 'every_k') else None
+        unit_steps = is_unit_step(self._rand)
+        skip = 0        # Trial steps left that cannot reach target
+        trials = tests = moved = 0      # Event counts for profile
+        timer = None    # PhaseTimer of a sampled step
         while self._num_steps < self._max_steps :
+            if profile is not None:
+                timer = profile.timer()
+            trials += 1
             # Create trial move
             xdelta, ydelta, zdelta = self._rand()
             xtrial = xpos + xdelta
             ytrial = ypos + ydelta
             ztrial = zpos + zdelta
+            if timer: timer.lap('rng')
             #  If target exists, check if target reached. if so, end walk
             if self._target:
-                inside_target = self._target.check_inside((xtrial, ytrial,ztrial))
+                #  Skip the test while target is out of reach of the walker
+                if skip > 0:
+                    skip -= 1
+                    inside_target = False
+                else:
+                    skip = target_skip(self._target, (xtrial, ytrial,ztrial),
+                                       self._move_target) if unit_steps else -1
+                    tests += skip < 0
+                    inside_target = skip < 0 and self._target.check_inside((xtrial, ytrial,ztrial))
+                if timer: timer.lap('target')
                 if inside_target:
                     xpos = xtrial
                     ypos = ytrial
                     zpos = ztrial
-                    self._walk.append((xpos,ypos,zpos))
+                    if record: record((xpos,ypos,zpos))
+                    if timer: timer.lap('record')
                     self._num_steps += 1
                     self._target_hit = True 
+                    self._finish_walk((xpos,ypos,zpos))
+                    if profile is not None:
+                        self._count_events(profile, trials, tests, moved, started)
                     return
                 elif self._move_target:
+                    location = self._target.get_location()
                     self._target.move_random(self._rand,self._boundary)
+                    moved += self._target.get_location() != location
+                    if timer: timer.lap('move')
 
           
             # Check if still inside boundary. If so, accept move and continue 
             if self._boundary:
                 inside_boundary = self._boundary.check_inside((xtrial, ytrial,ztrial))
+                if timer: timer.lap('boundary')
                 if inside_boundary:
                     xpos = xtrial
                     ypos = ytrial
                     zpos = ztrial
-                    self._walk.append((xpos,ypos,zpos))
+                    if record: record((xpos,ypos,zpos))
+                    if timer: timer.lap('record')
                     self._num_steps += 1
             else:   #  No boundary exists, carry on with walk
                 xpos = xtrial
                 ypos = ytrial
                 zpos = ztrial
-                self._walk.append((xpos,ypos,zpos))
+                if record: record((xpos,ypos,zpos))
+                if timer: timer.lap('record')
                 self._num_steps += 1           
             #  Max number of steps reached, without hitting target
         self._target_hit = False 
+        self._finish_walk((xpos,ypos,zpos))
+        if profile is not None:
+            self._count_events(profile, trials, tests, moved, started)
         return   
+
+    def _count_events(self, profile, trials, tests, moved, started):
+        """
+        Adds the events of the finished walk to WalkProfile profile, from its
+        trial steps, target tests and target moves, and the walk time since
+        perf_counter reading started
+        """
+        hit = int(self._target_hit)
+        checks = trials if self._target else 0
+        profile.count('walks')
+        profile.count('trial_steps', trials)
+        profile.count('accepted_steps', self._num_steps)
+        profile.count('target_checks', checks)
+        profile.count('target_tests', tests)
+        profile.count('target_skips', checks - tests)
+        profile.count('target_hits', hit)
+        profile.count('move_tests', (trials - hit) if self._target and self._move_target else 0)
+        profile.count('target_moves', moved)
+        profile.count('boundary_tests', (trials - hit) if self._boundary else 0)
+        profile.count('boundary_rejections', (trials - self._num_steps) if self._boundary else 0)
+        profile.count('recorded_points',
+                      self._num_steps if self._record in ('full', 'every_k') else 0)
+        profile.add_walk_time(time.perf_counter() - started)
+
+    def _finish_walk(self, end_loc):
+        """
+        Records final location of walk in the path, if not already recorded
+        """
+        self._end_loc = end_loc
+        if self._record == 'every_k':
+            self._walk.finish(end_loc)
+        elif self._record == 'endpoints' and self._num_steps:
+            self._walk.store(end_loc)
         
 
-    def plot_walk(self, ax, line_type='r-',walk_num = 1, end_symbol='k*', end_size=10):
+    def plot_walk(self, ax, line_type='r-',walk_num = 1, end_symbol='k*', end_size=10,
+                  max_points=None):
         """
         Plots the completed random walk on 2D graph using matplotlib objects 
+        max_points: downsample long paths to this many points (see randwalk3d_plot)
         """
         
-        xwalk = zip(*self._walk)[0]
-        ywalk = zip(*self._walk)[1]
-        zwalk = zip(*self._walk)[2]
+        walk  = self.get_walk()
+        if max_points is not None:
+            from randwalk3d_plot import downsample
+            walk = downsample(walk, max_points)
+        xwalk = walk[:,0]
+        ywalk = walk[:,1]
+        zwalk = walk[:,2]
         ax.plot(xwalk, ywalk,zwalk, line_type, label='rw'+str(walk_num)+' '+      \
                 str(self._num_steps))
         # Large symbol ('k*') to mark end of walk       
@@ -0,0 +1,342 @@
+"""
+  Module describes a class (RandomWalkEnsemble3d) that conducts many 3D
+  random walks at once. Positions of all walkers are held in (N,3) NumPy
+  arrays and every walker still in play is advanced on each step, so the
+  per-step cost is paid once per ensemble instead of once per walker.
+
+  Walk rules are the same as RandomWalk3d.conduct_walk in randwalk3d_class.py:
+  a trial step that lands inside the target ends the walk, otherwise the
+  step is accepted only if it stays inside the boundary. As there, walkers
+  only test the target once its bounding sphere is within reach (for
+  targets other than spheres, while many walkers are active). Walkers are removed
+  from the active set as soon as they hit the target or use up max_steps.
+
+  With move_target=True every walker has its own copy of the target, held
+  as an (N,3) array of target positions. As in RandomWalk3d, a walker's
+  target makes one random step after every trial move that misses it, and
+  the target step is rejected if the new target location is outside the
+  boundary. Walkers are tested against the original target shifted by their
+  target's displacement, so any shape with 'contains' can move.
+
+  Grid walks (rand_grid) from an integer start can run on a rasterized
+  lattice domain (randwalk3d_lattice.py) with lattice=True, which turns the
+  boundary and target tests into array lookups.
+
+  With a TargetSet3d target (randwalk3d_targets.py) of many traps, each
+  batch of walkers is tested only against the traps near it, and
+  get_target_index tells which trap absorbed each walker.
+
+  An off-lattice ensemble can be instrumented with a WalkProfile
+  (randwalk3d_profile.py), which counts the tests and moves and times the
+  phases of every sample_every-th ensemble step.
+"""
+
+import time
+import numpy as np
+import shapes3d_class as shapes
+import randwalk3d_class as rw3d
+import randwalk3d_lattice as rwlat
+import randwalk3d_steps as rwsteps
+
+SCALAR_WALKERS = 32     # Lattice walkers left when the ensemble goes scalar
+SKIP_WALKERS   = 256    # Active walkers below which targets are tested directly
+
+def contains(shape, points):
+    """
+    Returns boolean array telling which of the (N,3) points are inside shape.
+    Shapes without a vectorized 'contains' are checked point by point.
+    """
+    if hasattr(shape, 'contains'):
+        return shape.contains(points)
+    return np.array([shape.check_inside(tuple(p)) for p in points], dtype=bool)
+
+
+class RandomWalkEnsemble3d:
+    """
+    Class to represent an ensemble of independent 3D random walks which share
+    the same start, boundary and target. Results are recorded per walker.
+    """
+
+    def __init__(self, start_loc, max_steps, num_walkers, rand_function,
+                 boundary=None, target=None, rng=None, lattice=False, move_target=False,
+                 profile=None):
+        """
+        Initializes the RandomWalkEnsemble3d class object:
+            start_loc  : starting location (x,y,z) shared by all walkers
+            max_steps  : maximum number of steps that each walk will take
+            num_walkers: number of walkers in the ensemble
+            rand_function: rand_grid or rand_direct from randwalk3d_class, or
+                         a StepSource3d (randwalk3d_steps.py)
+            boundary   : shape object describing the confining boundary
+            target     : shape object describing target for walks
+            rng        : numpy.random.Generator (or seed) used for the steps
+                         (a StepSource3d rand_function draws from its own
+                         generator only when rng is None)
+            lattice    : True to walk on the cached lattice domain of boundary
+                         and target (needs rand_grid, a boundary and an
+                         integer start_loc)
+            move_target: True if target moves randomly after every miss
+                         (needs a boundary, not available on the lattice)
+            profile    : WalkProfile (randwalk3d_profile.py) to count events
+                         and time phases in, None for no instrumentation
+                         (not available on the lattice)
+            Note: boundary = None or target = None means boundary/target will
+                  not be used for the walks, as for RandomWalk3d
+            num_steps  : array with number of steps taken by each walker
+            target_hit : boolean array, True where walker reached target
+            end_loc    : (N,3) array with final position of each walker
+            target_loc : (N,3) array with final target location of each walker
+            target_index: array with number of the target of a TargetSet3d
+                         that each walker hit
+        """
+        self._start_loc   = start_loc
+        self._max_steps   = max_steps
+        self._num_walkers = num_walkers
+        self._source      = rwsteps.step_source(rand_function, rng)
+        self._boundary    = boundary
+        self._target      = target
+        self._move_target = bool(move_target and target)
+        self._lattice     = None
+        self._profile     = profile
+        if self._move_target and not boundary:
+            raise ValueError('Moving targets need a boundary')
+        if lattice and self._move_target:
+            raise ValueError('Lattice walks cannot move the target')
+        if lattice and profile is not None:
+            raise ValueError('Lattice walks cannot be profiled')
+        if lattice:
+            if self._source.get_kind() != 'grid':
+                raise ValueError('Lattice walks need rand_grid steps')
+            self._lattice = rwlat.get_lattice(boundary, target)
+            # Rejects non-integer starts and starts in the padding of the grid
+            if not self._lattice.inside_boundary(start_loc):
+                raise ValueError('Start location lies outside the boundary')
+        self._num_steps   = np.zeros(num_walkers, dtype=np.int64)
+        self._target_hit  = np.zeros(num_walkers, dtype=bool)
+        self._end_loc     = np.tile(np.asarray(start_loc, dtype=float), (num_walkers, 1))
+        self._target_index = np.full(num_walkers, -1, dtype=np.int64)
+        self._target_loc  = None
+        if target:
+            self._target_loc = np.tile(np.asarray(target.get_location(), dtype=float),
+                                       (num_walkers, 1))
+
+    def get_start(self):
+        """
+        Returns starting point of the walks
+        """
+        return self._start_loc
+
+    def get_max_steps(self):
+        """
+        Returns maximum number of steps in each walk
+        """
+        return self._max_steps
+
+    def get_num_walkers(self):
+        """
+        Returns number of walkers in the ensemble
+        """
+        return self._num_walkers
+
+    def get_num_steps(self):
+        """
+        Returns array with number of steps taken by each walker
+        """
+        return self._num_steps
+
+    def get_target_hit(self):
+        """
+        Returns boolean array, True for walkers that reached the target
+        """
+        return self._target_hit
+
+    def get_target_index(self):
+        """
+        Returns array with number of the target that absorbed each walker
+        when the target is a TargetSet3d, 0 for other targets, -1 for
+        walkers that did not reach the target
+        """
+        return np.where(self._target_hit, np.maximum(self._target_index, 0), -1)
+
+    def get_end_locations(self):
+        """
+        Returns (N,3) array with final position of each walker
+        """
+        return self._end_loc
+
+    def get_target_locations(self):
+        """
+        Returns (N,3) array with final target location of each walker (None
+        without target). Targets only differ from the start when they move.
+        """
+        return self._target_loc
+
+    def conduct_walks(self):
+        """
+        Performs all random walks of the ensemble. Each step advances every
+        active walker; walkers leave the active set when they hit the target
+        or reach max_steps.
+        """
+        if self._lattice is not None:
+            self._conduct_lattice_walks()
+            return
+        # Work on compact copies of the active walkers, write back on exit
+        index = np.arange(self._num_walkers)
+        pos   = self._end_loc.copy()
+        steps = self._num_steps.copy()
+        if self._move_target:
+            # Displacement of each walker's target from the target shape
+            base  = np.asarray(self._target.get_location(), dtype=float)
+            shift = self._target_loc - base
+        # A sphere is its own bounding sphere: the skip would repeat its test
+        skip = self._target and not isinstance(self._target, shapes.Sphere)
+        if skip:
+            # Trial steps left before each walker could reach the target
+            safe = np.zeros(index.size, dtype=np.int64)
+            center, radius = self._target.get_bounding_sphere()
+            center = np.asarray(center, dtype=float)
+        profile = self._profile
+        timer   = None          # PhaseTimer of a sampled ensemble step
+        if profile is not None:
+            started = time.perf_counter()
+        done  = steps >= self._max_steps
+        while index.size:
+            if done.any():
+                keep = ~done
+                self._end_loc[index[done]]   = pos[done]
+                self._num_steps[index[done]] = steps[done]
+                if self._move_target:
+                    self._target_loc[index[done]] = base + shift[done]
+                    shift = shift[keep]
+                if skip:
+                    safe = safe[keep]
+                index, pos, steps = index[keep], pos[keep], steps[keep]
+                if not index.size:
+                    break
+            if profile is not None:
+                profile.count('trial_steps', index.size)
+                timer = profile.timer(index.size)
+            # Create trial moves for all active walkers
+            trial = pos + self._source.next_block(index.size)
+            if timer: timer.lap('rng')
+            accept = np.ones(index.size, dtype=bool)
+            done = np.zeros(index.size, dtype=bool)
+            #  Walkers whose trial move lands inside target end their walk
+            if self._target:
+                # Few walkers left: the skip bookkeeping costs more than it saves
+                skip = skip and index.size >= SKIP_WALKERS
+                if skip:
+                    #  Only walkers within reach of their target are tested
+                    safe -= 1
+                    test = np.flatnonzero(safe < 0)
+                    if test.size:
+                        safe[test] = self._target_skip(trial[test], center, radius,
+                                                       shift[test] if self._move_target else None)
+                        test = test[safe[test] < 0]
+                else:
+                    test = slice(None)
+                hit = np.zeros(index.size, dtype=bool)
+                points = trial[test] - shift[test] if self._move_target else trial[test]
+                if hasattr(self._target, 'find'):
+                    # Target sets tell which of their targets was hit
+                    found = self._target.find(points)
+                    hit[test] = found >= 0
+                    self._target_index[index[test][found >= 0]] = found[found >= 0]
+                else:
+                    hit[test] = contains(self._target, points)
+                if hit.any():
+                    self._target_hit[index[hit]] = True
+                    done |= hit
+                if timer: timer.lap('target')
+                if profile is not None:
+                    tested = index.size if isinstance(test, slice) else test.size
+                    profile.count('target_checks', index.size)
+                    profile.count('target_tests', tested)
+                    profile.count('target_skips', index.size - tested)
+                    profile.count('target_hits', np.count_nonzero(hit))
+                if self._move_target:
+                    # Targets that were missed try a random move in boundary
+                    miss = np.flatnonzero(~hit)
+                    moved = shift[miss] + self._source.next_block(miss.size)
+                    inside = contains(self._boundary, base + moved)
+                    shift[miss[inside]] = moved[inside]
+                    if timer: timer.lap('move', miss.size)
+                    if profile is not None:
+                        profile.count('move_tests', miss.size)
+                        profile.count('target_moves', np.count_nonzero(inside))
+            # Check if still inside boundary. If so, accept move
+            if self._boundary:
+                accept = contains(self._boundary, trial)
+                if profile is not None:
+                    profile.count('boundary_tests', index.size - np.count_nonzero(done))
+                    profile.count('boundary_rejections', np.count_nonzero(~accept & ~done))
+                accept |= done
+                if timer: timer.lap('boundary')
+            pos[accept] = trial[accept]
+            steps += accept
+            done |= steps >= self._max_steps
+            if profile is not None:
+                profile.count('accepted_steps', np.count_nonzero(accept))
+        if profile is not None:
+            profile.count('walks', self._num_walkers)
+            profile.add_walk_time(time.perf_counter() - started)
+        return
+
+    def _target_skip(self, trial, center, radius, shift=None):
+        """
+        Returns number of unit trial steps after trial steps to each of the
+        (N,3) points trial which cannot land inside a target with bounding
+        sphere (center, radius) moved by shift (or from the clearance of a
+        TargetSet3d), or -1 where the point itself may be inside the target,
+        as target_skip in randwalk3d_class.py
+        """
+        if shift is not None:
+            trial = trial - shift
+        if hasattr(self._target, 'clearance'):
+            gap = self._target.clearance(trial) - rw3d.SKIP_MARGIN
+        else:
+            delta = trial - center
+            gap = np.sqrt(np.einsum('ij,ij->i', delta, delta)) - radius - rw3d.SKIP_MARGIN
+        reach = 0.5 * (gap - 1.0) if self._move_target else gap - 1.0
+        return np.where(gap > 0.0, np.maximum(np.ceil(reach).astype(np.int64) - 1, 0), -1)
+
+    def _conduct_lattice_walks(self):
+        """
+        Performs all random walks as index lookups on the lattice domain
+        """
+        flags   = self._lattice.get_flags()
+        offsets = self._lattice.get_offsets()
+        index = np.arange(self._num_walkers)
+        cell  = np.full(self._num_walkers, self._lattice.index(self._start_loc))
+        steps = self._num_steps.copy()
+        done  = steps >= self._max_steps
+        final = cell.copy()
+        while index.size:
+            if done.any():
+                keep = ~done
+                final[index[done]] = cell[done]
+                self._num_steps[index[done]] = steps[done]
+                index, cell, steps = index[keep], cell[keep], steps[keep]
+                if not index.size:
+                    break
+            if index.size <= SCALAR_WALKERS:
+                # Few walkers left: per-step array overhead no longer pays off
+                for num in range(index.size):
+                    final[index[num]], self._num_steps[index[num]], self._target_hit[index[num]] = \
+                        self._lattice.walk_cell(int(cell[num]), int(steps[num]),
+                                                self._max_steps, self._source)
+                break
+            trial  = cell + offsets[self._source.next_indices(index.size)]
+            flag   = flags[trial]
+            hit    = (flag & rwlat.INSIDE_TARGET) > 0
+            accept = (flag & rwlat.INSIDE_BOUNDARY) > 0
+            if hit.any():
+                self._target_hit[index[hit]] = True
+                accept |= hit
+            cell   = np.where(accept, trial, cell)
+            steps += accept
+            done   = hit | (steps >= self._max_steps)
+        self._end_loc = self._lattice.position(final).astype(float)
+        if hasattr(self._target, 'find'):
+            self._target_index[self._target_hit] = self._target.find(self._end_loc[self._target_hit])
+        return
@@ -0,0 +1,99 @@
+"""
+  Exact expected number of steps to target for grid random walks (rand_grid)
+  inside a boundary, from a sparse linear solve on the lattice.
+
+  A grid walker at lattice point x picks one of the six unit steps. If the
+  trial point is inside the target the walk ends after one more step; if it
+  is inside the boundary the step is taken; otherwise the step is rejected
+  and, as in RandomWalk3d.conduct_walk, not counted. The expected number of
+  steps T(x) to reach the target therefore satisfies
+
+        (6 - k) T(x) - sum of T(y) over neighbors y inside boundary = 6 - k
+
+  where k is the number of rejected steps from x. This is a symmetric
+  positive definite system (a graph Laplacian with target cells as absorbing
+  sinks) solved with conjugate gradients. Its solution is the mean that the
+  Monte Carlo drivers estimate, without the max_steps cutoff, and serves as
+  ground truth for the simulation engines.
+"""
+
+import inspect
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from scipy.sparse.csgraph import connected_components
+import randwalk3d_lattice as rwlat
+
+#  Keyword of the cg tolerance (SciPy before 1.12 names it tol)
+CG_TOL = 'rtol' if 'rtol' in inspect.signature(spla.cg).parameters else 'tol'
+
+def hitting_time_field(boundary, target, tol=1e-10):
+    """
+    Returns (domain, times): the LatticeDomain3d of boundary and target and
+    a flat array with the expected steps to target from each of its cells
+    (nan outside the walk region, inf where the target cannot be reached)
+    """
+    domain  = rwlat.get_lattice(boundary, target)
+    flags   = domain.get_flags()
+    offsets = domain.get_offsets()
+    # Walk region: cells inside the boundary and not inside the target
+    region = (flags & rwlat.INSIDE_BOUNDARY > 0) & (flags & rwlat.INSIDE_TARGET == 0)
+    cells  = np.flatnonzero(region)
+    node   = np.full(flags.size, -1, dtype=np.int64)
+    node[cells] = np.arange(cells.size)
+    moves     = np.zeros(cells.size)
+    to_target = np.zeros(cells.size, dtype=bool)
+    rows, cols = [], []
+    for offset in offsets:
+        neighbor = cells + offset
+        flag = flags[neighbor]
+        hit  = flag & rwlat.INSIDE_TARGET > 0
+        step = region[neighbor]
+        moves     += hit | step
+        to_target |= hit
+        rows.append(np.flatnonzero(step))
+        cols.append(node[neighbor[step]])
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    adjacency = sp.csr_matrix((np.ones(rows.size), (rows, cols)), shape=(cells.size,) * 2)
+    # Only cells connected to a cell next to the target have finite times
+    num_parts, part = connected_components(adjacency, directed=False)
+    solvable = np.isin(part, np.unique(part[to_target]))
+    keep = np.flatnonzero(solvable)
+    matrix = (sp.diags(moves) - adjacency)[keep][:, keep].tocsr()
+    rhs    = moves[keep]
+    solution = np.full(cells.size, np.inf)
+    if keep.size:
+        precond = sp.diags(1.0 / matrix.diagonal())
+        values, info = spla.cg(matrix, rhs, maxiter=20 * keep.size, M=precond,
+                               **{CG_TOL: tol})
+        if info != 0:
+            values = spla.spsolve(matrix.tocsc(), rhs)
+        solution[keep] = values
+    times = np.full(flags.size, np.nan)
+    times[cells] = solution
+    return domain, times
+
+def solve_expected_hitting_time(boundary, target, start, tol=1e-10):
+    """
+    Returns expected number of rand_grid steps for a walk starting at integer
+    point start to reach target inside boundary (inf if it never can)
+    """
+    domain, times = hitting_time_field(boundary, target, tol)
+    if not domain.inside_boundary(start):
+        raise ValueError('Start location lies outside the boundary')
+    cell = int(domain.index(start))
+    if not np.isnan(times[cell]):
+        return float(times[cell])
+    # Start outside the walk region (e.g. inside target): one step further
+    flags = domain.get_flags()
+    moves, total = 0, 0.0
+    for offset in domain.get_offsets():
+        neighbor = cell + offset
+        if flags[neighbor] & rwlat.INSIDE_TARGET:
+            moves += 1
+        elif flags[neighbor] & rwlat.INSIDE_BOUNDARY:
+            moves += 1
+            total += times[neighbor]
+    if moves == 0:
+        return np.inf
+    return 1.0 + total / moves
@@ -0,0 +1,158 @@
+/*
+ *  Compiled single-walker loop for randwalk3d_kernel.py.
+ *
+ *  Runs RandomWalk3d.conduct_walk for a boundary and target that are each
+ *  a quadric (sphere or ellipsoid) or a box, given by center and 3x3 form
+ *  matrix F: with q = (p - center) @ F, p is inside a quadric if |q|^2 < 1
+ *  and inside a box if |q_j| < 1 for every j. Random steps come from a
+ *  xoshiro256** generator seeded by the caller.
+ *
+ *  The walk can be suspended: walk3d returns WALK_PATH_FULL when the path
+ *  buffer is full and continues from the state arrays on the next call.
+ */
+
+#include <math.h>
+#include <stdint.h>
+
+#define SHAPE_NONE      0
+#define SHAPE_QUADRIC   1
+#define SHAPE_BOX       2
+
+#define STEP_GRID       0
+#define STEP_DIRECT     1
+
+#define WALK_MISSED     0
+#define WALK_HIT        1
+#define WALK_PATH_FULL  2
+
+static const double grid_steps[6][3] = {{1, 0, 0}, {-1, 0, 0}, {0, 1, 0},
+                                        {0, -1, 0}, {0, 0, 1}, {0, 0, -1}};
+
+static inline uint64_t rotl(uint64_t x, int k)
+{
+    return (x << k) | (x >> (64 - k));
+}
+
+/* xoshiro256** by Blackman and Vigna */
+static inline uint64_t next_random(uint64_t *s)
+{
+    uint64_t result = rotl(s[1] * 5, 7) * 9;
+    uint64_t t = s[1] << 17;
+    s[2] ^= s[0];
+    s[3] ^= s[1];
+    s[1] ^= s[2];
+    s[0] ^= s[3];
+    s[2] ^= t;
+    s[3] = rotl(s[3], 45);
+    return result;
+}
+
+static inline double next_uniform(uint64_t *s)
+{
+    return (next_random(s) >> 11) * 0x1.0p-53;
+}
+
+/* Unit step on the grid (as rand_grid) or in a uniform random direction */
+static inline void random_step(uint64_t *s, int kind, double *step)
+{
+    if (kind == STEP_GRID) {
+        uint64_t k;
+        do {
+            k = next_random(s) >> 61;       /* 0..7, keep 0..5 */
+        } while (k >= 6);
+        step[0] = grid_steps[k][0];
+        step[1] = grid_steps[k][1];
+        step[2] = grid_steps[k][2];
+    } else {
+        double z = 2.0 * next_uniform(s) - 1.0;
+        double phi = 2.0 * M_PI * next_uniform(s);
+        double r = sqrt(1.0 - z * z);
+        step[0] = r * cos(phi);
+        step[1] = r * sin(phi);
+        step[2] = z;
+    }
+}
+
+static inline int inside(int kind, const double *center, const double *form,
+                         double x, double y, double z)
+{
+    double dx = x - center[0], dy = y - center[1], dz = z - center[2];
+    double u = dx * form[0] + dy * form[3] + dz * form[6];
+    double v = dx * form[1] + dy * form[4] + dz * form[7];
+    double w = dx * form[2] + dy * form[5] + dz * form[8];
+    if (kind == SHAPE_QUADRIC)
+        return u * u + v * v + w * w < 1.0;
+    return fabs(u) < 1.0 && fabs(v) < 1.0 && fabs(w) < 1.0;
+}
+
+/*
+ *  pos[3]      walker position (in/out)
+ *  tpos[3]     target center (in/out, changes if the target moves)
+ *  counts[3]   number of steps, max steps, accepted steps seen by the path
+ *              recorder (in/out)
+ *  rng[4]      generator state (in/out)
+ *  kinds[4]    step kind, boundary kind, target kind, move target flag
+ *  bshape[12]  boundary center and form (row-major)
+ *  tform[9]    target form (row-major)
+ *  path        buffer for recorded points, every 'every'-th accepted step
+ *              (every = 0: no recording)
+ *  path_len    number of points in path (in/out), at most path_cap
+ */
+int walk3d(double *pos, double *tpos, int64_t *counts, uint64_t *rng, const int *kinds,
+           const double *bshape, const double *tform, double *path, int64_t path_cap,
+           int64_t every, int64_t *path_len)
+{
+    int step_kind = kinds[0], boundary = kinds[1], target = kinds[2], move_target = kinds[3];
+    double x = pos[0], y = pos[1], z = pos[2];
+    int64_t num_steps = counts[0], max_steps = counts[1], seen = counts[2];
+    int64_t len = *path_len;
+    int status = WALK_MISSED;
+    double step[3];
+
+    while (num_steps < max_steps) {
+        if (every && len == path_cap) {
+            status = WALK_PATH_FULL;
+            break;
+        }
+        random_step(rng, step_kind, step);
+        double xt = x + step[0], yt = y + step[1], zt = z + step[2];
+        int accept;
+        if (target && inside(target, tpos, tform, xt, yt, zt)) {
+            status = WALK_HIT;
+            accept = 1;
+        } else {
+            if (move_target) {
+                double move[3];
+                random_step(rng, step_kind, move);
+                double xm = tpos[0] + move[0], ym = tpos[1] + move[1], zm = tpos[2] + move[2];
+                if (inside(boundary, bshape, bshape + 3, xm, ym, zm)) {
+                    tpos[0] = xm;
+                    tpos[1] = ym;
+                    tpos[2] = zm;
+                }
+            }
+            accept = !boundary || inside(boundary, bshape, bshape + 3, xt, yt, zt);
+        }
+        if (accept) {
+            x = xt;
+            y = yt;
+            z = zt;
+            num_steps++;
+            if (every && ++seen % every == 0) {
+                path[3 * len] = x;
+                path[3 * len + 1] = y;
+                path[3 * len + 2] = z;
+                len++;
+            }
+        }
+        if (status == WALK_HIT)
+            break;
+    }
+    pos[0] = x;
+    pos[1] = y;
+    pos[2] = z;
+    counts[0] = num_steps;
+    counts[2] = seen;
+    *path_len = len;
+    return status;
+}
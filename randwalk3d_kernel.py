@@ -0,0 +1,328 @@
+"""
+  Optional compiled kernel for single 3D random walks (CompiledWalk3d).
+
+  RandomWalk3d.conduct_walk spends about a microsecond of Python per step.
+  When the boundary and target are each a Sphere, Ellipsoid or Rectangle3d
+  (rotated or not), the whole walk can instead run in native code: the C
+  source randwalk3d_kernel.c is compiled with the system C compiler on first
+  use, cached, and loaded with ctypes. The kernel follows the same rules as
+  conduct_walk (including moving targets and path recording) and draws its
+  steps from its own xoshiro256** generator, seeded from a numpy
+  SeedSequence, so walks are reproducible but not step-for-step equal to the
+  Python ones; their distributions are the same.
+
+  make_walk() returns a CompiledWalk3d when the kernel is available and
+  supports the shapes, and falls back to the pure-Python RandomWalk3d
+  otherwise. parity_check() compares both paths statistically; run this
+  module to print the comparison:
+
+        python randwalk3d_kernel.py [num_walks]
+
+  The compiler is taken from the CC environment variable (default 'cc') and
+  the compiled library is cached in RANDWALK3D_CACHE (default
+  ~/.cache/randwalk3d). Set RANDWALK3D_NO_KERNEL=1 to always use Python.
+  An installed package keeps the C source in <prefix>/share/randwalk3d.
+"""
+
+import copy
+import ctypes
+import hashlib
+import os
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import numpy as np
+import shapes3d_class as shapes
+import randwalk3d_class as rw3d
+import randwalk3d_steps as rwsteps
+import randwalk3d_wos as rwwos
+
+# C source next to this module, or where an installed package puts it
+SOURCE_DIRS  = (os.path.dirname(os.path.abspath(__file__)),
+                os.path.join(sys.prefix, 'share', 'randwalk3d'))
+SOURCE = next((os.path.join(directory, 'randwalk3d_kernel.c') for directory in SOURCE_DIRS
+               if os.path.exists(os.path.join(directory, 'randwalk3d_kernel.c'))),
+              os.path.join(SOURCE_DIRS[0], 'randwalk3d_kernel.c'))
+SHAPE_NONE, SHAPE_QUADRIC, SHAPE_BOX = 0, 1, 2
+STEP_KINDS   = {'grid': 0, 'direct': 1}
+WALK_HIT, WALK_PATH_FULL = 1, 2
+PATH_BLOCK   = 65536    # Points recorded per call of the kernel
+
+_kernel = None
+_kernel_error = None
+
+def _compile(source, library):
+    """
+    Compiles C source file into shared library, replacing it atomically
+    """
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(library), suffix='.so')
+    os.close(handle)
+    try:
+        command = [os.environ.get('CC', 'cc'), '-O3', '-shared', '-fPIC', '-std=c99',
+                   '-D_DEFAULT_SOURCE', '-o', temp_path, source, '-lm']
+        subprocess.run(command, check=True, capture_output=True)
+        os.replace(temp_path, library)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def load_kernel():
+    """
+    Returns ctypes function of the compiled walk kernel, compiling it if
+    needed, or None if it is disabled or cannot be built
+    """
+    global _kernel, _kernel_error
+    if _kernel is not None or _kernel_error is not None:
+        return _kernel
+    if os.environ.get('RANDWALK3D_NO_KERNEL'):
+        _kernel_error = 'disabled by RANDWALK3D_NO_KERNEL'
+        return None
+    try:
+        with open(SOURCE, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:16]
+        cache = os.environ.get('RANDWALK3D_CACHE',
+                               os.path.join(os.path.expanduser('~'), '.cache', 'randwalk3d'))
+        os.makedirs(cache, exist_ok=True)
+        platform = sysconfig.get_platform().replace('-', '_')
+        library = os.path.join(cache, 'randwalk3d_kernel_%s_%s.so' % (platform, digest))
+        if not os.path.exists(library):
+            _compile(SOURCE, library)
+        kernel = ctypes.CDLL(library).walk3d
+    except (OSError, subprocess.CalledProcessError) as error:
+        _kernel_error = str(error)
+        return None
+    double_p = np.ctypeslib.ndpointer(dtype=np.float64, flags='C_CONTIGUOUS')
+    int64_p  = np.ctypeslib.ndpointer(dtype=np.int64, flags='C_CONTIGUOUS')
+    kernel.argtypes = [double_p, double_p, int64_p,
+                       np.ctypeslib.ndpointer(dtype=np.uint64, flags='C_CONTIGUOUS'),
+                       np.ctypeslib.ndpointer(dtype=np.intc, flags='C_CONTIGUOUS'),
+                       double_p, double_p, double_p, ctypes.c_int64, ctypes.c_int64, int64_p]
+    kernel.restype = ctypes.c_int
+    _kernel = kernel
+    return _kernel
+
+def is_available():
+    """
+    Returns True if the compiled kernel can be used
+    """
+    return load_kernel() is not None
+
+def get_kernel_error():
+    """
+    Returns reason why the compiled kernel is not available (None if it is,
+    or if it has not been loaded yet)
+    """
+    return _kernel_error
+
+def shape_kind(shape):
+    """
+    Returns kernel shape kind of shape (SHAPE_NONE for None), or None if the
+    kernel cannot handle it
+    """
+    if not shape:
+        return SHAPE_NONE
+    if isinstance(shape, (shapes.Sphere, shapes.Ellipsoid)):
+        return SHAPE_QUADRIC
+    if isinstance(shape, shapes.Rectangle3d):
+        return SHAPE_BOX
+    return None
+
+def step_kind(rand_function):
+    """
+    Returns step kind ('grid' or 'direct') of rand_function, or None if it is
+    not a known step function
+    """
+    if isinstance(rand_function, rwsteps.StepSource3d):
+        return rand_function.get_kind()
+    return rwsteps.FUNCTION_KINDS.get(rand_function)
+
+def supports(rand_function, boundary=None, target=None, move_target=False):
+    """
+    Returns True if the compiled kernel can run walks with these settings
+    """
+    if step_kind(rand_function) is None:
+        return False
+    if shape_kind(boundary) is None or shape_kind(target) is None:
+        return False
+    return not (move_target and target and not boundary)
+
+def _form(shape):
+    """
+    Returns row-major form matrix of shape as flat array (zeros for None)
+    """
+    if not shape:
+        return np.zeros(9)
+    return np.ascontiguousarray(shape.get_form(), dtype=float).ravel()
+
+def make_walk(start_loc, max_steps, rand_function, boundary=None, target=None,
+              move_target=False, record='full', record_every=1, rng=None):
+    """
+    Returns CompiledWalk3d for the given walk if the compiled kernel is
+    available and supports it, otherwise a RandomWalk3d. With rng (numpy
+    Generator or seed) the Python fallback draws steps from a StepSource3d.
+    """
+    if supports(rand_function, boundary, target, move_target) and is_available():
+        return CompiledWalk3d(start_loc, max_steps, rand_function, boundary, target,
+                              move_target, record, record_every, rng)
+    if rng is not None:
+        rand_function = rwsteps.step_source(rand_function, rng)
+    return rw3d.RandomWalk3d(start_loc, max_steps, rand_function, boundary, target,
+                             move_target, record, record_every)
+
+
+class CompiledWalk3d(rw3d.RandomWalk3d):
+    """
+    Class to represent a 3D random walk run by the compiled kernel. Same
+    interface and walk rules as RandomWalk3d.
+    """
+
+    def __init__(self, start_loc, max_steps, rand_function, boundary=None, target=None,
+                 move_target=False, record='full', record_every=1, rng=None):
+        """
+        Initializes the CompiledWalk3d class object. Arguments as for
+        RandomWalk3d, plus:
+            rng : numpy.random.Generator or seed the kernel generator is
+                  seeded from (a StepSource3d rand_function lends its own)
+        """
+        if not supports(rand_function, boundary, target, move_target):
+            raise ValueError('Compiled walks need grid or direct steps and Sphere, '
+                             'Ellipsoid or Rectangle3d shapes')
+        kernel = load_kernel()
+        if kernel is None:
+            raise RuntimeError('Compiled walk kernel is not available: ' + str(_kernel_error))
+        rw3d.RandomWalk3d.__init__(self, start_loc, max_steps, rand_function, boundary,
+                                   target, move_target, record, record_every)
+        if rng is None and isinstance(rand_function, rwsteps.StepSource3d):
+            rng = rand_function.get_rng()
+        self._kernel = kernel
+        self._rng    = np.random.default_rng(rng)
+        self._record_every = record_every
+
+    def conduct_walk(self):
+        """
+        Performs a random walk inside a boundary with target in native code.
+        Walk proceeds until target is reached or max steps is exceeded
+        """
+        pos    = np.array(self._start_loc, dtype=float)
+        tpos   = np.zeros(3)
+        if self._target:
+            tpos = np.array(self._target.get_location(), dtype=float)
+        counts = np.array([0, self._max_steps, 0], dtype=np.int64)
+        state  = self._rng.integers(0, 2**64, size=4, dtype=np.uint64)
+        if not state.any():
+            state[0] = 1        # xoshiro256** must not start from all zeros
+        kinds  = np.array([STEP_KINDS[step_kind(self._rand)], shape_kind(self._boundary),
+                           shape_kind(self._target), int(bool(self._move_target))], dtype=np.intc)
+        bshape = np.zeros(12)
+        if self._boundary:
+            bshape[:3] = self._boundary.get_location()
+            bshape[3:] = _form(self._boundary)
+        tform  = _form(self._target)
+        every  = 0
+        if self._record in ('full', 'every_k'):
+            every = 1 if self._record == 'full' else self._record_every
+        path     = np.empty((PATH_BLOCK if every else 1, 3))
+        path_len = np.zeros(1, dtype=np.int64)
+        while True:
+            seen   = counts[2]
+            status = self._kernel(pos, tpos, counts, state, kinds, bshape, tform, path,
+                                  PATH_BLOCK if every else 0, every, path_len)
+            if every:
+                self._walk.extend(path[:path_len[0]], int(counts[2] - seen))
+                path_len[0] = 0
+            if status != WALK_PATH_FULL:
+                break
+        self._num_steps  = int(counts[0])
+        self._target_hit = status == WALK_HIT
+        if self._move_target and self._target:
+            self._target.move(tuple(tpos.tolist()))
+        self._finish_walk(tuple(pos.tolist()))
+        return
+
+def conduct_walks(start_loc, max_steps, num_walks, rand_function, boundary=None, target=None,
+                  move_target=False, rng=None, compiled=True):
+    """
+    Conducts num_walks single walks (compiled if compiled is True, else with
+    RandomWalk3d and a StepSource3d) from fresh copies of target. Returns
+    (num_steps, target_hit) arrays with one entry per walk.
+    """
+    source = rwsteps.step_source(rand_function, rng)
+    num_steps  = np.zeros(num_walks, dtype=np.int64)
+    target_hit = np.zeros(num_walks, dtype=bool)
+    for num in range(num_walks):
+        walk_target = copy.deepcopy(target) if move_target else target
+        if compiled:
+            walk = CompiledWalk3d(start_loc, max_steps, source, boundary, walk_target,
+                                  move_target, record='none')
+        else:
+            walk = rw3d.RandomWalk3d(start_loc, max_steps, source, boundary, walk_target,
+                                     move_target, record='none')
+        walk.conduct_walk()
+        num_steps[num]  = walk.get_num_steps()
+        target_hit[num] = walk.get_target_hit()
+    return num_steps, target_hit
+
+#  Cases compared by parity_check: (name, step kind, boundary, target, move_target)
+PARITY_CASES = [
+    ('sphere/sphere grid', 'grid', shapes.Sphere((0.0, 0.0, 0.0), 8.0),
+     shapes.Sphere((3.0, 3.0, 3.0), 1.5), False),
+    ('sphere/sphere direct', 'direct', shapes.Sphere((0.0, 0.0, 0.0), 8.0),
+     shapes.Sphere((3.0, 3.0, 3.0), 1.5), False),
+    ('ellipsoid/box direct', 'direct', shapes.Ellipsoid((0.0, 0.0, 0.0), 10.0, 6.0, 5.0),
+     shapes.Rectangle3d((4.0, 1.0, 0.0), 3.0, 3.0, 3.0), False),
+    ('box/sphere grid', 'grid', shapes.Rectangle3d((0.0, 0.0, 0.0), 16.0, 10.0, 10.0),
+     shapes.Sphere((4.0, 2.0, 2.0), 1.5), False),
+    ('rotated ellipsoid/sphere direct', 'direct',
+     shapes.Ellipsoid((0.0, 0.0, 0.0), 10.0, 5.0, 5.0, (0, 0, 45)),
+     shapes.Sphere((4.0, 4.0, 0.0), 1.5), False),
+    ('sphere/moving sphere direct', 'direct', shapes.Sphere((0.0, 0.0, 0.0), 8.0),
+     shapes.Sphere((3.0, 3.0, 3.0), 1.5), True),
+    ('box/moving box grid', 'grid', shapes.Rectangle3d((0.0, 0.0, 0.0), 12.0, 12.0, 12.0),
+     shapes.Rectangle3d((3.0, 3.0, 3.0), 3.0, 3.0, 3.0), True),
+]
+
+def parity_check(num_walks=2000, seed=None, max_steps=10**7, cases=PARITY_CASES):
+    """
+    Runs num_walks compiled and num_walks Python walks for each case and
+    returns list of dictionaries comparing their steps to target:
+        case                  : name of the case
+        mean_kernel, mean_python : average steps to target
+        sem_kernel, sem_python   : standard errors of the averages
+        ks_stat, ks_pvalue    : two-sample Kolmogorov-Smirnov test
+    """
+    results = []
+    for (name, kind, boundary, target, move_target), seq in \
+            zip(cases, np.random.SeedSequence(seed).spawn(len(cases))):
+        kernel_seq, python_seq = seq.spawn(2)
+        step = rw3d.rand_grid if kind == 'grid' else rw3d.rand_direct
+        samples = []
+        for compiled, walk_seq in ((True, kernel_seq), (False, python_seq)):
+            steps, hit = conduct_walks((0.0, 0.0, 0.0), max_steps, num_walks, step, boundary,
+                                       target, move_target, walk_seq, compiled)
+            samples.append(steps[hit])
+        kernel, python = samples
+        ks_stat, ks_pvalue = rwwos.ks_test(kernel, python)
+        results.append({'case'       : name,
+                        'mean_kernel': np.mean(kernel),
+                        'mean_python': np.mean(python),
+                        'sem_kernel' : np.std(kernel) / np.sqrt(len(kernel)),
+                        'sem_python' : np.std(python) / np.sqrt(len(python)),
+                        'ks_stat'    : ks_stat,
+                        'ks_pvalue'  : ks_pvalue})
+    return results
+
+if __name__ == '__main__':
+    if not is_available():
+        print('Compiled kernel not available: %s' % get_kernel_error())
+        sys.exit(1)
+    num_walks = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print('Compiled kernel vs Python walks (%d walks each)' % num_walks)
+    print('   %-32s %18s %18s %8s' % ('Case', 'Kernel mean', 'Python mean', 'KS p'))
+    failed = False
+    for row in parity_check(num_walks):
+        print('   %-32s %9.1f +- %5.1f %9.1f +- %5.1f %8.3f' % (
+            row['case'], row['mean_kernel'], row['sem_kernel'], row['mean_python'],
+            row['sem_python'], row['ks_pvalue']))
+        failed |= row['ks_pvalue'] < 0.001
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,183 @@
+"""
+  Lattice occupancy grid (LatticeDomain3d) for random walks on the integer
+  grid (rand_grid steps).
+
+  Walkers that start on an integer point and take grid steps never leave
+  the lattice, so the boundary and target only ever need to be tested on
+  integer points. The domain rasterizes both shapes once into a uint8 array
+  of flags (INSIDE_BOUNDARY, INSIDE_TARGET) over the bounding box of the
+  boundary, padded by one cell so every trial step stays in the array.
+  Walker positions are then flat indices into the array, a grid step is an
+  index offset and each boundary/target test is a single array lookup.
+
+  walk_cell() advances a single walker in plain Python on the same grid,
+  which is cheaper than array operations once only a few walkers are left.
+
+  Rasterized domains are cached per shape parameters (get_lattice), so
+  repeated simulations of the same boundary and target share one array.
+"""
+
+from collections import OrderedDict
+import numpy as np
+import shapes3d_class as shapes
+
+INSIDE_BOUNDARY = 1
+INSIDE_TARGET   = 2
+CACHE_SIZE      = 16    # Number of rasterized domains kept by get_lattice
+SLAB_POINTS     = 1 << 20   # Points rasterized per call of contains
+
+_cache = OrderedDict()
+
+def shape_key(shape):
+    """
+    Returns hashable key describing the type and parameters of shape
+    (including current location), used to cache rasterized domains
+    """
+    if shape is None:
+        return None
+    items = []
+    for name, value in sorted(vars(shape).items()):
+        if name == '_init_location':
+            continue
+        if isinstance(value, shapes.Shape3d):
+            value = shape_key(value)
+        elif isinstance(value, tuple) and value and isinstance(value[0], shapes.Shape3d):
+            value = tuple(shape_key(part) for part in value)
+        elif isinstance(value, np.ndarray):
+            value = (value.shape, value.tobytes())
+        elif isinstance(value, list):
+            value = (np.shape(value), np.asarray(value, dtype=float).tobytes())
+        items.append((name, value))
+    return (type(shape).__name__, tuple(items))
+
+def get_lattice(boundary, target=None):
+    """
+    Returns LatticeDomain3d for boundary and target, rasterizing them only if
+    no domain with the same shape parameters is cached
+    """
+    key = (shape_key(boundary), shape_key(target))
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    domain = LatticeDomain3d(boundary, target)
+    _cache[key] = domain
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return domain
+
+
+class LatticeDomain3d:
+    """
+    Class to represent boundary and target rasterized on the integer lattice
+    """
+
+    def __init__(self, boundary, target=None):
+        """
+        Initializes the LatticeDomain3d class object:
+            boundary : shape object confining the walks (required)
+            target   : shape object describing target, or None
+            origin   : integer (x,y,z) of the first cell of the grid
+            shape    : number of cells along x, y and z
+            flags    : flat uint8 array of INSIDE_BOUNDARY/INSIDE_TARGET flags
+            offsets  : flat index offsets of the six grid steps
+        """
+        if boundary is None:
+            raise ValueError('Lattice domain needs a boundary')
+        self._boundary = boundary
+        self._target   = target
+        lower, upper   = boundary.get_bounding_box()
+        self._origin   = np.floor(lower).astype(np.int64) - 1
+        self._shape    = np.ceil(upper).astype(np.int64) + 2 - self._origin
+        nx, ny, nz     = self._shape
+        self._strides  = np.array([ny * nz, nz, 1], dtype=np.int64)
+        self._offsets  = np.array([ny * nz, -ny * nz, nz, -nz, 1, -1], dtype=np.int64)
+        self._flags    = np.zeros(nx * ny * nz, dtype=np.uint8)
+        for start in range(0, self._flags.size, SLAB_POINTS):
+            index  = np.arange(start, min(start + SLAB_POINTS, self._flags.size))
+            points = self.position(index).astype(float)
+            flags  = boundary.contains(points).astype(np.uint8) * INSIDE_BOUNDARY
+            if target is not None:
+                flags |= target.contains(points).astype(np.uint8) * INSIDE_TARGET
+            self._flags[start:start + len(index)] = flags
+        self._flag_bytes = self._flags.tobytes()
+
+    def get_origin(self):
+        """
+        Returns integer (x,y,z) coordinates of the first grid cell
+        """
+        return tuple(self._origin.tolist())
+
+    def get_shape(self):
+        """
+        Returns number of grid cells along x, y and z
+        """
+        return tuple(self._shape.tolist())
+
+    def get_flags(self):
+        """
+        Returns flat uint8 array of INSIDE_BOUNDARY / INSIDE_TARGET flags
+        """
+        return self._flags
+
+    def get_offsets(self):
+        """
+        Returns flat index offsets of the grid steps (1,0,0),(-1,0,0),(0,1,0),
+        (0,-1,0),(0,0,1),(0,0,-1), in the order used by rand_grid
+        """
+        return self._offsets
+
+    def contains_point(self, point):
+        """
+        Returns True if integer point (x,y,z) lies inside the padded grid
+        """
+        cell = np.asarray(point) - self._origin
+        return bool(np.all((cell >= 0) & (cell < self._shape)))
+
+    def inside_boundary(self, point):
+        """
+        Returns True if integer point (x,y,z) lies on a grid cell inside the
+        boundary (cells of the padding around it are outside)
+        """
+        if not self.contains_point(point):
+            return False
+        return bool(self._flags[int(self.index(point))] & INSIDE_BOUNDARY)
+
+    def index(self, points):
+        """
+        Returns flat grid indices of integer points, array of shape (N,3)
+        """
+        points = np.asarray(points)
+        if not np.all(points == np.round(points)):
+            raise ValueError('Lattice walks need integer positions')
+        return (np.rint(points).astype(np.int64) - self._origin) @ self._strides
+
+    def position(self, index):
+        """
+        Returns (N,3) integer array of lattice points at flat grid indices
+        """
+        index = np.asarray(index, dtype=np.int64)
+        cells = np.stack(np.unravel_index(index, tuple(self._shape)), axis=-1)
+        return cells + self._origin
+
+    def walk_cell(self, cell, num_steps, max_steps, source, block_size=4096):
+        """
+        Continues a single lattice walk from flat index cell after num_steps
+        steps, until target is hit or max_steps is reached. Steps are drawn
+        from source, a grid StepSource3d.
+        Returns (cell, num_steps, target_hit).
+        """
+        flags   = self._flag_bytes
+        offsets = self._offsets
+        moves, used = [], 0
+        while num_steps < max_steps:
+            if used == len(moves):
+                moves, used = offsets[source.next_indices(block_size)].tolist(), 0
+            trial = cell + moves[used]
+            used += 1
+            flag = flags[trial]
+            if flag & INSIDE_TARGET:
+                return trial, num_steps + 1, True
+            if flag & INSIDE_BOUNDARY:
+                cell = trial
+                num_steps += 1
+        return cell, num_steps, False
@@ -0,0 +1,156 @@
+"""
+  Monte Carlo runner for 3D random walks. Spreads the num_sim walks of a
+  simulation over a pool of worker processes and merges the results.
+
+  The walks are split into fixed-size chunks and every chunk gets its own
+  random stream spawned from one master seed (numpy SeedSequence). Chunks
+  do not depend on the number of workers and results are merged in chunk
+  order, so a given master seed gives identical results no matter how many
+  workers run.
+
+  Results are gathered in WalkStatistics accumulators (randwalk3d_stats.py),
+  so memory does not grow with num_sim.
+
+  A simulation is described by a config dictionary with the same entries as
+  the RandomWalk3d constructor:
+        start_loc, max_steps, rand_function, boundary, target, move_target
+  An optional 'accelerated' entry set to True runs rand_direct walks with
+  walk-on-spheres jumps (randwalk3d_wos.py), and a 'lattice' entry set to
+  True runs rand_grid walks on a rasterized lattice (randwalk3d_lattice.py).
+
+  Passing a WalkProfile (randwalk3d_profile.py) to run_simulations
+  instruments the ensemble walks of every chunk and merges the counts and
+  phase timings into it.
+
+  Run this module to check that chunks with different random streams give
+  different walks (also for a StepSource3d rand_function):
+
+        python randwalk3d_montecarlo.py [num_walks]
+"""
+
+import copy
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import randwalk3d_class as rw3d
+import randwalk3d_ensemble as rwens
+import randwalk3d_profile as rwprof
+import randwalk3d_wos as rwwos
+from randwalk3d_stats import WalkStatistics
+
+CHUNK_SIZE = 1000       # Walks simulated per task sent to a worker
+
+def conduct_chunk(config, num_walks, seed_seq, profile=None):
+    """
+    Conducts num_walks walks described by config with random stream seed_seq.
+    Returns (num_steps, target_hit, end_loc) arrays with one entry (row) per
+    walk. Ensemble walks are instrumented with WalkProfile profile if given.
+    """
+    # Each chunk works on its own copy of the shapes
+    config = copy.deepcopy(config)
+    if config.get('accelerated', False):
+        if config.get('move_target', False):
+            raise ValueError('Accelerated walks cannot move the target')
+        if config['rand_function'] is not rw3d.rand_direct:
+            raise ValueError('Accelerated walks need rand_direct steps')
+        if profile is not None:
+            raise ValueError('Accelerated walks cannot be profiled')
+        return rwwos.conduct_walks(config['start_loc'], config['max_steps'], num_walks,
+                                   config.get('boundary'), config.get('target'),
+                                   np.random.default_rng(seed_seq))
+    ensemble = rwens.RandomWalkEnsemble3d(config['start_loc'], config['max_steps'], num_walks,
+                                          config['rand_function'], config.get('boundary'),
+                                          config.get('target'), np.random.default_rng(seed_seq),
+                                          config.get('lattice', False),
+                                          config.get('move_target', False), profile)
+    ensemble.conduct_walks()
+    return ensemble.get_num_steps(), ensemble.get_target_hit(), ensemble.get_end_locations()
+
+def streams_differ(config, num_walks=200, seed=None):
+    """
+    Returns True if two chunks of num_walks walks described by config with
+    different random streams spawned from seed give different steps to
+    target, i.e. chunks do not replay the same walks
+    """
+    first, second = np.random.SeedSequence(seed).spawn(2)
+    return not np.array_equal(conduct_chunk(config, num_walks, first)[0],
+                              conduct_chunk(config, num_walks, second)[0])
+
+def run_chunk(config, num_walks, seed_seq, bin_edges=None):
+    """
+    Conducts one chunk of walks and returns its WalkStatistics
+    """
+    num_steps, target_hit, _ = conduct_chunk(config, num_walks, seed_seq)
+    stats = WalkStatistics(bin_edges)
+    stats.add(num_steps, target_hit)
+    return stats
+
+def profile_chunk(config, num_walks, seed_seq, bin_edges=None,
+                  sample_every=rwprof.SAMPLE_EVERY):
+    """
+    Conducts one chunk of walks with instrumentation and returns its
+    WalkStatistics and WalkProfile
+    """
+    profile = rwprof.WalkProfile(sample_every)
+    num_steps, target_hit, _ = conduct_chunk(config, num_walks, seed_seq, profile)
+    stats = WalkStatistics(bin_edges)
+    stats.add(num_steps, target_hit)
+    return stats, profile
+
+def chunk_tasks(config, num_sim, seed=None, chunk_size=CHUNK_SIZE, bin_edges=None):
+    """
+    Splits num_sim walks into chunks. Returns list of (config, num_walks,
+    seed_seq, bin_edges) argument tuples for run_chunk, in merge order.
+    """
+    seed_seq = np.random.SeedSequence(seed)
+    sizes    = [min(chunk_size, num_sim - start) for start in range(0, num_sim, chunk_size)]
+    return [(config, size, chunk_seq, bin_edges)
+            for size, chunk_seq in zip(sizes, seed_seq.spawn(len(sizes)))]
+
+def run_simulations(config, num_sim, workers=None, seed=None, chunk_size=CHUNK_SIZE,
+                    bin_edges=None, profile=None):
+    """
+    Conducts num_sim random walks described by config on 'workers' processes
+    (None => one per CPU, 1 => run in this process) and returns WalkStatistics
+    of the steps to target, with a histogram on bin_edges if given.
+    Pass the same seed to repeat a simulation exactly.
+    With a WalkProfile, the profiles of all chunks are merged into profile
+    (instrumentation does not change the results).
+    """
+    tasks = chunk_tasks(config, num_sim, seed, chunk_size, bin_edges)
+    stats = WalkStatistics(bin_edges)
+    if profile is not None:
+        run, tasks = profile_chunk, [task + (profile.get_sample_every(),) for task in tasks]
+    else:
+        run = run_chunk
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            chunk = run(*task)
+            if profile is not None:
+                chunk, chunk_profile = chunk
+                profile.merge(chunk_profile)
+            stats.merge(chunk)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk in pool.map(run, *zip(*tasks)):
+                if profile is not None:
+                    chunk, chunk_profile = chunk
+                    profile.merge(chunk_profile)
+                stats.merge(chunk)
+    return stats
+
+if __name__ == '__main__':
+    import sys
+    import shapes3d_class as shapes
+    import randwalk3d_steps as rwsteps
+    num_walks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print('Chunks with different random streams (%d walks each)' % num_walks)
+    failed = False
+    for name, step in (('rand_grid', rw3d.rand_grid), ('rand_direct', rw3d.rand_direct),
+                       ('StepSource3d', rwsteps.StepSource3d('direct', 0))):
+        config = {'start_loc': (0.0, 0.0, 0.0), 'max_steps': 10**6, 'rand_function': step,
+                  'boundary': shapes.Sphere((0.0, 0.0, 0.0), 8.0),
+                  'target': shapes.Sphere((3.0, 3.0, 3.0), 1.5), 'move_target': False}
+        differ = streams_differ(config, num_walks)
+        failed |= not differ
+        print('   %-14s %s' % (name, 'differ' if differ else 'IDENTICAL'))
+    sys.exit(1 if failed else 0)
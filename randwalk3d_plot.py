@@ -0,0 +1,253 @@
+"""
+  Headless plots of random walk results.
+
+  Figures are drawn on matplotlib's Agg canvas through the object oriented
+  API (no pyplot, no window), so plotting never blocks and works without a
+  display, in worker processes and on servers. Every render_* function
+  reads stored results and writes an image file; the format follows the
+  file extension (.png, .svg, .pdf).
+
+  Long walk paths are cut down to a point budget before drawing, either by
+  keeping every k-th point ('stride') or with Largest-Triangle-Three-Buckets
+  ('lttb', on the 3D points), which keeps the corners of the path that
+  matter visually. Shape wireframes (Shape3d.get_wireframe) are gathered
+  into one line collection per axes.
+
+  render_sweep draws a whole sweep: the bar chart of the CSV results table
+  and, with a ResultStore, a histogram of steps and the end points of the
+  walks of every cell, one file per figure and format, rendered on a pool
+  of worker processes.
+
+  Command line:
+      python randwalk3d_plot.py sweep sphere_radius_results.csv -c sweeps/sphere_radius.json
+                                     [--store sphere_radius_walks] [-o plots/] [-f png svg]
+      python randwalk3d_plot.py walk path.npy [-o path.png] [--max-points 5000]
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import randwalk3d_sweep as sweep
+from randwalk3d_stats import log_bins
+from randwalk3d_store import ResultStore
+
+MAX_POINTS = 5000       # Points of a path or point cloud drawn at most
+DOWNSAMPLE_METHODS = ('lttb', 'stride')
+
+def new_figure(figsize=(8, 6)):
+    """
+    Returns matplotlib Figure drawn on an Agg canvas
+    """
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+def save_figure(fig, output):
+    """
+    Saves figure to file output, creating its directory. Returns output.
+    """
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fig.savefig(output)
+    return output
+
+def stride_points(points, budget=MAX_POINTS):
+    """
+    Returns every k-th of the (N,3) points, at most budget of them,
+    always including the first and last point
+    """
+    points = np.asarray(points)
+    if len(points) <= budget:
+        return points
+    index = np.unique(np.linspace(0, len(points) - 1, budget).astype(np.int64))
+    return points[index]
+
+def lttb_points(points, budget=MAX_POINTS):
+    """
+    Returns budget of the (N,3) points chosen by Largest-Triangle-Three-
+    Buckets: the first and last point, and from each of budget-2 buckets of
+    consecutive points the one spanning the largest triangle with the point
+    kept before it and the mean of the next bucket
+    """
+    points = np.asarray(points, dtype=float)
+    if len(points) <= budget or budget < 3:
+        return points
+    edges = np.linspace(1, len(points) - 1, budget - 1).astype(np.int64)
+    index = np.zeros(budget, dtype=np.int64)
+    index[-1] = len(points) - 1
+    for num in range(budget - 2):
+        bucket = points[edges[num]:edges[num + 1]]
+        if num + 2 < len(edges):
+            following = points[edges[num + 1]:edges[num + 2]].mean(axis=0)
+        else:
+            following = points[-1]
+        last = points[index[num]]
+        area = np.cross(bucket - last, following - last)
+        index[num + 1] = edges[num] + np.argmax(np.einsum('ij,ij->i', area, area))
+    return points[index]
+
+def downsample(points, budget=MAX_POINTS, method='lttb'):
+    """
+    Returns at most budget of the (N,3) points with one of DOWNSAMPLE_METHODS
+    """
+    if method == 'lttb':
+        return lttb_points(points, budget)
+    if method == 'stride':
+        return stride_points(points, budget)
+    raise ValueError('method must be one of ' + ', '.join(DOWNSAMPLE_METHODS))
+
+def draw_shapes(ax, shapes, colors=None, line_size=1.0):
+    """
+    Draws wireframes of all shapes (None entries skipped) on 3D axes as one
+    line collection. colors gives one color per shape (None => defaults).
+    """
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
+    lines, line_colors = [], []
+    for num, shape in enumerate(shapes):
+        if shape is None:
+            continue
+        wireframe = shape.get_wireframe()
+        lines.extend(wireframe)
+        line_colors.extend([colors[num] if colors else shape.get_color()] * len(wireframe))
+    if not lines:
+        return
+    ax.add_collection3d(Line3DCollection(lines, colors=line_colors, linewidths=line_size))
+    points = np.concatenate(lines)
+    ax.auto_scale_xyz(points[:, 0], points[:, 1], points[:, 2], had_data=True)
+
+def plot_path(ax, walk, max_points=MAX_POINTS, method='lttb', line_type='r-', label=None,
+              end_symbol='k*', end_size=10):
+    """
+    Plots (N,3) walk path on 3D axes, downsampled to max_points, marking
+    its start (black dot) and end (end_symbol)
+    """
+    walk = downsample(walk, max_points, method)
+    ax.plot(walk[:, 0], walk[:, 1], walk[:, 2], line_type, label=label)
+    ax.plot([walk[-1, 0]], [walk[-1, 1]], [walk[-1, 2]], end_symbol, ms=end_size)
+    ax.plot([walk[0, 0]], [walk[0, 1]], [walk[0, 2]], 'ko', ms=end_size)
+
+def render_walk(walk, output, boundary=None, target=None, max_points=MAX_POINTS, method='lttb'):
+    """
+    Draws walk path ((N,3) array or .npy file) with boundary and target
+    wireframes to image file output. Returns output.
+    """
+    if isinstance(walk, str):
+        walk = np.load(walk, mmap_mode='r')
+    fig = new_figure()
+    ax = fig.add_subplot(1, 1, 1, projection='3d')
+    draw_shapes(ax, [boundary, target], ['b', 'r'])
+    plot_path(ax, walk, max_points, method, label='%d steps' % (len(walk) - 1))
+    ax.legend()
+    return save_figure(fig, output)
+
+def render_results(rows, output, plot=None):
+    """
+    Draws bar chart of average steps to target of results table rows (list
+    of dictionaries, or CSV file) to image file output. Returns output.
+    """
+    if isinstance(rows, str):
+        rows = sweep.read_results(rows)
+    fig = new_figure()
+    sweep.plot_results(rows, plot, ax=fig.add_subplot(1, 1, 1))
+    return save_figure(fig, output)
+
+def render_cell(store, key, output, num_bins=50, max_points=MAX_POINTS):
+    """
+    Draws histogram of steps to target and end points (with boundary and
+    target wireframes) of the walks of config key in ResultStore store
+    (object or directory) to image file output. Returns output.
+    """
+    if isinstance(store, str):
+        store = ResultStore(store)
+    data = store.load(('steps', 'hit', 'end_x', 'end_y', 'end_z'), keys=[key])
+    info = store.get_configs().get(key, {})
+    fig = new_figure((12, 5))
+    ax = fig.add_subplot(1, 2, 1)
+    steps = data['steps'][data['hit'].astype(bool)]
+    if steps.size:
+        ax.hist(steps, bins=log_bins(max(2, steps.max()), num_bins), color='red')
+        ax.set_xscale('log')
+        ax.text(.65, .9, 'Ave steps: %.0f' % steps.mean(), transform=ax.transAxes)
+    ax.set_xlabel('Steps to target')
+    ax.set_ylabel('Walks')
+    ax.set_title(', '.join('%s = %s' % item for item in sorted(info.get('params', {}).items()))
+                 or key)
+    ax3d = fig.add_subplot(1, 2, 2, projection='3d')
+    if 'settings' in info:
+        simulation = sweep.cell_simulation(info['settings'], info['params'])
+        draw_shapes(ax3d, [simulation['boundary'], simulation['target']], ['b', 'r'])
+    ends = stride_points(np.column_stack((data['end_x'], data['end_y'], data['end_z'])),
+                         max_points)
+    ax3d.scatter(ends[:, 0], ends[:, 1], ends[:, 2], s=2, c='k')
+    ax3d.set_title('End points of %d walks' % data['steps'].size)
+    return save_figure(fig, output)
+
+def _render(kind, args):
+    """
+    Runs render function kind ('results' or 'cell') with args, in a worker
+    """
+    return {'results': render_results, 'cell': render_cell}[kind](*args)
+
+def render_sweep(results, output_dir, config=None, store=None, formats=('png',), workers=None):
+    """
+    Draws all figures of a sweep to output_dir: the bar chart of CSV results
+    table results (with the "plot" section of config) and, with a
+    ResultStore directory store, one figure per cell of the table. Every
+    figure is saved in each of formats, on 'workers' processes (None => one
+    per CPU, 1 => in this process). Returns list of files written.
+    """
+    rows = sweep.read_results(results)
+    name = os.path.splitext(os.path.basename(results))[0]
+    jobs = []
+    for fmt in formats:
+        jobs.append(('results', (rows, os.path.join(output_dir, '%s.%s' % (name, fmt)),
+                                 (config or {}).get('plot'))))
+        if store is not None:
+            keys = ResultStore(store).get_configs()
+            for row in rows:
+                if row['cell'] in keys:
+                    jobs.append(('cell', (store, row['cell'],
+                                          os.path.join(output_dir, 'cell-%s.%s' % (row['cell'], fmt)))))
+    if workers == 1 or len(jobs) <= 1:
+        return [_render(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render, *zip(*jobs)))
+
+def main(argv=None):
+    """
+    Command line entry point: render a 'sweep' or a 'walk' path
+    """
+    parser = argparse.ArgumentParser(description='Headless plots of 3D random walk results')
+    commands = parser.add_subparsers(dest='command', required=True)
+    sweep_plot = commands.add_parser('sweep', help='plot a results table and its stored walks')
+    sweep_plot.add_argument('results')
+    sweep_plot.add_argument('-c', '--config', help='sweep config with a "plot" section')
+    sweep_plot.add_argument('--store', help='ResultStore directory of the sweep')
+    sweep_plot.add_argument('-o', '--output', help='directory for the images '
+                                                   '(default: results name + _plots)')
+    sweep_plot.add_argument('-f', '--format', nargs='+', default=['png'])
+    sweep_plot.add_argument('-w', '--workers', type=int, default=None)
+    walk_plot = commands.add_parser('walk', help='plot a walk path saved with numpy.save')
+    walk_plot.add_argument('path')
+    walk_plot.add_argument('-o', '--output', help='image file (default: path name + .png)')
+    walk_plot.add_argument('--max-points', type=int, default=MAX_POINTS)
+    walk_plot.add_argument('--method', choices=DOWNSAMPLE_METHODS, default='lttb')
+    args = parser.parse_args(argv)
+    if args.command == 'sweep':
+        config = sweep.load_config(args.config) if args.config else None
+        output = args.output or os.path.splitext(args.results)[0] + '_plots'
+        files = render_sweep(args.results, output, config, args.store, args.format, args.workers)
+    else:
+        output = args.output or os.path.splitext(args.path)[0] + '.png'
+        files = [render_walk(args.path, output, max_points=args.max_points, method=args.method)]
+    for path in files:
+        print(path)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
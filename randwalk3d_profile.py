@@ -0,0 +1,299 @@
+"""
+  Instrumentation of 3D random walks (WalkProfile).
+
+  RandomWalk3d.conduct_walk takes an optional WalkProfile; ProfiledWalk3d
+  is a RandomWalk3d that always passes its own. The walk is the same with
+  or without a profile (it draws the same random steps, so results are
+  identical), while the profile counts trial steps, accepted steps,
+  boundary tests and rejections, target tests and skips, target hits and
+  target moves. Every sample_every-th trial step is also timed phase by
+  phase:
+        rng      : drawing the random step
+        target   : target skip bookkeeping and target test
+        move     : random move of the target
+        boundary : boundary test
+        record   : appending the step to the recorded path
+  As exactly one in sample_every steps is timed, the time of each phase
+  over the whole run is estimated as sample_every times its sampled time.
+
+  RandomWalkEnsemble3d and the Monte Carlo runner (profile_chunk,
+  run_simulations) take a WalkProfile as well and time every
+  sample_every-th ensemble step.
+
+  A WalkProfile can be merged with the profiles of other chunks and exported
+  as a summary dictionary, as Chrome trace events (chrome://tracing or
+  Perfetto) of the sampled steps, or as a file that pstats.Stats can load.
+"""
+
+import json
+import marshal
+import os
+import sys
+import time
+import randwalk3d_class as rw3d
+
+SAMPLE_EVERY = 64       # Time one trial step (or ensemble step) in this many
+TRACE_LIMIT  = 100000   # Chrome trace events kept per profile
+
+PHASES = ('rng', 'target', 'move', 'boundary', 'record')
+
+#  Counter with the number of times each phase runs
+PHASE_COUNTERS = {'rng'     : 'trial_steps',
+                  'target'  : 'target_checks',
+                  'move'    : 'move_tests',
+                  'boundary': 'boundary_tests',
+                  'record'  : 'recorded_points'}
+
+COUNTERS = ('walks', 'trial_steps', 'accepted_steps', 'boundary_tests',
+            'boundary_rejections', 'target_checks', 'target_tests', 'target_skips',
+            'target_hits', 'move_tests', 'target_moves', 'recorded_points')
+
+
+class PhaseTimer:
+    """
+    Class to represent the timing of the phases of one sampled step
+    """
+
+    def __init__(self, profile, calls):
+        """
+        Initializes the PhaseTimer class object:
+            profile: WalkProfile the phase times are added to
+            calls  : walker steps covered by each phase (1 for a single walk,
+                     active walkers for an ensemble step)
+            last   : clock reading at the end of the previous phase
+        """
+        self._profile = profile
+        self._calls   = calls
+        self._last    = time.perf_counter()
+
+    def lap(self, phase, calls=None):
+        """
+        Ends phase, which took the time since the previous lap and covered
+        calls walker steps (None => calls of the timer)
+        """
+        now = time.perf_counter()
+        self._profile.add_time(phase, self._last, now - self._last,
+                               self._calls if calls is None else calls)
+        # The next phase starts after the bookkeeping
+        self._last = time.perf_counter()
+
+
+class WalkProfile:
+    """
+    Class to represent counters and sampled phase timings of random walks
+    """
+
+    def __init__(self, sample_every=SAMPLE_EVERY, trace_limit=TRACE_LIMIT):
+        """
+        Initializes the WalkProfile class object:
+            sample_every : one in sample_every steps is timed
+            trace_limit  : maximum number of Chrome trace events kept
+            counters     : counts of the events in COUNTERS
+            phase_time   : sampled seconds spent in each phase
+            phase_calls  : walker steps covered by the sampled phase times
+            walk_time    : seconds spent in instrumented walks in total
+            events       : Chrome trace events of the sampled phases
+            ticks        : steps seen since the last timed step
+        """
+        self._sample_every = max(1, int(sample_every))
+        self._trace_limit  = trace_limit
+        self._counters     = dict.fromkeys(COUNTERS, 0)
+        self._phase_time   = dict.fromkeys(PHASES, 0.0)
+        self._phase_calls  = dict.fromkeys(PHASES, 0)
+        self._walk_time    = 0.0
+        self._events       = []
+        self._ticks        = 0
+        # Wall clock at perf_counter zero, for trace timestamps
+        self._epoch        = time.time() - time.perf_counter()
+
+    def get_sample_every(self):
+        """
+        Returns number of steps per timed step
+        """
+        return self._sample_every
+
+    def get_counters(self):
+        """
+        Returns dictionary of event counts
+        """
+        return dict(self._counters)
+
+    def get_walk_time(self):
+        """
+        Returns seconds spent in instrumented walks
+        """
+        return self._walk_time
+
+    def count(self, name, num=1):
+        """
+        Adds num to counter name
+        """
+        self._counters[name] += int(num)
+
+    def add_walk_time(self, seconds):
+        """
+        Adds seconds spent in instrumented walks
+        """
+        self._walk_time += seconds
+
+    def timer(self, calls=1):
+        """
+        Returns PhaseTimer for every sample_every-th call, None otherwise
+        """
+        self._ticks += 1
+        if self._ticks < self._sample_every:
+            return None
+        self._ticks = 0
+        return PhaseTimer(self, calls)
+
+    def add_time(self, phase, start, seconds, calls=1):
+        """
+        Adds sampled phase that started at perf_counter reading start, took
+        seconds and covered calls walker steps
+        """
+        self._phase_time[phase]  += seconds
+        self._phase_calls[phase] += calls
+        if len(self._events) < self._trace_limit:
+            self._events.append({'name': phase, 'cat': 'walk', 'ph': 'X',
+                                 'ts': (self._epoch + start) * 1e6, 'dur': seconds * 1e6,
+                                 'pid': os.getpid(), 'tid': 0, 'args': {'calls': calls}})
+
+    def get_phase_times(self):
+        """
+        Returns dictionary of estimated seconds spent in each phase over the
+        whole run (sampled time times sample_every)
+        """
+        return dict((phase, self._phase_time[phase] * self._sample_every) for phase in PHASES)
+
+    def merge(self, other):
+        """
+        Adds the counts, times and trace events of WalkProfile other, which
+        must time steps as often as this profile
+        """
+        if other._sample_every != self._sample_every:
+            raise ValueError('Profiles with different sample_every cannot be merged')
+        for name in COUNTERS:
+            self._counters[name] += other._counters[name]
+        for phase in PHASES:
+            self._phase_time[phase]  += other._phase_time[phase]
+            self._phase_calls[phase] += other._phase_calls[phase]
+        self._walk_time += other._walk_time
+        self._events.extend(other._events[:max(0, self._trace_limit - len(self._events))])
+
+    def summary(self):
+        """
+        Returns dictionary with counters, walk time and, for each phase, the
+        sampled and estimated time and the estimated share of the walk time
+        """
+        estimated = self.get_phase_times()
+        total = sum(estimated.values())
+        phases = {}
+        for phase in PHASES:
+            phases[phase] = {'calls'         : self._counters[PHASE_COUNTERS[phase]],
+                             'sampled_calls' : self._phase_calls[phase],
+                             'sampled_time'  : self._phase_time[phase],
+                             'estimated_time': estimated[phase],
+                             'share'         : estimated[phase] / total if total else 0.0}
+        return {'sample_every': self._sample_every,
+                'walk_time'   : self._walk_time,
+                'counters'    : self.get_counters(),
+                'phases'      : phases}
+
+    def write_chrome_trace(self, path):
+        """
+        Writes the sampled phases as Chrome trace event file path
+        """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self._events, 'displayTimeUnit': 'ns',
+                       'otherData': self.summary()}, f)
+
+    def write_pstats(self, path):
+        """
+        Writes the estimated phase times in the format read by pstats.Stats,
+        one entry per phase called from a 'conduct_walk' entry
+        """
+        walk = ('walk', 0, 'conduct_walk')
+        stats = {}
+        estimated = self.get_phase_times()
+        for phase in PHASES:
+            calls = self._counters[PHASE_COUNTERS[phase]]
+            if not calls:
+                continue
+            seconds = estimated[phase]
+            stats[('walk', 0, phase)] = \
+                (calls, calls, seconds, seconds, {walk: (calls, calls, seconds, seconds)})
+        walks = self._counters['walks']
+        walk_time = max(self._walk_time, sum(estimated.values()))
+        stats[walk] = (walks, walks, walk_time - sum(estimated.values()), walk_time, {})
+        with open(path, 'wb') as f:
+            marshal.dump(stats, f)
+
+
+class ProfiledWalk3d(rw3d.RandomWalk3d):
+    """
+    Class to represent a 3D random walk that is instrumented with a WalkProfile
+    """
+
+    def __init__(self, start_loc, max_steps, rand_function, boundary=None, target=None,
+                 move_target=False, record='full', record_every=1, profile=None):
+        """
+        Initializes the ProfiledWalk3d class object, as RandomWalk3d:
+            profile: WalkProfile to add the counts and timings to (None =>
+                     a new WalkProfile)
+        """
+        rw3d.RandomWalk3d.__init__(self, start_loc, max_steps, rand_function, boundary,
+                                   target, move_target, record, record_every)
+        self._profile = profile if profile is not None else WalkProfile()
+
+    def get_profile(self):
+        """
+        Returns WalkProfile of the walk
+        """
+        return self._profile
+
+    def conduct_walk(self):
+        """
+        Performs the random walk of RandomWalk3d.conduct_walk, counting events
+        and timing the phases of sampled steps in the profile
+        """
+        rw3d.RandomWalk3d.conduct_walk(self, self._profile)
+
+
+def print_summary(profile):
+    """
+    Prints the counters and estimated phase times of WalkProfile profile
+    """
+    summary = profile.summary()
+    print('Counters')
+    for name in COUNTERS:
+        print('   %-22s %14d' % (name, summary['counters'][name]))
+    print('Phases (one in %d steps timed, %.3f s in walks)' % (summary['sample_every'],
+                                                               summary['walk_time']))
+    print('   %-10s %14s %14s %8s' % ('Phase', 'Calls', 'Estimated', 'Share'))
+    for phase in PHASES:
+        entry = summary['phases'][phase]
+        print('   %-10s %14d %12.4f s %7.1f%%' % (phase, entry['calls'], entry['estimated_time'],
+                                                 100.0 * entry['share']))
+
+if __name__ == '__main__':
+    # Profile a few walks in a sphere with a moving ellipsoid target
+    import argparse
+    import shapes3d_class as shapes
+    parser = argparse.ArgumentParser(description='Profile 3D random walks')
+    parser.add_argument('num_walks', type=int, nargs='?', default=20)
+    parser.add_argument('--trace', help='Chrome trace event file to write')
+    parser.add_argument('--pstats', help='pstats file to write')
+    args = parser.parse_args()
+    profile = WalkProfile()
+    for num in range(args.num_walks):
+        walk = ProfiledWalk3d((0.0, 0.0, 0.0), 10**6, rw3d.rand_direct,
+                              shapes.Sphere((0.0, 0.0, 0.0), 10.0),
+                              shapes.Ellipsoid((5.0, 0.0, 0.0), 1.0, 2.0, 1.0), True,
+                              profile=profile)
+        walk.conduct_walk()
+    print_summary(profile)
+    if args.trace:
+        profile.write_chrome_trace(args.trace)
+    if args.pstats:
+        profile.write_pstats(args.pstats)
+    sys.exit(0)
@@ -0,0 +1,203 @@
+"""
+  Class (WalkStatistics) that accumulates statistics of random walk results
+  in constant memory. Results are added in batches of (num_steps, target_hit)
+  arrays and never stored: the accumulator keeps running count, mean and
+  variance (Welford/Chan update), min and max of the steps to target of the
+  walks that hit, the number of walks that missed, and an optional histogram
+  on fixed bin edges.
+
+  Accumulators built on the same bin edges can be merged, so each worker
+  process can fill its own and the results combined afterwards. to_dict()
+  and from_dict() convert an accumulator to and from plain JSON-compatible
+  values (e.g. for checkpoints) without losing precision.
+"""
+
+import numpy as np
+
+def linear_bins(max_value, num_bins=50):
+    """
+    Returns num_bins+1 evenly spaced bin edges from 0 to max_value
+    """
+    return np.linspace(0.0, max_value, num_bins + 1)
+
+def log_bins(max_value, num_bins=50):
+    """
+    Returns num_bins+1 logarithmically spaced bin edges from 1 to max_value
+    """
+    return np.logspace(0.0, np.log10(max_value), num_bins + 1)
+
+
+class WalkStatistics:
+    """
+    Class to represent running statistics of steps to target for a set
+    of random walks. Walks that miss the target are counted separately and
+    do not enter the step statistics.
+    """
+
+    def __init__(self, bin_edges=None):
+        """
+        Initializes the WalkStatistics class object:
+            bin_edges : increasing histogram bin edges, or None for no histogram
+            num_hit   : number of walks that reached target
+            num_miss  : number of walks that used up max_steps
+            mean, m2  : running mean and sum of squared deviations of steps
+            min, max  : smallest and largest number of steps to target
+            counts    : histogram counts, plus counts below/above the edges
+        """
+        self._num_hit  = 0
+        self._num_miss = 0
+        self._mean     = 0.0
+        self._m2       = 0.0
+        self._min      = None
+        self._max      = None
+        self._bin_edges = None
+        if bin_edges is not None:
+            self._bin_edges = np.asarray(bin_edges, dtype=float)
+            self._counts    = np.zeros(len(self._bin_edges) - 1, dtype=np.int64)
+            self._underflow = 0
+            self._overflow  = 0
+
+    def add(self, num_steps, target_hit=None):
+        """
+        Adds a batch of walk results. num_steps is array of steps taken by each
+        walk, target_hit array of flags (None => all walks reached target)
+        """
+        num_steps = np.asarray(num_steps)
+        if target_hit is not None:
+            target_hit = np.asarray(target_hit, dtype=bool)
+            self._num_miss += int(num_steps.size - np.count_nonzero(target_hit))
+            num_steps = num_steps[target_hit]
+        if num_steps.size == 0:
+            return
+        batch_mean = np.mean(num_steps, dtype=float)
+        batch_m2   = np.sum((num_steps - batch_mean)**2)
+        self._combine(num_steps.size, batch_mean, batch_m2,
+                      np.min(num_steps).item(), np.max(num_steps).item())
+        if self._bin_edges is not None:
+            counts, _ = np.histogram(num_steps, self._bin_edges)
+            self._counts    += counts
+            self._underflow += int(np.count_nonzero(num_steps < self._bin_edges[0]))
+            self._overflow  += int(np.count_nonzero(num_steps > self._bin_edges[-1]))
+
+    def merge(self, other):
+        """
+        Adds the results accumulated by other WalkStatistics object (with the
+        same bin edges) to this one
+        """
+        if (self._bin_edges is None) != (other._bin_edges is None) or \
+           (self._bin_edges is not None and not np.array_equal(self._bin_edges, other._bin_edges)):
+            raise ValueError('Cannot merge statistics with different histogram bins')
+        self._num_miss += other._num_miss
+        if other._num_hit:
+            self._combine(other._num_hit, other._mean, other._m2, other._min, other._max)
+        if self._bin_edges is not None:
+            self._counts    += other._counts
+            self._underflow += other._underflow
+            self._overflow  += other._overflow
+
+    def _combine(self, count, mean, m2, low, high):
+        """
+        Combines running moments with those of another set of walks
+        """
+        total = self._num_hit + count
+        delta = mean - self._mean
+        self._mean += delta * count / total
+        self._m2   += m2 + delta**2 * self._num_hit * count / total
+        self._num_hit = total
+        self._min = low if self._min is None else min(self._min, low)
+        self._max = high if self._max is None else max(self._max, high)
+
+    def to_dict(self):
+        """
+        Returns the accumulated state as dictionary of plain Python values
+        """
+        data = {'num_hit': self._num_hit, 'num_miss': self._num_miss,
+                'mean': self._mean, 'm2': self._m2, 'min': self._min, 'max': self._max,
+                'bin_edges': None}
+        if self._bin_edges is not None:
+            data.update({'bin_edges': self._bin_edges.tolist(),
+                         'counts'   : self._counts.tolist(),
+                         'underflow': self._underflow,
+                         'overflow' : self._overflow})
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Returns WalkStatistics object with the state given by to_dict()
+        """
+        stats = cls(data['bin_edges'])
+        stats._num_hit  = int(data['num_hit'])
+        stats._num_miss = int(data['num_miss'])
+        stats._mean     = float(data['mean'])
+        stats._m2       = float(data['m2'])
+        stats._min      = data['min']
+        stats._max      = data['max']
+        if data['bin_edges'] is not None:
+            stats._counts    = np.array(data['counts'], dtype=np.int64)
+            stats._underflow = int(data['underflow'])
+            stats._overflow  = int(data['overflow'])
+        return stats
+
+    def get_num_walks(self):
+        """
+        Returns total number of walks added
+        """
+        return self._num_hit + self._num_miss
+
+    def get_num_hit(self):
+        """
+        Returns number of walks that reached target
+        """
+        return self._num_hit
+
+    def get_num_miss(self):
+        """
+        Returns number of walks that used up max_steps without reaching target
+        """
+        return self._num_miss
+
+    def get_mean(self):
+        """
+        Returns average number of steps to target (nan if no walk hit)
+        """
+        return self._mean if self._num_hit else np.nan
+
+    def get_variance(self):
+        """
+        Returns variance of number of steps to target (nan if no walk hit)
+        """
+        return self._m2 / self._num_hit if self._num_hit else np.nan
+
+    def get_std(self):
+        """
+        Returns standard deviation of number of steps to target
+        """
+        return np.sqrt(self.get_variance())
+
+    def get_min(self):
+        """
+        Returns smallest number of steps to target (None if no walk hit)
+        """
+        return self._min
+
+    def get_max(self):
+        """
+        Returns largest number of steps to target (None if no walk hit)
+        """
+        return self._max
+
+    def get_histogram(self):
+        """
+        Returns (counts, bin_edges) of the steps to target histogram
+        """
+        if self._bin_edges is None:
+            raise ValueError('Statistics were collected without histogram bins')
+        return self._counts, self._bin_edges
+
+    def plot_histogram(self, ax, color='red'):
+        """
+        Plots histogram of steps to target on matplotlib axes
+        """
+        counts, edges = self.get_histogram()
+        ax.hist(edges[:-1], bins=edges, weights=counts, color=color)
@@ -0,0 +1,120 @@
+"""
+  Random step source (StepSource3d) for 3D random walks.
+
+  rand_grid and rand_direct in randwalk3d_class.py draw every step from the
+  global random module, one step per call. A StepSource3d draws unit steps
+  in blocks from a seeded numpy.random.Generator and refills lazily. It can
+  be called with no arguments like rand_grid/rand_direct, so it can be
+  passed to RandomWalk3d as rand_function, and it hands out whole (n,3)
+  blocks with next_block(n) for the vectorized engines.
+"""
+
+import numpy as np
+import randwalk3d_class as rw3d
+
+STEP_KINDS = ('grid', 'direct')
+
+GRID_STEPS = np.array([(1,0,0),(-1,0,0),(0,1,0),(0,-1,0),(0,0,1),(0,0,-1)],
+                      dtype=float)
+
+def grid_steps(rng, n):
+    """
+    Returns (n,3) array of unit steps on the (x,y,z) grid, the vectorized
+    counterpart of rand_grid
+    """
+    return GRID_STEPS[rng.integers(0, 6, size=n)]
+
+def direct_steps(rng, n):
+    """
+    Returns (n,3) array of unit steps in random directions on the unit
+    sphere, the vectorized counterpart of rand_direct
+    """
+    steps = rng.standard_normal((n, 3))
+    steps /= np.sqrt(np.einsum('ij,ij->i', steps, steps))[:, None]
+    return steps
+
+#  Step kind drawn by each scalar step function of randwalk3d_class
+FUNCTION_KINDS = {rw3d.rand_grid: 'grid', rw3d.rand_direct: 'direct'}
+
+def step_source(rand_function, rng=None, block_size=4096):
+    """
+    Returns StepSource3d drawing the same kind of steps as rand_function
+    (rand_grid, rand_direct or a StepSource3d) from rng. A StepSource3d is
+    returned unchanged if rng is None or its own generator, otherwise a new
+    source of its kind draws from rng, so that runs seeded differently (e.g.
+    the chunks of randwalk3d_montecarlo.py) do not replay the same steps.
+    """
+    if isinstance(rand_function, StepSource3d):
+        if rng is None or rng is rand_function.get_rng():
+            return rand_function
+        return StepSource3d(rand_function.get_kind(), rng, rand_function.get_block_size())
+    if rand_function not in FUNCTION_KINDS:
+        raise ValueError('No step source for step function ' + repr(rand_function))
+    return StepSource3d(FUNCTION_KINDS[rand_function], rng, block_size)
+
+
+class StepSource3d:
+    """
+    Class to represent a seeded stream of unit random steps, drawn in blocks
+    """
+
+    def __init__(self, kind='direct', rng=None, block_size=4096):
+        """
+        Initializes the StepSource3d class object:
+            kind      : 'grid' for grid steps (as rand_grid), 'direct' for
+                        steps in random directions (as rand_direct)
+            rng       : numpy.random.Generator, or seed for a new one
+            block_size: number of steps drawn at a time for single calls
+        """
+        if kind not in STEP_KINDS:
+            raise ValueError('kind must be one of ' + ', '.join(STEP_KINDS))
+        self._kind       = kind
+        self._rng        = np.random.default_rng(rng)
+        self._block_size = block_size
+        self._steps      = []
+        self._used       = 0
+
+    def __call__(self):
+        """
+        Returns next unit step (x,y,z), like rand_grid and rand_direct
+        """
+        if self._used == len(self._steps):
+            self._steps = list(map(tuple, self.next_block(self._block_size).tolist()))
+            self._used  = 0
+        self._used += 1
+        return self._steps[self._used - 1]
+
+    def get_kind(self):
+        """
+        Returns kind of steps drawn ('grid' or 'direct')
+        """
+        return self._kind
+
+    def get_rng(self):
+        """
+        Returns the numpy.random.Generator steps are drawn from
+        """
+        return self._rng
+
+    def get_block_size(self):
+        """
+        Returns number of steps drawn at a time for single calls
+        """
+        return self._block_size
+
+    def next_block(self, n):
+        """
+        Returns (n,3) array of the next n unit steps
+        """
+        if self._kind == 'grid':
+            return GRID_STEPS[self.next_indices(n)]
+        return direct_steps(self._rng, n)
+
+    def next_indices(self, n):
+        """
+        Returns array of the next n grid steps as indices 0-5 into GRID_STEPS
+        (grid steps only)
+        """
+        if self._kind != 'grid':
+            raise ValueError('Step indices are only defined for grid steps')
+        return self._rng.integers(0, 6, size=n)
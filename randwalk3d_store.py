@@ -0,0 +1,135 @@
+"""
+  Columnar store (ResultStore) of individual random walk outcomes.
+
+  Every walk of a simulation is kept as one row of the columns
+        steps       : number of steps taken
+        hit         : True if the walk reached the target
+        end_x, end_y, end_z : final position of the walker
+        chunk       : index of the chunk of walks the walk ran in
+        wall_time   : seconds taken by that chunk
+  Walks are grouped by config: a hash identifying the simulation settings
+  (e.g. randwalk3d_sweep.cell_key). The chunk index together with the seed
+  of the config recreates the random stream of the walk
+  (randwalk3d_montecarlo.chunk_tasks).
+
+  On disk a store is a directory with one subdirectory per config, holding
+  config.json (description of the simulation, including its seed) and one
+  compressed .npz file per chunk:
+
+        store/<config>/config.json
+        store/<config>/chunk-000000.npz
+        store/<config>/chunk-000001.npz  ...
+
+  The store is append-only: chunks are written once, atomically, and a chunk
+  written again (e.g. after a resumed run) replaces an identical file. Each
+  column of an .npz file is decompressed separately, so load() reads only the
+  requested columns of the requested configs.
+"""
+
+import glob
+import io
+import json
+import os
+import numpy as np
+import randwalk3d_checkpoint as ckpt
+
+COLUMNS = ('steps', 'hit', 'end_x', 'end_y', 'end_z', 'chunk', 'wall_time')
+
+
+class ResultStore:
+    """
+    Class to represent a directory of per-walk outcomes, stored by config and chunk
+    """
+
+    def __init__(self, path):
+        """
+        Initializes the ResultStore class object:
+            path : directory of the store (created when first written)
+        """
+        self._path = path
+
+    def get_path(self):
+        """
+        Returns directory of the store
+        """
+        return self._path
+
+    def add_config(self, key, info):
+        """
+        Records description info (dictionary of JSON-compatible values, e.g.
+        the sweep parameters and seed) of config key
+        """
+        directory = os.path.join(self._path, key)
+        os.makedirs(directory, exist_ok=True)
+        ckpt.atomic_write(os.path.join(directory, 'config.json'),
+                          json.dumps(info, indent=1, sort_keys=True))
+
+    def get_configs(self):
+        """
+        Returns dictionary of description of every config in the store, by key
+        """
+        configs = {}
+        for name in sorted(glob.glob(os.path.join(self._path, '*', 'config.json'))):
+            with open(name) as f:
+                configs[os.path.basename(os.path.dirname(name))] = json.load(f)
+        return configs
+
+    def write_chunk(self, key, chunk, num_steps, target_hit, end_loc, wall_time):
+        """
+        Writes outcomes of the walks of chunk (index) of config key:
+            num_steps, target_hit : arrays with one entry per walk
+            end_loc               : (N,3) array of final positions
+            wall_time             : seconds taken by the chunk
+        """
+        directory = os.path.join(self._path, key)
+        os.makedirs(directory, exist_ok=True)
+        end_loc = np.asarray(end_loc, dtype=float).reshape(-1, 3)
+        num_walks = len(end_loc)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer,
+                            steps=np.asarray(num_steps, dtype=np.int64),
+                            hit=np.asarray(target_hit, dtype=bool),
+                            end_x=end_loc[:, 0], end_y=end_loc[:, 1], end_z=end_loc[:, 2],
+                            chunk=np.full(num_walks, chunk, dtype=np.int32),
+                            wall_time=np.full(num_walks, wall_time, dtype=float))
+        ckpt.atomic_write(os.path.join(directory, 'chunk-%06d.npz' % chunk),
+                          buffer.getvalue())
+
+    def select(self, where=None):
+        """
+        Returns keys of the configs whose description matches every entry
+        of dictionary where (None => all configs). Entries are looked up in
+        the description itself and in its 'params' entry, e.g.
+        where={'radius': 10.0} or where={'sweep': 'sphere_radius'}.
+        """
+        keys = []
+        for key, info in self.get_configs().items():
+            values = dict(info.get('params', {}), **info)
+            if all(name in values and values[name] == value
+                   for name, value in (where or {}).items()):
+                keys.append(key)
+        return keys
+
+    def load(self, columns=('steps', 'hit'), where=None, keys=None):
+        """
+        Returns dictionary of the requested columns (arrays with one entry
+        per walk, in config and chunk order) of the configs given by keys or
+        selected by where (see select). Column 'config' gives the config key
+        of each walk.
+        """
+        if keys is None:
+            keys = self.select(where)
+        stored = [name for name in columns if name != 'config']
+        for name in stored:
+            if name not in COLUMNS:
+                raise ValueError('Unknown column %r, columns are %s' % (name, ', '.join(COLUMNS)))
+        parts = dict((name, []) for name in columns)
+        for key in keys:
+            for name in sorted(glob.glob(os.path.join(self._path, key, 'chunk-*.npz'))):
+                with np.load(name) as data:
+                    for column in stored:
+                        parts[column].append(data[column])
+                    if 'config' in parts:
+                        parts['config'].append(np.full(len(data['hit']), key))
+        return dict((name, np.concatenate(arrays) if arrays else np.array([]))
+                    for name, arrays in parts.items())
@@ -0,0 +1,683 @@
+"""
+  Declarative parameter sweeps of 3D random walk simulations.
+
+  A sweep is described by a config file (JSON, TOML or YAML) giving the
+  boundary and target shapes, the step function, the walk settings and the
+  parameter values to sweep over. Shape parameters may be expressions of the
+  sweep parameters, e.g. "radius / 6". Example (JSON):
+
+      {"name": "sphere_radius",
+       "num_sim": 1000, "max_steps": 500000000, "seed": 2017,
+       "step": "direct", "start_loc": [0, 0, 0], "move_target": false,
+       "boundary": {"shape": "Sphere", "location": [0, 0, 0], "radius": "radius"},
+       "target":   {"shape": "Sphere", "radius": "radius / 6",
+                    "location": ["radius / 2", "radius / 2", "radius / 2"]},
+       "grid": {"radius": [10, 15, 20, 25, 30]}}
+
+  "grid" values are combined as a cartesian product, "zip" lists of equal
+  length are taken together (e.g. matching major/minor axes). Compound
+  shapes are given as {"shape": "Difference3d", "shapes": [spec1, spec2]}.
+  Boxes and ellipsoids take a "rotation", e.g. [0, 0, "angle"] (degrees).
+
+  Each combination of parameters (a cell) is run with run_simulations on a
+  shared process pool, and one row of statistics per cell is appended to a
+  CSV results table. Cells already in the table are skipped, so an
+  interrupted sweep picks up where it stopped. Within a cell, the finished
+  chunks are checkpointed (randwalk3d_checkpoint.py) next to the table and
+  with resume (--resume) only the missing chunks are run again, giving the
+  same numbers as an uninterrupted run. The outcome of every single walk
+  can also be kept in a columnar ResultStore (randwalk3d_store.py, --store)
+  for later analysis without running the walks again. Plotting the table
+  is a separate step (plot_results, or the 'plot' command).
+
+  Instead of a fixed num_sim, run_adaptive (--rel-width, or an "adaptive"
+  section in the config) runs each cell in rounds of chunks until the
+  confidence interval of its mean steps to target is narrow enough,
+  optionally within a time budget, giving the rounds to the noisiest cells:
+      "adaptive": {"rel_width": 0.01, "confidence": 0.95, "budget": 3600,
+                   "max_sim": 1000000}
+
+  Command line:
+      python randwalk3d_sweep.py run sweeps/sphere_radius.json [-o results.csv] [--resume]
+                                                        [--store walks/]
+      python randwalk3d_sweep.py run sweeps/sphere_radius.json --rel-width 0.01 [--budget 600]
+      python randwalk3d_sweep.py plot results.csv -c sweeps/sphere_radius.json
+"""
+
+import argparse
+import ast
+import csv
+import io
+import hashlib
+import itertools
+import json
+import math
+import operator
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import shapes3d_class as shapes
+import randwalk3d_class as rw3d
+import randwalk3d_montecarlo as mc
+import randwalk3d_checkpoint as ckpt
+from randwalk3d_stats import WalkStatistics
+from randwalk3d_store import ResultStore
+
+STEP_FUNCTIONS = {'grid': rw3d.rand_grid, 'direct': rw3d.rand_direct}
+SHAPES = {'Sphere': shapes.Sphere, 'Ellipsoid': shapes.Ellipsoid,
+          'Rectangle3d': shapes.Rectangle3d}
+COMPOUND_SHAPES = {'Union3d': shapes.Union3d, 'Intersection3d': shapes.Intersection3d,
+                   'Difference3d': shapes.Difference3d}
+CHECKPOINT_EVERY = 60.0     # Seconds between checkpoints of unfinished cells
+REL_WIDTH    = 0.01     # Adaptive runs: target relative CI half-width of the mean
+CONFIDENCE   = 0.95     # Adaptive runs: confidence level of the interval
+MIN_CHUNKS   = 2        # Adaptive runs: chunks run in every cell before deciding
+ROUND_CHUNKS = 8        # Adaptive runs: chunks handed out per round
+MAX_CHUNKS   = 10000    # Adaptive runs: chunks per cell when max_sim is not given
+STAT_COLUMNS = ['num_sim', 'num_hit', 'num_miss', 'mean', 'std', 'sem', 'min', 'max',
+                'cpu_time', 'rel_width', 'stop']
+
+_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+              ast.Div: operator.truediv, ast.Pow: operator.pow, ast.USub: operator.neg,
+              ast.UAdd: operator.pos}
+_FUNCTIONS = {'sqrt': math.sqrt, 'pi': math.pi}
+
+def load_config(path):
+    """
+    Reads sweep config from a .json, .toml or .yaml/.yml file
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib     # Same API before Python 3.11
+            except ImportError:
+                raise ImportError('TOML configs need Python 3.11 or the tomli package') from None
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        if ext in ('.yaml', '.yml'):
+            import yaml         # Optional dependency, only for YAML configs
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def evaluate(value, params):
+    """
+    Returns value with every string replaced by the value of the arithmetic
+    expression it holds, in terms of the sweep parameters params
+    """
+    if isinstance(value, str):
+        return _evaluate_node(ast.parse(value, mode='eval').body, params)
+    if isinstance(value, (list, tuple)):
+        return [evaluate(item, params) for item in value]
+    return value
+
+def _evaluate_node(node, params):
+    """
+    Evaluates a parsed expression allowing only numbers, parameters,
+    + - * / ** and sqrt()
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.Name):
+        if node.id in params:
+            return params[node.id]
+        if node.id in _FUNCTIONS:
+            return _FUNCTIONS[node.id]
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate_node(node.left, params),
+                                         _evaluate_node(node.right, params))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate_node(node.operand, params))
+    if isinstance(node, ast.Call) and not node.keywords:
+        func = _evaluate_node(node.func, params)
+        if callable(func):
+            return func(*[_evaluate_node(arg, params) for arg in node.args])
+    raise ValueError('Unsupported expression: ' + ast.dump(node))
+
+def build_shape(spec, params):
+    """
+    Returns shape object described by spec (None => no shape)
+    """
+    if spec is None:
+        return None
+    spec = dict(spec)
+    name = spec.pop('shape')
+    if name in COMPOUND_SHAPES:
+        return COMPOUND_SHAPES[name](*[build_shape(part, params) for part in spec['shapes']])
+    if name not in SHAPES:
+        raise ValueError('Unknown shape ' + repr(name))
+    kwargs = dict((key, evaluate(value, params)) for key, value in spec.items())
+    if 'location' in kwargs:
+        kwargs['location'] = tuple(float(x) for x in kwargs['location'])
+    return SHAPES[name](**kwargs)
+
+def expand_cells(config):
+    """
+    Returns list of parameter dictionaries, one per cell of the sweep
+    """
+    grid = config.get('grid', {})
+    zipped = config.get('zip', {})
+    lengths = set(len(values) for values in zipped.values())
+    if len(lengths) > 1:
+        raise ValueError('All "zip" parameter lists must have the same length')
+    zip_rows = [dict(zip(zipped, row)) for row in zip(*zipped.values())] if zipped else [{}]
+    cells = []
+    for grid_row in itertools.product(*grid.values()):
+        for zip_row in zip_rows:
+            params = dict(zip(grid, grid_row))
+            params.update(zip_row)
+            cells.append(params)
+    return cells
+
+def cell_key(config, params):
+    """
+    Returns hash identifying a cell: the sweep settings and its parameters
+    """
+    settings = dict((key, value) for key, value in config.items()
+                    if key not in ('grid', 'zip', 'plot'))
+    text = json.dumps({'settings': settings, 'params': params}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+def cell_simulation(config, params):
+    """
+    Returns run_simulations config dictionary for one cell of the sweep
+    """
+    boundary = build_shape(config.get('boundary'), params)
+    target   = build_shape(config.get('target'), params)
+    if boundary is not None and target is not None and \
+       not boundary.check_inside(target.get_location()):
+        raise ValueError('Target %s is not inside boundary %s for %s' % (target, boundary, params))
+    return {'start_loc'    : tuple(float(x) for x in evaluate(config.get('start_loc', [0, 0, 0]), params)),
+            'max_steps'    : int(evaluate(config['max_steps'], params)),
+            'rand_function': STEP_FUNCTIONS[config.get('step', 'direct')],
+            'boundary'     : boundary,
+            'target'       : target,
+            'move_target'  : config.get('move_target', False),
+            'accelerated'  : config.get('accelerated', False),
+            'lattice'      : config.get('lattice', False)}
+
+def cell_seed(config, key):
+    """
+    Returns seed of a cell, derived from the sweep seed and the cell key
+    """
+    seed = config.get('seed')
+    entropy = [int(key, 16)]
+    return entropy if seed is None else [int(seed)] + entropy
+
+def cell_info(config, params, key, chunk_size=mc.CHUNK_SIZE):
+    """
+    Returns description of a cell kept with its walks in a ResultStore:
+    sweep name, parameters, settings, seed and chunk size
+    """
+    settings = dict((name, value) for name, value in config.items()
+                    if name not in ('grid', 'zip', 'plot'))
+    return {'sweep': config.get('name', ''), 'cell': key, 'params': params,
+            'settings': settings, 'seed': cell_seed(config, key), 'chunk_size': chunk_size}
+
+def read_results(path):
+    """
+    Returns rows of a CSV results table as list of dictionaries (empty list
+    if the file does not exist)
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+def write_results(path, rows):
+    """
+    Atomically writes rows (list of dictionaries) as CSV results table
+    """
+    fieldnames = []
+    for row in rows:
+        fieldnames.extend(key for key in row if key not in fieldnames)
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=fieldnames)
+    writer.writeheader()
+    writer.writerows(rows)
+    ckpt.atomic_write(path, text.getvalue())
+
+def stats_row(config, key, params, stats, cpu_time):
+    """
+    Returns results table row for a cell from its WalkStatistics
+    """
+    row = {'sweep': config.get('name', ''), 'cell': key}
+    row.update(params)
+    num_hit = stats.get_num_hit()
+    row.update({'num_sim' : stats.get_num_walks(),
+                'num_hit' : num_hit,
+                'num_miss': stats.get_num_miss(),
+                'mean'    : stats.get_mean(),
+                'std'     : stats.get_std(),
+                'sem'     : stats.get_std() / np.sqrt(num_hit) if num_hit else np.nan,
+                'min'     : stats.get_min(),
+                'max'     : stats.get_max(),
+                'cpu_time': cpu_time})
+    return row
+
+def _timed_chunk(task, store=None, key=None, index=None):
+    """
+    Runs one chunk of walks (run_chunk arguments), writing the outcome of
+    each walk to ResultStore store (if given) as chunk index of config key.
+    Returns (WalkStatistics, seconds taken).
+    """
+    config, num_walks, seed_seq, bin_edges = task
+    start = time.perf_counter()
+    num_steps, target_hit, end_loc = mc.conduct_chunk(config, num_walks, seed_seq)
+    stats = WalkStatistics(bin_edges)
+    stats.add(num_steps, target_hit)
+    seconds = time.perf_counter() - start
+    if store is not None:
+        store.write_chunk(key, index, num_steps, target_hit, end_loc, seconds)
+    return stats, seconds
+
+def _completed_chunks(pool, jobs, store=None, pending=None):
+    """
+    Runs jobs (cell number, cell key, chunk index, run_chunk arguments) in
+    this process (pool None) or on pool. Yields (cell number, chunk index,
+    (WalkStatistics, seconds)) as chunks finish. Futures submitted to pool
+    are added to list pending, so they can be cancelled by _stop_pool.
+    """
+    if pool is None:
+        for num, key, index, task in jobs:
+            yield num, index, _timed_chunk(task, store, key, index)
+        return
+    futures = dict((pool.submit(_timed_chunk, task, store, key, index), (num, index))
+                   for num, key, index, task in jobs)
+    if pending is not None:
+        pending.extend(futures)
+    for future in as_completed(futures):
+        num, index = futures[future]
+        yield num, index, future.result()
+
+def _stop_pool(pool, pending):
+    """
+    Cancels the futures in pending that have not started and shuts pool
+    down (pool None => nothing to do)
+    """
+    if pool is None:
+        return
+    for future in pending:
+        future.cancel()
+    pool.shutdown()
+
+def run_sweep(config, output, workers=None, chunk_size=mc.CHUNK_SIZE, resume=False,
+              checkpoint=None, checkpoint_every=CHECKPOINT_EVERY, store=None):
+    """
+    Runs every cell of the sweep not yet in the CSV results table 'output'
+    on a pool of 'workers' processes (None => one per CPU, 1 => in this
+    process), adding one row per finished cell. Returns rows of all cells.
+
+    Progress of unfinished cells is saved to checkpoint (None => output
+    + '.ckpt') at most every checkpoint_every seconds, when a cell finishes
+    and when the run stops (also on errors or Ctrl-C). With resume=True the
+    finished chunks in the checkpoint are not run again; the final numbers
+    are the same as those of an uninterrupted run.
+
+    If store (directory of a ResultStore) is given, the outcome of every
+    walk is kept there under the cell key, for later analysis.
+    """
+    checkpoint = checkpoint or output + '.ckpt'
+    table = read_results(output)
+    done  = dict((row['cell'], row) for row in table)
+    saved = {}
+    if resume:
+        state = ckpt.load_checkpoint(checkpoint)
+        if state is not None and state.get('chunk_size') == chunk_size:
+            saved = state['cells']
+    if store is not None:
+        store = ResultStore(store)
+    cells, mergers, jobs = [], {}, []
+    for params in expand_cells(config):
+        key = cell_key(config, params)
+        if key in done:
+            continue
+        tasks = mc.chunk_tasks(cell_simulation(config, params), int(config['num_sim']),
+                               cell_seed(config, key), chunk_size)
+        merger = ckpt.ChunkMerger(len(tasks))
+        if key in saved and saved[key]['num_chunks'] == len(tasks):
+            merger = ckpt.ChunkMerger.from_dict(saved[key])
+        mergers[key] = merger
+        if store is not None:
+            store.add_config(key, cell_info(config, params, key, chunk_size))
+        jobs.extend((len(cells), key, index, task) for index, task in enumerate(tasks)
+                    if not merger.is_done(index))
+        cells.append((key, params))
+
+    def save():
+        """
+        Saves progress of the unfinished cells
+        """
+        ckpt.save_checkpoint(checkpoint, {'sweep': config.get('name', ''),
+                                          'chunk_size': chunk_size,
+                                          'cells': dict((key, merger.to_dict())
+                                                        for key, merger in mergers.items())})
+
+    def finish(key, params):
+        """
+        Adds the row of a finished cell to the results table
+        """
+        merger = mergers.pop(key)
+        row = stats_row(config, key, params, merger.get_statistics(), merger.get_cpu_time())
+        table.append(row)
+        write_results(output, table)
+        done[key] = row
+
+    pool = None
+    if jobs and workers != 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    pending = []        # Futures submitted to pool
+    last_save = time.monotonic()
+    try:
+        for key, params in cells:
+            if mergers[key].is_done():
+                finish(key, params)
+        for num, index, (stats, seconds) in _completed_chunks(pool, jobs, store, pending):
+            key, params = cells[num]
+            mergers[key].add(index, stats, seconds)
+            if mergers[key].is_done():
+                # Table first: a cell in the table is never run again
+                finish(key, params)
+            elif time.monotonic() - last_save < checkpoint_every:
+                continue
+            save()
+            last_save = time.monotonic()
+    finally:
+        _stop_pool(pool, pending)
+        if mergers:
+            save()
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return [done[cell_key(config, params)] for params in expand_cells(config)]
+
+def relative_half_width(stats, confidence=CONFIDENCE):
+    """
+    Returns half-width of the normal confidence interval of the mean steps
+    to target in WalkStatistics stats, relative to the mean (inf if fewer
+    than two walks hit the target)
+    """
+    num_hit = stats.get_num_hit()
+    if num_hit < 2 or stats.get_mean() <= 0:
+        return math.inf
+    z = statistics.NormalDist().inv_cdf(0.5 + 0.5 * confidence)
+    return z * stats.get_std() / math.sqrt(num_hit) / stats.get_mean()
+
+def allocate_chunks(widths, num_done, rel_width, max_chunks, round_chunks=ROUND_CHUNKS):
+    """
+    Distributes up to round_chunks new chunks over cells. widths and
+    num_done give the relative half-width and finished chunks of each cell
+    (by key). Each chunk goes to the cell with the widest interval projected
+    from the chunks given so far (half-width falls as 1/sqrt(chunks)), until
+    every cell is projected to reach rel_width or max_chunks. Returns
+    dictionary of new chunks by cell key.
+    """
+    new = dict((key, 0) for key in widths)
+    for _ in range(round_chunks):
+        projected = [(widths[key] * math.sqrt(num_done[key] / (num_done[key] + new[key])), key)
+                     for key in widths if num_done[key] + new[key] < max_chunks]
+        if not projected:
+            break
+        width, key = max(projected)
+        if width <= rel_width:
+            break
+        new[key] += 1
+    return dict((key, num) for key, num in new.items() if num)
+
+def adaptive_settings(config, rel_width=None, confidence=None, budget=None, max_sim=None):
+    """
+    Returns settings of an adaptive run: the arguments given, else the
+    "adaptive" section of config, else the defaults
+    """
+    section = config.get('adaptive') or {}
+    def choose(value, name, default):
+        return value if value is not None else section.get(name, default)
+    return {'rel_width' : float(choose(rel_width, 'rel_width', REL_WIDTH)),
+            'confidence': float(choose(confidence, 'confidence', CONFIDENCE)),
+            'budget'    : choose(budget, 'budget', None),
+            'max_sim'   : choose(max_sim, 'max_sim', None)}
+
+def run_adaptive(config, output, rel_width=None, confidence=None, budget=None, max_sim=None,
+                 workers=None, chunk_size=mc.CHUNK_SIZE, resume=False, checkpoint=None,
+                 store=None, round_chunks=ROUND_CHUNKS):
+    """
+    Runs every cell of the sweep until the confidence interval (at level
+    confidence) of its mean steps to target is narrower than rel_width
+    times the mean, instead of a fixed num_sim. Settings not given come
+    from the "adaptive" section of config.
+
+    Chunks run in rounds of round_chunks on a pool of 'workers' processes
+    (None => one per CPU, 1 => in this process). Every cell starts with
+    MIN_CHUNKS chunks; after that each round goes to the cells with the
+    widest projected intervals (allocate_chunks). A cell stops when its
+    interval is narrow enough ('converged') or after max_sim walks
+    ('max_sim'). No round starts after budget seconds; the cells still
+    open then stop as 'budget'. Decisions only depend on finished rounds,
+    so results do not depend on the number of workers.
+
+    Rows (with the relative half-width and the stop reason) are written to
+    the CSV results table output. State is checkpointed after every round;
+    with resume=True cells continue from the checkpoint, including cells
+    stopped by the budget of an earlier run. store is as for run_sweep.
+    Returns rows of all cells.
+    """
+    checkpoint = checkpoint or output + '.ckpt'
+    settings = adaptive_settings(config, rel_width, confidence, budget, max_sim)
+    max_chunks = MAX_CHUNKS
+    if settings['max_sim'] is not None:
+        max_chunks = max(MIN_CHUNKS, int(math.ceil(float(settings['max_sim']) / chunk_size)))
+    # Cells are identified by everything that decides their results
+    keyed = dict((name, value) for name, value in config.items()
+                 if name not in ('num_sim', 'adaptive'))
+    keyed['adaptive'] = {'rel_width': settings['rel_width'],
+                         'confidence': settings['confidence'], 'max_chunks': max_chunks,
+                         'round_chunks': round_chunks, 'chunk_size': chunk_size}
+    table = read_results(output)
+    done  = dict((row['cell'], row) for row in table)
+    saved = {}
+    if resume:
+        state = ckpt.load_checkpoint(checkpoint)
+        if state is not None and state.get('chunk_size') == chunk_size:
+            saved = state['cells']
+    if store is not None:
+        store = ResultStore(store)
+    cells, mergers = {}, {}
+    for params in expand_cells(config):
+        key = cell_key(keyed, params)
+        if key in done and done[key].get('stop') != 'budget':
+            continue
+        cells[key] = (params, cell_simulation(config, params), cell_seed(keyed, key))
+        mergers[key] = ckpt.ChunkMerger(max_chunks)
+        if key in saved:
+            mergers[key] = ckpt.ChunkMerger.from_dict(saved[key])
+        if store is not None:
+            store.add_config(key, cell_info(keyed, params, key, chunk_size))
+
+    def round_state():
+        """
+        Returns checkpoint of the open cells after a finished round
+        """
+        return {'sweep': config.get('name', ''), 'chunk_size': chunk_size,
+                'cells': dict((key, merger.to_dict()) for key, merger in mergers.items())}
+
+    def finish(key, width, stop):
+        """
+        Adds (or replaces) the row of a stopped cell in the results table
+        """
+        merger = mergers[key] if stop == 'budget' else mergers.pop(key)
+        row = stats_row(config, key, cells[key][0], merger.get_statistics(),
+                        merger.get_cpu_time())
+        row.update({'rel_width': width, 'stop': stop})
+        table[:] = [old for old in table if old['cell'] != key] + [row]
+        write_results(output, table)
+        done[key] = row
+
+    pool = None
+    if cells and workers != 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    start = time.monotonic()
+    state = round_state()
+    keys  = list(cells)
+    pending = []        # Futures submitted to pool
+    try:
+        open_cells = list(keys)
+        while open_cells:
+            widths, num_done = {}, {}
+            for key in list(open_cells):
+                stats = mergers[key].get_statistics()
+                num_done[key] = mergers[key].get_num_merged()
+                widths[key] = relative_half_width(stats, settings['confidence'])
+                if num_done[key] < MIN_CHUNKS:
+                    widths[key] = math.inf
+                    continue
+                if widths[key] <= settings['rel_width']:
+                    stop = 'converged'
+                elif num_done[key] >= max_chunks:
+                    stop = 'max_sim'
+                else:
+                    continue
+                finish(key, widths[key], stop)
+                open_cells.remove(key)
+            if not open_cells:
+                break
+            if settings['budget'] is not None and time.monotonic() - start >= settings['budget']:
+                for key in open_cells:
+                    finish(key, widths[key], 'budget')
+                break
+            # First rounds bring every cell to MIN_CHUNKS chunks
+            new = dict((key, MIN_CHUNKS - num_done[key]) for key in open_cells
+                       if num_done[key] < MIN_CHUNKS)
+            if not new:
+                new = allocate_chunks(dict((key, widths[key]) for key in open_cells),
+                                      num_done, settings['rel_width'], max_chunks, round_chunks)
+            jobs = []
+            for key, num in new.items():
+                simulation, seed = cells[key][1], cells[key][2]
+                for index in range(num_done[key], num_done[key] + num):
+                    # Same stream as chunk index of mc.chunk_tasks
+                    task = (simulation, chunk_size,
+                            np.random.SeedSequence(seed, spawn_key=(index,)), None)
+                    jobs.append((keys.index(key), key, index, task))
+            for num, index, (stats, seconds) in _completed_chunks(pool, jobs, store, pending):
+                mergers[keys[num]].add(index, stats, seconds)
+            pending.clear()     # All futures of the round are done
+            state = round_state()
+            ckpt.save_checkpoint(checkpoint, state)
+    finally:
+        _stop_pool(pool, pending)
+        if mergers:
+            # Only finished rounds are saved, so a resumed run takes the same decisions
+            ckpt.save_checkpoint(checkpoint, state)
+    if not mergers and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return [done[cell_key(keyed, params)] for params in expand_cells(config)]
+
+def print_results(rows):
+    """
+    Prints key statistics of each cell of a sweep
+    """
+    for row in rows:
+        params = ', '.join('%s = %s' % (key, value) for key, value in row.items()
+                           if key not in STAT_COLUMNS and key not in ('sweep', 'cell'))
+        print('Cell: ' + params)
+        print('   Walks reaching target           :  %s of %s ' % (row['num_hit'], row['num_sim']))
+        print('   Average number of steps to target is:  %.0f ' % float(row['mean']))
+        print('   Std deviation of number of steps  is:  %.0f ' % float(row['std']))
+        print('   Largest number of steps to target is:  %s ' % row['max'])
+        if row.get('stop'):
+            print('   Relative CI half-width of average is:  %.4f (%s)' % (float(row['rel_width']),
+                                                                      row['stop']))
+
+def plot_results(rows, plot=None, ax=None, output=None):
+    """
+    Plots bar chart of average steps to target for each cell, with standard
+    error bars, on matplotlib axes ax (new figure if None) and saves it to
+    output if given. plot is the "plot" section of the sweep config:
+        label : format of bar labels from cell parameters, e.g. "R = {radius:g}"
+        xlabel, ylabel, title : axis labels and title
+    """
+    plot = plot or {}
+    if ax is None:
+        import matplotlib
+        if output is not None:
+            matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        ax = plt.figure().add_subplot(1, 1, 1)
+    labels = []
+    for row in rows:
+        params = dict((key, _number(value)) for key, value in row.items())
+        if 'label' in plot:
+            labels.append(plot['label'].format(**params))
+        else:
+            labels.append(row['cell'])
+    y_pos = np.arange(len(rows))
+    ax.bar(y_pos, [float(row['mean']) for row in rows], align='center', alpha=1,
+           yerr=[float(row['sem']) for row in rows])
+    ax.set_xticks(y_pos)
+    ax.set_xticklabels(labels)
+    ax.set_xlabel(plot.get('xlabel', ''))
+    ax.set_ylabel(plot.get('ylabel', 'Average Steps'))
+    ax.set_title(plot.get('title', rows[0]['sweep'] if rows else ''))
+    if output is not None:
+        ax.figure.savefig(output)
+    return ax
+
+def _number(value):
+    """
+    Converts a results table entry back to a number where possible
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+def main(argv=None):
+    """
+    Command line entry point: 'run' a sweep config or 'plot' a results table
+    """
+    parser = argparse.ArgumentParser(description='Parameter sweeps of 3D random walks')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='run the cells of a sweep config')
+    run.add_argument('config')
+    run.add_argument('-o', '--output', help='CSV results table (default: <name>_results.csv)')
+    run.add_argument('-w', '--workers', type=int, default=None)
+    run.add_argument('--resume', action='store_true',
+                     help='continue unfinished cells from the checkpoint')
+    run.add_argument('--store', help='directory to keep the outcome of every walk in')
+    run.add_argument('--rel-width', type=float,
+                     help='run each cell until the relative CI half-width of its mean '
+                          'steps is below this (adaptive run, instead of num_sim)')
+    run.add_argument('--confidence', type=float, help='adaptive runs: confidence level')
+    run.add_argument('--budget', type=float, help='adaptive runs: seconds to start rounds in')
+    run.add_argument('--max-sim', type=int, help='adaptive runs: most walks per cell')
+    plot = commands.add_parser('plot', help='plot a CSV results table')
+    plot.add_argument('results')
+    plot.add_argument('-c', '--config', help='sweep config with a "plot" section')
+    plot.add_argument('-o', '--output', help='image file (default: results name + .png)')
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        config = load_config(args.config)
+        output = args.output or config.get('name', 'sweep') + '_results.csv'
+        if not args.resume and os.path.exists(output + '.ckpt'):
+            print('Starting unfinished cells over, use --resume to continue from ' +
+                  output + '.ckpt')
+        if args.rel_width is not None or 'adaptive' in config:
+            print_results(run_adaptive(config, output, args.rel_width, args.confidence,
+                                       args.budget, args.max_sim, args.workers,
+                                       resume=args.resume, store=args.store))
+        else:
+            print_results(run_sweep(config, output, args.workers, resume=args.resume,
+                                    store=args.store))
+    else:
+        config = load_config(args.config) if args.config else {}
+        output = args.output or os.path.splitext(args.results)[0] + '.png'
+        plot_results(read_results(args.results), config.get('plot'), output=output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""
+  Many targets at once (TargetSet3d), for absorption studies with hundreds
+  of small traps scattered inside the boundary.
+
+  A TargetSet3d is a shape made of many target shapes. Testing a point
+  against each of them would cost O(targets) per step; instead the bounding
+  boxes of the targets are binned once into a uniform grid of cubic cells
+  (a spatial hash kept as sorted per-cell lists of target numbers). A
+  containment query looks up the cell of each point and tests only the few
+  targets listed there, for a single point (check_inside, find_point) or a
+  whole batch of walkers (contains, find). find/find_point also tell which
+  target a point is in, so walks can report the target that absorbed them
+  (RandomWalk3d.get_target_index, RandomWalkEnsemble3d.get_target_index).
+
+  The grid also stores, for every cell, a lower bound on the distance to the
+  nearest target (from the number of empty cells around it), so walkers far
+  from all traps skip their target tests exactly as they do for a single
+  target far away (target_skip in randwalk3d_class.py).
+
+  The set moves as a whole (move, move_random, moving targets of the
+  ensemble); its target shapes must not be moved on their own. Spherical
+  targets are tested with arrays of centers and radii, other shapes with
+  their own contains.
+
+  Run this module to compare the set with a test of every target:
+
+        python randwalk3d_targets.py [num_targets] [num_walkers]
+"""
+
+import math
+import numpy as np
+import shapes3d_class as shapes
+
+MAX_CELLS = 1 << 21     # Cells of the grid at most (cell size grows to fit)
+
+def random_traps(boundary, num_traps, radius, rng=None, exclude=None):
+    """
+    Returns list of num_traps spheres of radius radius with centers drawn
+    uniformly inside boundary (its bounding box, keeping points inside),
+    none of them containing the point exclude (e.g. the start of the walks)
+    """
+    rng = np.random.default_rng(rng)
+    lower, upper = (np.asarray(corner, dtype=float) for corner in boundary.get_bounding_box())
+    centers = np.empty((0, 3))
+    while len(centers) < num_traps:
+        points = rng.uniform(lower, upper, size=(2 * num_traps, 3))
+        keep = boundary.contains(points)
+        if exclude is not None:
+            delta = points - np.asarray(exclude, dtype=float)
+            keep &= np.einsum('ij,ij->i', delta, delta) >= radius**2
+        centers = np.concatenate((centers, points[keep]))
+    return [shapes.Sphere(tuple(center), radius) for center in centers[:num_traps].tolist()]
+
+def _dilate(mask):
+    """
+    Returns boolean 3D array mask grown by one cell in every direction,
+    including diagonals
+    """
+    for axis in range(3):
+        grown = mask.copy()
+        view, source = np.moveaxis(grown, axis, 0), np.moveaxis(mask, axis, 0)
+        view[1:] |= source[:-1]
+        view[:-1] |= source[1:]
+        mask = grown
+    return mask
+
+
+class TargetSet3d(shapes.Shape3d):
+    """
+    Class to represent a set of target shapes, indexed by a uniform grid for
+    fast containment queries. Inside if inside any of the targets.
+    """
+    _color = 'r'
+
+    def __init__(self, targets, cell_size=None):
+        """
+        Initializes the set from the list of target shapes. cell_size is the
+        edge of the grid cells (None => the median bounding box edge of the
+        targets, so a typical target covers a few cells)
+        """
+        if not len(targets):
+            raise ValueError('A target set needs at least one target')
+        self._shapes = tuple(targets)
+        boxes = np.array([target.get_bounding_box() for target in self._shapes], dtype=float)
+        lower, upper = boxes[:, 0].min(axis=0), boxes[:, 1].max(axis=0)
+        shapes.Shape3d.__init__(self, tuple((0.5 * (lower + upper)).tolist()))
+        self._offset = np.zeros(3)
+        self._shift  = (0.0, 0.0, 0.0)      # Offset as floats for single points
+        if cell_size is None:
+            cell_size = float(np.median((boxes[:, 1] - boxes[:, 0]).max(axis=1)))
+        cell_size = max(cell_size, 1e-9 * max(1.0, float(np.max(upper - lower))))
+        dims = np.floor((upper - lower) / cell_size).astype(np.int64) + 1
+        while np.prod(dims) > MAX_CELLS:
+            cell_size *= (np.prod(dims) / MAX_CELLS) ** (1.0 / 3.0) * 1.01
+            dims = np.floor((upper - lower) / cell_size).astype(np.int64) + 1
+        self._lower     = lower
+        self._corner    = tuple(lower.tolist())
+        self._cell_size = float(cell_size)
+        self._dims      = dims
+        self._shape     = tuple(dims.tolist())
+        # Every target is listed in each cell its bounding box touches
+        first = np.floor((boxes[:, 0] - lower) / cell_size).astype(np.int64)
+        last  = np.minimum(np.floor((boxes[:, 1] - lower) / cell_size).astype(np.int64), dims - 1)
+        cells, items = [], []
+        for num in range(len(self._shapes)):
+            grid = np.mgrid[first[num, 0]:last[num, 0] + 1, first[num, 1]:last[num, 1] + 1,
+                            first[num, 2]:last[num, 2] + 1].reshape(3, -1)
+            cells.append((grid[0] * dims[1] + grid[1]) * dims[2] + grid[2])
+            items.append(np.full(grid.shape[1], num, dtype=np.int64))
+        cells = np.concatenate(cells)
+        order = np.argsort(cells, kind='stable')       # Targets stay in order within a cell
+        self._items = np.concatenate(items)[order]
+        counts = np.bincount(cells, minlength=int(np.prod(dims)))
+        self._start = np.concatenate(([0], np.cumsum(counts)))
+        # Cells between a cell and the nearest listed cell bound the distance
+        occupied = counts.reshape(tuple(dims)) > 0
+        rings = np.where(occupied, 0, -1)
+        ring = 0
+        while (rings < 0).any():
+            ring += 1
+            occupied = _dilate(occupied)
+            rings[occupied & (rings < 0)] = ring
+        self._clearance = (np.maximum(rings - 1, 0) * self._cell_size).ravel()
+        # Spheres are tested with arrays instead of their contains
+        self._is_sphere = np.array([isinstance(target, shapes.Sphere) for target in self._shapes])
+        self._centers = np.array([target.get_location() if sphere else (0.0, 0.0, 0.0)
+                                  for target, sphere in zip(self._shapes, self._is_sphere)],
+                                 dtype=float)
+        self._radii_sq = np.array([target.get_radius()**2 if sphere else 0.0
+                                   for target, sphere in zip(self._shapes, self._is_sphere)])
+
+    def __str__(self):
+        """
+        Creates printable output for shape
+        """
+        return "Target set of %d targets, grid of %dx%dx%d cells of size %g" % (
+            len(self._shapes), self._dims[0], self._dims[1], self._dims[2], self._cell_size)
+
+    def get_shapes(self):
+        """
+        Returns the target shapes of the set, at their initial locations
+        """
+        return self._shapes
+
+    def get_num_targets(self):
+        """
+        Returns number of targets in the set
+        """
+        return len(self._shapes)
+
+    def get_cell_size(self):
+        """
+        Returns edge of the grid cells
+        """
+        return self._cell_size
+
+    def move(self, new_location):
+        """
+        Moves the set, keeping the relative position of its targets
+        """
+        self._location = new_location
+        self._offset = np.asarray(new_location, dtype=float) - np.asarray(self._init_location,
+                                                                           dtype=float)
+        self._shift  = tuple(self._offset.tolist())
+
+    def volume(self):
+        """
+        Returns total volume of the targets (their union if they do not overlap)
+        """
+        return sum(target.volume() for target in self._shapes)
+
+    def get_bounding_box(self):
+        """
+        Returns corners of box containing all targets
+        """
+        boxes = np.array([target.get_bounding_box() for target in self._shapes], dtype=float)
+        return (tuple((boxes[:, 0].min(axis=0) + self._offset).tolist()),
+                tuple((boxes[:, 1].max(axis=0) + self._offset).tolist()))
+
+    def _cells(self, points):
+        """
+        Returns grid cell number of each of the (N,3) points (at the initial
+        location of the set), -1 outside the grid
+        """
+        coords = np.floor((points - self._lower) / self._cell_size).astype(np.int64)
+        valid = np.all((coords >= 0) & (coords < self._dims), axis=-1)
+        cells = (coords[..., 0] * self._dims[1] + coords[..., 1]) * self._dims[2] + coords[..., 2]
+        return np.where(valid, cells, -1)
+
+    def find(self, points):
+        """
+        Returns int64 array with number of the target containing each of the
+        (N,3) points (the lowest if targets overlap), -1 outside all targets
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float)) - self._offset
+        found = np.full(len(points), -1, dtype=np.int64)
+        cells = self._cells(points)
+        index = np.flatnonzero(cells >= 0)
+        start = self._start[cells[index]]
+        count = self._start[cells[index] + 1] - start
+        index, start, count = index[count > 0], start[count > 0], count[count > 0]
+        if not index.size:
+            return found
+        # One (point, target) pair per target listed in the point's cell
+        pair_point = np.repeat(index, count)
+        first = np.cumsum(count) - count
+        pair_item = self._items[np.repeat(start - first, count) + np.arange(pair_point.size)]
+        inside = np.zeros(pair_point.size, dtype=bool)
+        sphere = self._is_sphere[pair_item]
+        if sphere.any():
+            delta = points[pair_point[sphere]] - self._centers[pair_item[sphere]]
+            inside[sphere] = np.einsum('ij,ij->i', delta, delta) < self._radii_sq[pair_item[sphere]]
+        if not sphere.all():
+            other = np.flatnonzero(~sphere)
+            for item in np.unique(pair_item[other]):
+                pairs = other[pair_item[other] == item]
+                inside[pairs] = self._shapes[item].contains(points[pair_point[pairs]])
+        # Pairs run by point, then by target: keep the first hit of each point
+        hit_point, first_hit = np.unique(pair_point[inside], return_index=True)
+        found[hit_point] = pair_item[inside][first_hit]
+        return found
+
+    def contains(self, points):
+        """
+        Checks which of the points are inside any of the targets. Points is
+        array of shape (N,3); returns boolean array of shape (N,)
+        """
+        return self.find(points) >= 0
+
+    def _cell(self, point):
+        """
+        Returns grid cell number of point (x,y,z) at the initial location of
+        the set, -1 outside the grid, and the shifted point
+        """
+        (x, y, z), (ox, oy, oz), (lx, ly, lz) = point, self._shift, self._corner
+        x, y, z = x - ox, y - oy, z - oz
+        size = self._cell_size
+        cx = math.floor((x - lx) / size)
+        cy = math.floor((y - ly) / size)
+        cz = math.floor((z - lz) / size)
+        nx, ny, nz = self._shape
+        if 0 <= cx < nx and 0 <= cy < ny and 0 <= cz < nz:
+            return (cx * ny + cy) * nz + cz, (x, y, z)
+        return -1, (x, y, z)
+
+    def find_point(self, point):
+        """
+        Returns number of the target containing point (x,y,z) (the lowest if
+        targets overlap), -1 if outside all targets
+        """
+        cell, point = self._cell(point)
+        if cell < 0:
+            return -1
+        for item in self._items[self._start[cell]:self._start[cell + 1]]:
+            if self._shapes[item].check_inside(point):
+                return int(item)
+        return -1
+
+    def check_inside(self, point):
+        """
+        Checks if point is inside any of the targets. Returns True if inside,
+        False if not. Point is tuple (x,y,z)
+        """
+        return self.find_point(point) >= 0
+
+    def clearance(self, points):
+        """
+        Returns lower bound on the distance from each of the (N,3) points to
+        the nearest target (0 near a target)
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float)) - self._offset
+        cells = self._cells(points)
+        # Outside the grid: distance to the grid, which holds all targets
+        upper = self._lower + self._dims * self._cell_size
+        outside = np.maximum(np.maximum(self._lower - points, points - upper), 0.0)
+        return np.where(cells >= 0, self._clearance[cells],
+                        np.sqrt(np.einsum('ij,ij->i', outside, outside)))
+
+    def point_clearance(self, point):
+        """
+        Returns lower bound on the distance from point (x,y,z) to the nearest
+        target, as clearance
+        """
+        cell, point = self._cell(point)
+        if cell >= 0:
+            return float(self._clearance[cell])
+        return math.sqrt(sum(max(lo - x, x - lo - num * self._cell_size, 0.0)**2
+                             for x, lo, num in zip(point, self._corner, self._shape)))
+
+    def signed_distance(self, points):
+        """
+        Returns bound on distance from points to surface of the nearest
+        target, negative inside. Points is array of shape (N,3); returns
+        array of shape (N,). Near targets it is the distance to the targets
+        listed in the cells around the point, capped at the cell size (the
+        others are at least that far); elsewhere the clearance.
+        """
+        if np.ndim(points) == 1:
+            # Single point away from the targets: no array work needed
+            clearance = self.point_clearance(points)
+            if clearance > 0.0:
+                return clearance
+        points = np.asarray(points, dtype=float)
+        dist = self.clearance(points)
+        shifted = np.atleast_2d(points) - self._offset
+        coords = np.floor((shifted - self._lower) / self._cell_size).astype(np.int64)
+        for num in np.flatnonzero(dist <= 0.0):
+            low  = np.clip(coords[num] - 1, 0, self._dims - 1)
+            high = np.clip(coords[num] + 1, 0, self._dims - 1)
+            grid = np.mgrid[low[0]:high[0] + 1, low[1]:high[1] + 1,
+                            low[2]:high[2] + 1].reshape(3, -1)
+            items = np.unique(np.concatenate([self._items[self._start[cell]:self._start[cell + 1]]
+                                              for cell in (grid[0] * self._dims[1] + grid[1]) *
+                                              self._dims[2] + grid[2]]))
+            dist[num] = min([self._cell_size] +
+                            [float(self._shapes[item].signed_distance(shifted[num]))
+                             for item in items])
+        return dist.reshape(points.shape[:-1])
+
+    def get_wireframe(self):
+        """
+        Returns polylines of the wireframes of all targets
+        """
+        return [line + self._offset for target in self._shapes
+                for line in target.get_wireframe()]
+
+
+if __name__ == '__main__':
+    # Ensemble walks among scattered traps: the grid against testing every trap
+    import sys
+    import time
+    import randwalk3d_class as rw3d
+    import randwalk3d_ensemble as rwens
+    num_targets = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    num_walkers = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    boundary = shapes.Sphere((0.0, 0.0, 0.0), 30.0)
+    traps = random_traps(boundary, num_targets, 1.0, rng=2017, exclude=(0.0, 0.0, 0.0))
+    targets = TargetSet3d(traps)
+    print(targets)
+    points = np.random.default_rng(1).uniform(-30.0, 30.0, size=(200000, 3))
+    started = time.perf_counter()
+    found = targets.find(points)
+    grid_time = time.perf_counter() - started
+    started = time.perf_counter()
+    brute = np.full(len(points), -1, dtype=np.int64)
+    for num in reversed(range(len(traps))):
+        brute[traps[num].contains(points)] = num
+    brute_time = time.perf_counter() - started
+    print('   find of %d points: %.1f ms (every target: %.1f ms), same result: %s'
+          % (len(points), 1e3 * grid_time, 1e3 * brute_time, np.array_equal(found, brute)))
+    ensemble = rwens.RandomWalkEnsemble3d((0.0, 0.0, 0.0), 10**6, num_walkers, rw3d.rand_direct,
+                                          boundary, targets, rng=2017)
+    started = time.perf_counter()
+    ensemble.conduct_walks()
+    absorbed = np.bincount(ensemble.get_target_index() + 1, minlength=num_targets + 1)
+    print('   %d walkers, mean steps %.0f, %.2f s' % (num_walkers,
+          ensemble.get_num_steps().mean(), time.perf_counter() - started))
+    print('   Missed: %d, traps hit: %d, most absorbing trap: %d (%d walkers)'
+          % (absorbed[0], np.count_nonzero(absorbed[1:]), np.argmax(absorbed[1:]),
+             absorbed[1:].max()))
@@ -0,0 +1,224 @@
+"""
+  Variance reduction for the mean number of steps to target.
+
+  The steps to target have a heavy right tail, so the plain Monte Carlo
+  mean (method 'naive') needs many walks. Three estimators of the same
+  mean E[T] (T: accepted steps of a walk, max_steps for walks that miss):
+
+  'antithetic' : walkers run in pairs whose trial steps are opposite
+                 (s and -s, for grid and direct steps alike); the estimate
+                 is the mean over pair averages.
+  'control'    : every walker carries a free walk S made of its trial steps
+                 without boundary or target. |S_k|**2 - k is a martingale
+                 (the unconfined <r**2> = n), so C = |S_K|**2 - K has mean 0
+                 at the number of trial steps K the walk took, and T - beta*C
+                 (regression beta) estimates E[T] with less variance when T
+                 and C are correlated. Without a boundary K = T and S is the
+                 walk itself.
+  'splitting'  : multilevel splitting. A walker still walking after
+                 levels[j] steps is split into 'factor' copies of weight
+                 1/factor each, which continue independently, so the rare
+                 long walks of the tail are sampled more often. The estimate
+                 weights every walk by its weight.
+
+  Each estimate reports its effective sample size (naive walks that give
+  the same variance) and its gain: the variance of the naive mean for the
+  same number of steps walked divided by the variance of the estimate.
+
+  All methods walk an ensemble with NumPy arrays as RandomWalkEnsemble3d,
+  without moving targets.
+"""
+
+import numpy as np
+import randwalk3d_ensemble as rwens
+import randwalk3d_steps as rwsteps
+
+METHODS     = ('naive', 'antithetic', 'control', 'splitting')
+FACTOR      = 2         # Copies made of a walker at each splitting level
+NUM_LEVELS  = 4         # Splitting levels chosen from a pilot run
+PILOT_WALKS = 1000      # Walks of the pilot run that chooses the levels
+
+def splitting_levels(num_steps, factor=FACTOR, num_levels=NUM_LEVELS):
+    """
+    Returns splitting levels from steps to target of a pilot run: the
+    quantiles 1 - factor**-k (k = 1 .. num_levels), so about one walker in
+    factor goes on from one level to the next
+    """
+    quantiles = 1.0 - float(factor) ** -np.arange(1, num_levels + 1)
+    levels = np.unique(np.quantile(num_steps, quantiles).astype(np.int64))
+    return levels[levels > 0]
+
+def conduct_walks(start_loc, max_steps, num_walks, rand_function, boundary=None, target=None,
+                  rng=None, antithetic=False, levels=(), factor=FACTOR):
+    """
+    Conducts num_walks walks (pairs of opposite walks if antithetic, split
+    at levels if given). Returns dictionary of arrays with one entry per
+    finished walker:
+        root      : number of the starting walk it descends from
+        num_steps : accepted steps
+        target_hit: True if it reached the target
+        weight    : weight of the walker (1 without splitting)
+        trials    : trial steps taken (K)
+        free_sq   : |S_K|**2 of its free walk
+        work      : steps it walked itself (after it was split off)
+    """
+    if antithetic and len(levels):
+        raise ValueError('Antithetic walks cannot be split')
+    source = rwsteps.step_source(rand_function, rng)
+    levels = np.append(np.sort(np.asarray(levels, dtype=np.int64)), np.iinfo(np.int64).max)
+    root   = np.arange(num_walks)
+    pos    = np.tile(np.asarray(start_loc, dtype=float), (num_walks, 1))
+    free   = np.zeros((num_walks, 3))
+    steps  = np.zeros(num_walks, dtype=np.int64)
+    trials = np.zeros(num_walks, dtype=np.int64)
+    born   = np.zeros(num_walks, dtype=np.int64)
+    weight = np.ones(num_walks)
+    level  = np.zeros(num_walks, dtype=np.int64)
+    finished = []
+    while root.size:
+        # Create trial moves for all active walkers
+        if antithetic:
+            pairs, pair = np.unique(root // 2, return_inverse=True)
+            step = source.next_block(pairs.size)[pair]
+            step[root % 2 == 1] *= -1.0
+        else:
+            step = source.next_block(root.size)
+        trial = pos + step
+        free += step
+        trials += 1
+        hit = np.zeros(root.size, dtype=bool)
+        if target:
+            hit = rwens.contains(target, trial)
+        accept = hit.copy()
+        if boundary:
+            accept |= rwens.contains(boundary, trial)
+        else:
+            accept[:] = True
+        pos[accept] = trial[accept]
+        steps += accept
+        done = hit | (steps >= max_steps)
+        # Walkers going on past their next level are split
+        split = np.flatnonzero(~done & (steps >= levels[level]))
+        if split.size:
+            weight[split] /= factor
+            level[split] += 1
+            copies = np.repeat(split, factor - 1)
+            born = np.concatenate((born, steps[copies]))
+            root, pos, free, steps, trials, weight, level, done, hit = \
+                [np.concatenate((array, array[copies])) for array in
+                 (root, pos, free, steps, trials, weight, level, done, hit)]
+        if done.any():
+            finished.append({'root': root[done], 'num_steps': steps[done],
+                             'target_hit': hit[done], 'weight': weight[done],
+                             'trials': trials[done],
+                             'free_sq': np.einsum('ij,ij->i', free[done], free[done]),
+                             'work': steps[done] - born[done]})
+            keep = ~done
+            root, pos, free, steps, trials, born, weight, level = \
+                root[keep], pos[keep], free[keep], steps[keep], trials[keep], born[keep], \
+                weight[keep], level[keep]
+    return dict((name, np.concatenate([walks[name] for walks in finished]))
+                for name in finished[0]) if finished else {}
+
+def _estimate(method, values, var_naive, walks):
+    """
+    Returns estimate dictionary from independent values whose mean is the
+    estimate, the variance of the steps to target of a single walk and the
+    walks (conduct_walks dictionary)
+    """
+    mean = np.mean(values)
+    work = np.sum(walks['work'])
+    var_estimate = np.var(values, ddof=1) / values.size if values.size > 1 else np.inf
+    ess  = var_naive / var_estimate if var_estimate > 0 else np.inf
+    gain = var_naive * mean / (var_estimate * work) if var_estimate > 0 and work else np.inf
+    return {'method'   : method,
+            'mean'     : float(mean),
+            'std_error': float(np.sqrt(var_estimate)),
+            'num_walks': walks['num_steps'].size,
+            'num_miss' : int(np.count_nonzero(~walks['target_hit'])),
+            'work'     : int(work),
+            'ess'      : float(ess),
+            'gain'     : float(gain)}
+
+def estimate_mean_steps(start_loc, max_steps, num_walks, rand_function, boundary=None,
+                        target=None, method='naive', rng=None, levels=None, factor=FACTOR):
+    """
+    Estimates the mean steps to target from num_walks walks (starting walks
+    for splitting) with one of METHODS. levels None picks splitting levels
+    from a pilot run (not counted in the work). Returns dictionary of
+    method, mean, std_error, num_walks (walkers finished), num_miss, work
+    (steps walked), ess and gain, plus the levels for splitting.
+    """
+    if method not in METHODS:
+        raise ValueError('method must be one of ' + ', '.join(METHODS))
+    rng = np.random.default_rng(rng)
+    if method == 'splitting' and levels is None:
+        pilot = conduct_walks(start_loc, max_steps, min(num_walks, PILOT_WALKS), rand_function,
+                              boundary, target, rng)
+        levels = splitting_levels(pilot['num_steps'], factor)
+    if method == 'antithetic':
+        num_walks += num_walks % 2
+    walks = conduct_walks(start_loc, max_steps, num_walks, rand_function, boundary, target,
+                          rng, method == 'antithetic',
+                          levels if method == 'splitting' else (), factor)
+    num_steps = walks['num_steps'].astype(float)
+    if method == 'splitting':
+        # Weighted sums per starting walk are independent and unbiased
+        values = np.bincount(walks['root'], walks['weight'] * num_steps, num_walks)
+        square = np.bincount(walks['root'], walks['weight'] * num_steps**2, num_walks)
+        var_naive = np.mean(square) - np.mean(values)**2
+        result = _estimate(method, values, var_naive, walks)
+        result['levels'] = [int(level) for level in levels]
+        return result
+    var_naive = np.var(num_steps, ddof=1)
+    if method == 'antithetic':
+        values = 0.5 * np.bincount(walks['root'] // 2, num_steps, num_walks // 2)
+    elif method == 'control':
+        control = walks['free_sq'] - walks['trials']
+        beta = np.cov(num_steps, control)[0, 1] / np.var(control, ddof=1)
+        values = num_steps - beta * control
+    else:
+        values = num_steps
+    return _estimate(method, values, var_naive, walks)
+
+def compare_methods(config, num_walks, seed=None, methods=METHODS):
+    """
+    Runs every one of methods on the walks described by a run_simulations
+    config dictionary (without moving targets) and returns the list of
+    estimate dictionaries
+    """
+    if config.get('move_target', False):
+        raise ValueError('Variance reduction is not available for moving targets')
+    seeds = np.random.SeedSequence(seed).spawn(len(methods))
+    return [estimate_mean_steps(config['start_loc'], config['max_steps'], num_walks,
+                                config['rand_function'], config.get('boundary'),
+                                config.get('target'), method, np.random.default_rng(seq))
+            for method, seq in zip(methods, seeds)]
+
+def print_comparison(results):
+    """
+    Prints table of estimates from compare_methods
+    """
+    print('   %-11s %12s %10s %10s %8s %8s' % ('Method', 'Mean', 'Std err', 'Walks', 'ESS', 'Gain'))
+    for result in results:
+        print('   %-11s %12.1f %10.2f %10d %8.0f %7.2fx' % (result['method'], result['mean'],
+                                                        result['std_error'], result['num_walks'],
+                                                        result['ess'], result['gain']))
+
+if __name__ == '__main__':
+    # Compare the estimators on the R = 10 sphere of sweeps/sphere_radius.json
+    import sys
+    import shapes3d_class as shapes
+    import randwalk3d_class as rw3d
+    num_walks = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    sphere = {'start_loc': (0.0, 0.0, 0.0), 'max_steps': 10**6,
+              'rand_function': rw3d.rand_direct,
+              'boundary': shapes.Sphere((0.0, 0.0, 0.0), 10.0),
+              'target': shapes.Sphere((5.0, 5.0, 5.0), 10.0 / 6.0)}
+    # Unconfined walks that miss stop at max_steps
+    unconfined = {'start_loc': (0.0, 0.0, 0.0), 'max_steps': 2000,
+                  'rand_function': rw3d.rand_direct,
+                  'target': shapes.Sphere((4.0, 0.0, 0.0), 2.0)}
+    for name, config in (('sphere', sphere), ('unconfined', unconfined)):
+        print('Mean steps to target, %s, %d walks' % (name, num_walks))
+        print_comparison(compare_methods(config, num_walks, seed=2017))
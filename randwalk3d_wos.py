@@ -0,0 +1,258 @@
+"""
+  Accelerated 3D random walks using walk-on-spheres jumps.
+
+  Far from the boundary and the target, a walk of unit steps in random
+  directions (rand_direct) can be replaced by a single jump: if the nearest
+  surface is further than r+1 away, the walker leaves the ball of radius r
+  around it without touching anything, at a uniformly distributed point on
+  the sphere, after a random number of steps. For large r that number of
+  steps follows the exit time of Brownian motion from a ball (mean r**2
+  steps), whose distribution is sampled from a precomputed table. Close to
+  the surfaces the walk falls back to exact unit steps with the same rules
+  as RandomWalk3d.conduct_walk.
+
+  compare_with_exact() checks that the accelerated walks agree statistically
+  with the exact step-by-step walks for a given boundary and target.
+"""
+
+import math
+import numpy as np
+import shapes3d_class as shapes
+import randwalk3d_class as rw3d
+import randwalk3d_ensemble as rwens
+from randwalk3d_steps import StepSource3d
+
+MIN_JUMP = 3.0          # Smallest jump radius worth replacing unit steps
+
+def _exit_time_table(s_max=10.0, num_points=4000, num_terms=400):
+    """
+    Returns (s, cdf) table of the scaled exit time s = steps / r**2 of a
+    walk started at the center of a ball of radius r:
+        P(s' > s) = 2 * sum_k (-1)**(k+1) * exp(-k**2 * pi**2 * s / 6)
+    """
+    s = np.linspace(0.0, s_max, num_points)
+    k = np.arange(1, num_terms + 1)[:, None]
+    survival = 2.0 * np.sum((-1.0)**(k + 1) * np.exp(-k**2 * np.pi**2 * s / 6.0), axis=0)
+    cdf = np.clip(1.0 - survival, 0.0, 1.0)
+    cdf[0] = 0.0
+    return s, np.maximum.accumulate(cdf)
+
+EXIT_S, EXIT_CDF = _exit_time_table()
+
+def sample_exit_steps(rng, radius, size=None):
+    """
+    Returns number(s) of unit steps taken by walks started at the center of
+    a ball of given radius until they leave it
+    """
+    u = rng.random(size)
+    s = np.interp(u, EXIT_CDF, EXIT_S)
+    # Beyond the table the survival function is a single exponential
+    tail = u > EXIT_CDF[-1]
+    s = np.where(tail, 6.0 / np.pi**2 * np.log(2.0 / (1.0 - np.minimum(u, 1.0 - 1e-300))), s)
+    return np.maximum(np.ceil(radius), np.rint(s * radius**2)).astype(np.int64)
+
+def signed_distance(shape, point):
+    """
+    Returns distance from point (x,y,z) to surface of shape, negative inside
+    shape. Scalar version of Shape3d.signed_distance for the basic shapes,
+    which avoids NumPy overhead on single points; other shapes (e.g. compound
+    or rotated shapes) use their own signed_distance.
+    """
+    if shape.is_rotated():
+        return float(shape.signed_distance(point))
+    x, y, z = point
+    xc, yc, zc = shape.get_location()
+    dx, dy, dz = x - xc, y - yc, z - zc
+    if isinstance(shape, shapes.Sphere):
+        return math.sqrt(dx*dx + dy*dy + dz*dz) - shape.get_radius()
+    if isinstance(shape, shapes.Ellipsoid):
+        a, b, c = shape.get_a(), shape.get_b(), shape.get_c()
+        return (math.sqrt((dx/a)**2 + (dy/b)**2 + (dz/c)**2) - 1.0) * min(a, b, c)
+    if isinstance(shape, shapes.Rectangle3d):
+        ex = abs(dx) - 0.5 * shape.get_width()
+        ey = abs(dy) - 0.5 * shape.get_height()
+        ez = abs(dz) - 0.5 * shape.get_depth()
+        outside = math.sqrt(max(ex, 0.0)**2 + max(ey, 0.0)**2 + max(ez, 0.0)**2)
+        return outside + min(max(ex, ey, ez), 0.0)
+    return float(shape.signed_distance(point))
+
+
+class AcceleratedWalk3d:
+    """
+    Class to represent a 3D random walk with unit steps in random directions
+    (rand_direct) which jumps across the interior of the boundary with
+    walk-on-spheres moves. Results match those of RandomWalk3d in distribution.
+    """
+
+    def __init__(self, start_loc, max_steps, boundary=None, target=None, rng=None,
+                 min_jump=MIN_JUMP):
+        """
+        Initializes the AcceleratedWalk3d class object:
+            start_loc: starting location for walk
+            max_steps: maximum number of steps that walk will take
+            boundary : shape object confining the walk
+            target   : shape object describing target for walk
+            rng      : numpy.random.Generator (or seed) used for the walk
+            min_jump : smallest jump radius, nearer the surfaces unit steps
+                       are taken
+            num_steps  : number of steps required to reach target
+            num_jumps  : number of walk-on-spheres jumps made
+            target_hit : True if target is reached before max_steps
+        """
+        self._start_loc  = start_loc
+        self._max_steps  = max_steps
+        self._boundary   = boundary
+        self._target     = target
+        self._rng        = np.random.default_rng(rng)
+        self._min_jump   = min_jump
+        self._num_steps  = 0
+        self._num_jumps  = 0
+        self._target_hit = False
+        self._end_loc    = start_loc
+
+    def get_start(self):
+        """
+        Returns starting point of the walk
+        """
+        return self._start_loc
+
+    def get_max_steps(self):
+        """
+        Returns maximum number of steps in walk
+        """
+        return self._max_steps
+
+    def get_num_steps(self):
+        """
+        Returns total number of steps required to reach target for completed walk
+        """
+        return self._num_steps
+
+    def get_num_jumps(self):
+        """
+        Returns number of walk-on-spheres jumps made during the walk
+        """
+        return self._num_jumps
+
+    def get_target_hit(self):
+        """
+        Returns True if target is reached, False if not
+        """
+        return self._target_hit
+
+    def get_end_loc(self):
+        """
+        Returns final location (x,y,z) of completed walk
+        """
+        return self._end_loc
+
+    def _clearance(self, pos):
+        """
+        Returns distance from pos to the nearest surface of boundary or target
+        """
+        clearance = math.inf
+        if self._boundary:
+            clearance = min(clearance, -signed_distance(self._boundary, pos))
+        if self._target:
+            clearance = min(clearance, signed_distance(self._target, pos))
+        return clearance
+
+    def conduct_walk(self):
+        """
+        Performs a random walk inside a boundary with target. Walk proceeds
+        until target is reached or max steps is exceeded
+        """
+        pos = tuple(float(x) for x in self._start_loc)
+        direction = StepSource3d('direct', self._rng)
+        exact_steps = 0         # Unit steps left before clearance can allow a jump
+        while self._num_steps < self._max_steps:
+            if exact_steps <= 0:
+                radius = self._clearance(pos) - 1.0
+                if radius >= self._min_jump:
+                    # Jump to a random point on the largest safe sphere
+                    jump_steps = int(sample_exit_steps(self._rng, radius))
+                    self._num_jumps += 1
+                    if self._num_steps + jump_steps >= self._max_steps:
+                        self._num_steps = self._max_steps
+                        break
+                    dx, dy, dz = direction()
+                    pos = (pos[0] + radius*dx, pos[1] + radius*dy, pos[2] + radius*dz)
+                    self._num_steps += jump_steps
+                    continue
+                # Clearance grows by at most one per step
+                exact_steps = math.ceil(self._min_jump - radius)
+            # Exact unit step near the surfaces
+            dx, dy, dz = direction()
+            exact_steps -= 1
+            trial = (pos[0] + dx, pos[1] + dy, pos[2] + dz)
+            if self._target and self._target.check_inside(trial):
+                self._num_steps += 1
+                self._target_hit = True
+                self._end_loc = trial
+                return
+            if not self._boundary or self._boundary.check_inside(trial):
+                pos = trial
+                self._num_steps += 1
+        self._target_hit = False
+        self._end_loc = pos
+        return
+
+def conduct_walks(start_loc, max_steps, num_walks, boundary=None, target=None, rng=None,
+                  min_jump=MIN_JUMP):
+    """
+    Conducts num_walks accelerated walks. Returns (num_steps, target_hit,
+    end_loc) arrays with one entry (row) per walk.
+    """
+    rng = np.random.default_rng(rng)
+    num_steps  = np.zeros(num_walks, dtype=np.int64)
+    target_hit = np.zeros(num_walks, dtype=bool)
+    end_loc    = np.zeros((num_walks, 3))
+    for num in range(num_walks):
+        walk = AcceleratedWalk3d(start_loc, max_steps, boundary, target, rng, min_jump)
+        walk.conduct_walk()
+        num_steps[num]  = walk.get_num_steps()
+        target_hit[num] = walk.get_target_hit()
+        end_loc[num]    = walk.get_end_loc()
+    return num_steps, target_hit, end_loc
+
+def ks_test(sample1, sample2):
+    """
+    Two-sample Kolmogorov-Smirnov test. Returns (D statistic, p-value)
+    using the asymptotic Kolmogorov distribution.
+    """
+    sample1, sample2 = np.sort(sample1), np.sort(sample2)
+    values = np.concatenate([sample1, sample2])
+    cdf1 = np.searchsorted(sample1, values, side='right') / float(len(sample1))
+    cdf2 = np.searchsorted(sample2, values, side='right') / float(len(sample2))
+    d = np.max(np.abs(cdf1 - cdf2))
+    n = len(sample1) * len(sample2) / float(len(sample1) + len(sample2))
+    lam = (np.sqrt(n) + 0.12 + 0.11 / np.sqrt(n)) * d
+    k = np.arange(1, 101)
+    p = 2.0 * np.sum((-1.0)**(k - 1) * np.exp(-2.0 * k**2 * lam**2))
+    return d, float(np.clip(p, 0.0, 1.0))
+
+def compare_with_exact(start_loc, max_steps, num_walks, boundary=None, target=None, seed=None,
+                       min_jump=MIN_JUMP):
+    """
+    Runs num_walks accelerated walks and num_walks exact step-by-step walks
+    (RandomWalkEnsemble3d with rand_direct) and returns dictionary comparing
+    the steps to target of the walks that hit:
+        mean_fast, mean_exact : average steps to target
+        sem_fast, sem_exact   : standard errors of the averages
+        ks_stat, ks_pvalue    : two-sample Kolmogorov-Smirnov test
+    """
+    fast_seq, exact_seq = np.random.SeedSequence(seed).spawn(2)
+    steps, hit, _ = conduct_walks(start_loc, max_steps, num_walks, boundary, target,
+                               fast_seq, min_jump)
+    fast = steps[hit]
+    ensemble = rwens.RandomWalkEnsemble3d(start_loc, max_steps, num_walks, rw3d.rand_direct,
+                                          boundary, target, exact_seq)
+    ensemble.conduct_walks()
+    exact = ensemble.get_num_steps()[ensemble.get_target_hit()]
+    ks_stat, ks_pvalue = ks_test(fast, exact)
+    return {'mean_fast' : np.mean(fast),
+            'mean_exact': np.mean(exact),
+            'sem_fast'  : np.std(fast) / np.sqrt(len(fast)),
+            'sem_exact' : np.std(exact) / np.sqrt(len(exact)),
+            'ks_stat'   : ks_stat,
+            'ks_pvalue' : ks_pvalue}
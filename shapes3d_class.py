@@ -11,21 +11,81 @@
            Sphere
            Ellipsoid
            Polygon (future- not fully implemented yet)
+
+  Compound shapes can be built from these with the Union3d, Intersection3d
+  and Difference3d classes (or the union, intersection and difference
+  methods). Every shape provides a vectorized signed distance to its surface
+  (negative inside) and its gradient for proximity queries.
+
+  Rectangular boxes and ellipsoids can be rotated (rotation argument, see
+  rotation_matrix). The rotation and the axis lengths are folded into one
+  precomputed 3x3 matrix, so containment of a batch of points is a single
+  matrix product whether or not the shape is rotated.
+
+  Only NumPy is imported at load time; matplotlib is imported by
+  draw_shape when a shape is drawn.
 """  
 
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 from itertools import product, combinations
-import matplotlib.patches as patches
+
+VOLUME_POINTS = 1000000     # Random points of the volume estimate of compound shapes
+
+def rotation_matrix(rotation):
+    """
+    Returns 3x3 rotation matrix for rotation, or None for no rotation.
+    rotation is 0 or None (no rotation), (x,y,z) angles in degrees of
+    rotations about the x, then y, then z axis, or a 3x3 rotation matrix.
+    Columns of the matrix are the directions of the shape's own axes.
+    """
+    if rotation is None or np.isscalar(rotation) and rotation == 0:
+        return None
+    rotation = np.asarray(rotation, dtype=float)
+    if rotation.shape == (3,):
+        if not rotation.any():
+            return None
+        ax, ay, az = np.radians(rotation)
+        rx = np.array([[1, 0, 0], [0, np.cos(ax), -np.sin(ax)], [0, np.sin(ax), np.cos(ax)]])
+        ry = np.array([[np.cos(ay), 0, np.sin(ay)], [0, 1, 0], [-np.sin(ay), 0, np.cos(ay)]])
+        rz = np.array([[np.cos(az), -np.sin(az), 0], [np.sin(az), np.cos(az), 0], [0, 0, 1]])
+        return rz @ ry @ rx
+    if rotation.shape != (3, 3) or not np.allclose(rotation @ rotation.T, np.eye(3)) \
+       or np.linalg.det(rotation) < 0:
+        raise ValueError('rotation must be 0, three angles in degrees or a 3x3 rotation matrix')
+    return rotation
+
+def box_edges(corners):
+    """
+    Returns the 12 edges of a box as (2,3) arrays, from its 8 corners in
+    itertools.product order of (x,y,z) bounds
+    """
+    return [corners[[num1, num2]] for num1, num2 in combinations(range(8), 2)
+            if bin(num1 ^ num2).count('1') == 1]
+
+def ellipsoid_wireframe(center, axes, matrix=None):
+    """
+    Returns polylines of a wireframe of an ellipsoid with semi-axes axes
+    (turned by matrix if given): 20 meridians and 10 parallels
+    """
+    u, v = np.mgrid[0:2*np.pi:20j, 0:np.pi:10j]
+    grid = np.array([np.cos(u)*np.sin(v), np.sin(u)*np.sin(v), np.cos(v)])
+    grid *= np.asarray(axes, dtype=float)[:, None, None]
+    if matrix is not None:
+        grid = np.einsum('ij,j...->i...', matrix, grid)
+    grid = np.moveaxis(grid, 0, -1) + np.asarray(center, dtype=float)
+    return list(grid) + list(np.swapaxes(grid, 0, 1))
+
 
 class Shape3d:
     """
     Super Class for all 3d shapes. Includes common methods for all shapes.
     """
+    _color = 'b'        # Default color of draw_shape
     def __init__(self, location, rotation = 0 ):
         """
-        Initializes the class object. Rotation is not implemented.
+        Initializes the class object at location. rotation is 0, three angles
+        in degrees or a 3x3 matrix (see rotation_matrix); shapes that can be
+        rotated turn their form by it.
         """
         self._location = location
         self._init_location = location
@@ -43,6 +103,115 @@ class Shape3d:
         """        
         return self._init_location
 
+    def get_rotation(self):
+        """
+        Returns 3x3 rotation matrix of shape (identity if not rotated)
+        """
+        matrix = getattr(self, '_matrix', None)
+        return np.eye(3) if matrix is None else matrix
+
+    def is_rotated(self):
+        """
+        Returns True if shape is rotated
+        """
+        return getattr(self, '_matrix', None) is not None
+
+    def contains(self, points):
+        """
+        Checks which of the points are inside shape. Points is array of
+        shape (N,3) (or a single (x,y,z)); returns boolean array of shape (N,)
+        """
+        raise NotImplementedError
+
+    def check_inside(self, point):
+        """
+        Checks if point is inside shape. Returns True if inside, False if not.
+        Point is tuple (x,y,z)
+        """
+        return bool(self.contains(point))
+
+    def signed_distance(self, points):
+        """
+        Returns distance from each of the points to surface of shape, negative
+        inside shape. Points is array of shape (N,3); returns array of shape (N,)
+        """
+        raise NotImplementedError
+
+    def get_bounding_box(self):
+        """
+        Returns ((xmin,ymin,zmin), (xmax,ymax,zmax)) corners of a box
+        containing the shape
+        """
+        raise NotImplementedError
+
+    def get_bounding_sphere(self):
+        """
+        Returns ((x,y,z), radius) of a sphere containing the shape, including
+        its surface. By default the sphere around the bounding box.
+        """
+        lower, upper = self.get_bounding_box()
+        center = tuple(0.5 * (lo + hi) for lo, hi in zip(lower, upper))
+        radius = 0.5 * float(np.sqrt(sum((hi - lo)**2 for lo, hi in zip(lower, upper))))
+        return center, radius
+
+    def get_color(self):
+        """
+        Returns default color used by draw_shape
+        """
+        return self._color
+
+    def get_wireframe(self):
+        """
+        Returns list of (M,3) arrays, the polylines of a wireframe of the
+        shape. By default the edges of the bounding box.
+        """
+        lower, upper = self.get_bounding_box()
+        return box_edges(np.array(list(product(*zip(lower, upper))), dtype=float))
+
+    def draw_shape(self, ax, color=None, line_size=2.5):
+        """
+        Plots the wireframe of the shape on 3D matplotlib axes as a single
+        line collection (color None => the default color of the shape)
+        """
+        from mpl_toolkits.mplot3d.art3d import Line3DCollection
+        lines = self.get_wireframe()
+        ax.add_collection3d(Line3DCollection(lines, colors=color or self.get_color(),
+                                             linewidths=line_size))
+        points = np.concatenate(lines)
+        ax.auto_scale_xyz(points[:, 0], points[:, 1], points[:, 2], had_data=True)
+
+    def gradient(self, points, step=1e-6):
+        """
+        Returns (N,3) array of gradients of signed_distance at points,
+        by central differences unless a shape provides it exactly
+        """
+        points = np.asarray(points, dtype=float)
+        grad = np.empty(points.shape)
+        for axis in range(3):
+            delta = np.zeros(3)
+            delta[axis] = step
+            grad[..., axis] = (self.signed_distance(points + delta) -
+                               self.signed_distance(points - delta)) / (2 * step)
+        return grad
+
+    def union(self, other):
+        """
+        Returns compound shape covering both this shape and other
+        """
+        return Union3d(self, other)
+
+    def intersection(self, other):
+        """
+        Returns compound shape covering the overlap of this shape and other
+        """
+        return Intersection3d(self, other)
+
+    def difference(self, other):
+        """
+        Returns compound shape covering this shape with other cut out of it
+        """
+        return Difference3d(self, other)
+
     def distance_from(self, point):
         """
         Returns distance from point to center of shape
@@ -83,13 +252,19 @@ class Rectangle3d(Shape3d):
     
     def __init__(self,location, width, height, depth, rotation = 0):
         """
-        Initializes the Rectangle3d class object. Rotation is not implemented.
+        Initializes the Rectangle3d class object. Width, height and depth are
+        along the x, y and z axes, turned by rotation (see rotation_matrix).
         """
 #       super().__init__(location,rotation)  Python 3 syntax
         Shape3d.__init__(self,location,rotation)
         self._width    = width
         self._height   = height
         self._depth    = depth
+        self._matrix   = rotation_matrix(rotation)
+        self._half     = 0.5 * np.array([width, height, depth], dtype=float)
+        # Containment: |(p - center) @ form| < 1 along every own axis
+        self._form     = self.get_rotation() / self._half
+        self._form_rows = tuple(map(tuple, self._form.tolist()))
 
     def __str__(self):
         """
@@ -115,6 +290,13 @@ class Rectangle3d(Shape3d):
         """  
         return self._depth
 
+    def get_form(self):
+        """
+        Returns 3x3 matrix F such that point p is inside the rectangle if
+        every entry of (p - center) @ F lies strictly between -1 and 1
+        """
+        return self._form
+
     def volume(self):
         """
         Returns volume of shape
@@ -141,12 +323,29 @@ class Rectangle3d(Shape3d):
         point = (xloc + .5* self._width, yloc+.5 * self._height, zloc+.5 * self._depth) 
         return point
 
+    def get_bounding_box(self):
+        """
+        Returns corners of box containing the rectangle (the rectangle itself
+        unless rotated)
+        """
+        if self._matrix is None:
+            return self.get_bottom_left_corner(), self.get_upper_right_corner()
+        center = np.array(self.get_location(), dtype=float)
+        extent = np.abs(self._matrix) @ self._half
+        return tuple((center - extent).tolist()), tuple((center + extent).tolist())
+
     def check_inside(self,point):
         """  
         Checks if point is inside a rectangle. Returns True
          if inside, False if not. Point is tuple (x,y,z) 
         """ 
         x,y,z = point
+        if self._matrix is not None:
+            xc, yc, zc = self.get_location()
+            dx, dy, dz = x - xc, y - yc, z - zc
+            (f11, f12, f13), (f21, f22, f23), (f31, f32, f33) = self._form_rows
+            return (abs(dx*f11 + dy*f21 + dz*f31) < 1.0 and abs(dx*f12 + dy*f22 + dz*f32) < 1.0
+                    and abs(dx*f13 + dy*f23 + dz*f33) < 1.0)
         xmin, ymin,zmin = self.get_bottom_left_corner()
         xmax, ymax,zmax = self.get_upper_right_corner()
         if (xmax>x and xmin<x) and (ymax>y and ymin<y) and (zmax> z and zmin< z):
@@ -154,24 +353,64 @@ class Rectangle3d(Shape3d):
         else:
             return False
 
+    def contains(self, points):
+        """
+        Checks which of the points are inside rectangle. Points is array of
+        shape (N,3); returns boolean array of shape (N,)
+        """
+        delta = np.asarray(points, dtype=float) - np.array(self.get_location(), dtype=float)
+        if self._matrix is None:
+            return np.all(np.abs(delta) < self._half, axis=-1)
+        return np.all(np.abs(delta @ self._form) < 1.0, axis=-1)
+
+    def _excess(self, points):
+        """
+        Returns offsets of points from center along the rectangle's own axes
+        and distances beyond each face
+        """
+        delta = np.asarray(points, dtype=float) - np.array(self.get_location(), dtype=float)
+        if self._matrix is not None:
+            delta = delta @ self._matrix
+        return delta, np.abs(delta) - self._half
+
+    def signed_distance(self, points):
+        """
+        Returns exact distance from points to surface of rectangle, negative
+        inside. Points is array of shape (N,3); returns array of shape (N,)
+        """
+        delta, excess = self._excess(points)
+        outside = np.sqrt(np.sum(np.maximum(excess, 0.0)**2, axis=-1))
+        return outside + np.minimum(np.max(excess, axis=-1), 0.0)
+
+    def gradient(self, points):
+        """
+        Returns (N,3) array of unit gradients of signed distance at points
+        """
+        delta, excess = self._excess(points)
+        outside = np.maximum(excess, 0.0)
+        norm = np.sqrt(np.sum(outside**2, axis=-1, keepdims=True))
+        # Inside, the nearest face is the one with the largest excess
+        nearest = excess == np.max(excess, axis=-1, keepdims=True)
+        nearest &= np.cumsum(nearest, axis=-1) == 1
+        grad = np.where(norm > 0, outside / np.where(norm > 0, norm, 1.0), nearest)
+        grad = grad * np.where(delta < 0, -1.0, 1.0)
+        if self._matrix is not None:
+            grad = grad @ self._matrix.T
+        return grad
+
     
-    def draw_shape(self, ax, color='b', line_size=2.5):
+    def get_wireframe(self):
         """
-        Plots the rectangle3d shape using maplotlib plot3D 
+        Returns the 12 edges of the box as (2,3) arrays
         """
         #draw box
         xmin, ymin,zmin = self.get_bottom_left_corner()
         xmax, ymax,zmax = self.get_upper_right_corner()
-        xdim = [xmin, xmax]
-        ydim = [ymin, ymax]
-        zdim = [zmin, zmax]
-        corner_pts = np.array(list(product(xdim,ydim,zdim)))
-        possible_edges   = combinations(corner_pts,2) 
-        for pt1, pt2 in possible_edges:
-            if ((pt1[0]==pt2[0] and pt1[1]==pt2[1]) or (pt1[0]==pt2[0] and pt1[2]==pt2[2]) or (pt1[1]==pt2[1] and pt1[2]==pt2[2])):
-                ax.plot3D(*zip(pt1,pt2), c=color ,lw=line_size)
-#  Note : alternate draw_shape command for solid surface
-#         ax.plot_surface(tx, ty, tz, rstride=4, cstride=4, color=color)
+        corner_pts = np.array(list(product([xmin, xmax], [ymin, ymax], [zmin, zmax])), dtype=float)
+        if self._matrix is not None:
+            center = np.array(self.get_location(), dtype=float)
+            corner_pts = (corner_pts - center) @ self._matrix.T + center
+        return box_edges(corner_pts)
 
     def set_plot_size(self,ax):
         """
@@ -187,6 +426,7 @@ class Sphere(Shape3d):
     """
     Class to represent sphere shape
     """
+    _color = 'r'
     
     def __init__(self,location, radius):
         """
@@ -207,12 +447,33 @@ class Sphere(Shape3d):
         """   
         return self._radius
 
+    def get_form(self):
+        """
+        Returns 3x3 matrix F such that point p is inside the sphere if
+        (p - center) @ F has length less than 1
+        """
+        return np.eye(3) / self._radius
+
     def volume(self):
         """
         Returns area of shape
         """ 
         return (4* np.pi * self._radius**3)/3.0 
 
+    def get_bounding_box(self):
+        """
+        Returns corners of box containing the sphere
+        """
+        x, y, z = self.get_location()
+        r = self._radius
+        return (x - r, y - r, z - r), (x + r, y + r, z + r)
+
+    def get_bounding_sphere(self):
+        """
+        Returns ((x,y,z), radius) of sphere containing the sphere (itself)
+        """
+        return self.get_location(), self._radius
+
 
     def check_inside(self,point):
         """  
@@ -227,21 +488,38 @@ class Sphere(Shape3d):
         else:
             return False
 
+    def contains(self, points):
+        """
+        Checks which of the points are inside sphere. Points is array of
+        shape (N,3); returns boolean array of shape (N,)
+        """
+        delta = np.asarray(points, dtype=float) - np.array(self.get_location(), dtype=float)
+        return np.einsum('...i,...i->...', delta, delta) < self._radius**2
+
+    def signed_distance(self, points):
+        """
+        Returns exact distance from points to surface of sphere, negative
+        inside. Points is array of shape (N,3); returns array of shape (N,)
+        """
+        delta = np.asarray(points, dtype=float) - np.array(self.get_location(), dtype=float)
+        return np.sqrt(np.einsum('...i,...i->...', delta, delta)) - self._radius
+
+    def gradient(self, points):
+        """
+        Returns (N,3) array of unit gradients (outward radial directions) of
+        signed distance at points; zero at the center
+        """
+        delta = np.asarray(points, dtype=float) - np.array(self.get_location(), dtype=float)
+        norm  = np.sqrt(np.einsum('...i,...i->...', delta, delta))[..., None]
+        return np.divide(delta, norm, out=np.zeros_like(delta), where=norm > 0)
+
      
-    def draw_shape(self, ax, color='r', line_size=2.5):
+    def get_wireframe(self):
         """
-        Plots the shape using maplotlib patches 
+        Returns meridians and parallels of the sphere as polylines
         """
-        center = self.get_location()
         r = self._radius
-        u, v = np.mgrid[0:2*np.pi:20j, 0:np.pi:10j]
-        x=np.cos(u)*np.sin(v) * r + center[0]
-        y=np.sin(u)*np.sin(v) * r + center[1]
-        z=np.cos(v) * r  + center[2]
-        ax.plot_wireframe(x, y, z, color=color,lw= line_size)
-#  Note : alternate draw_shape command for solid surface
-#         ax.plot_surface(x, y, z, rstride=4, cstride=4, color=color)
-       
+        return ellipsoid_wireframe(self.get_location(), (r, r, r))
 
     def set_plot_size(self, ax):
         """
@@ -262,15 +540,22 @@ class Ellipsoid(Shape3d):
     Class to represent ellipsoid shape. Lengths of semi-principal axes
     are a, b, and c, along x-axis, y axis, and z-axis respectively. 
     """
+    _color = 'r'
     
     def __init__(self,location, a, b, c, rotation = 0):
         """
-        Initializes the Ellipse class object. Rotation is not implemented.
+        Initializes the Ellipse class object. Axes a, b and c are turned by
+        rotation (see rotation_matrix).
         """
         Shape3d.__init__(self,location,rotation)
         self._a    = a
         self._b    = b
         self._c    = c
+        self._matrix    = rotation_matrix(rotation)
+        self._inv_axes2 = (1.0 / a**2, 1.0 / b**2, 1.0 / c**2)
+        # Containment: |(p - center) @ form| < 1
+        self._form      = self.get_rotation() / np.array([a, b, c], dtype=float)
+        self._form_rows = tuple(map(tuple, self._form.tolist()))
         
     def __str__(self):
         """
@@ -296,11 +581,37 @@ class Ellipsoid(Shape3d):
         """      
         return self._c
 
+    def get_form(self):
+        """
+        Returns 3x3 matrix F such that point p is inside the ellipsoid if
+        (p - center) @ F has length less than 1
+        """
+        return self._form
+
     def volume(self):
         """
         Returns volume of shape
         """ 
         return (4.0 * np.pi * self._a * self._b * self._c)/3.0
+
+    def get_bounding_box(self):
+        """
+        Returns corners of box containing the ellipsoid
+        """
+        x, y, z = self.get_location()
+        if self._matrix is not None:
+            # Half extent along each world axis of the rotated ellipsoid
+            axes = np.array([self._a, self._b, self._c], dtype=float)
+            dx, dy, dz = np.sqrt(((self._matrix * axes)**2).sum(axis=1)).tolist()
+            return (x - dx, y - dy, z - dz), (x + dx, y + dy, z + dz)
+        return (x - self._a, y - self._b, z - self._c), (x + self._a, y + self._b, z + self._c)
+
+    def get_bounding_sphere(self):
+        """
+        Returns ((x,y,z), radius) of sphere containing the ellipsoid, with
+        radius its largest axis
+        """
+        return self.get_location(), max(self._a, self._b, self._c)
  
 
     def check_inside(self,point):
@@ -310,30 +621,57 @@ class Ellipsoid(Shape3d):
         """ 
         x, y, z   = point
         xc, yc, zc = self.get_location()
-        if (x-xc)**2/self._a**2 + (y-yc)**2/self._b**2+ (z-zc)**2/self._c**2 < 1.0:
-            return True
-        else:
-            return False
+        dx, dy, dz = x - xc, y - yc, z - zc
+        if self._matrix is None:
+            ia, ib, ic = self._inv_axes2
+            return dx*dx*ia + dy*dy*ib + dz*dz*ic < 1.0
+        (f11, f12, f13), (f21, f22, f23), (f31, f32, f33) = self._form_rows
+        u = dx*f11 + dy*f21 + dz*f31
+        v = dx*f12 + dy*f22 + dz*f32
+        w = dx*f13 + dy*f23 + dz*f33
+        return u*u + v*v + w*w < 1.0
+
+    def contains(self, points):
+        """
+        Checks which of the points are inside ellipsoid. Points is array of
+        shape (N,3); returns boolean array of shape (N,)
+        """
+        delta = np.asarray(points, dtype=float) - np.array(self.get_location(), dtype=float)
+        scaled = delta @ self._form
+        return np.einsum('...i,...i->...', scaled, scaled) < 1.0
+
+    def signed_distance(self, points):
+        """
+        Returns bound on distance from points to surface of ellipsoid,
+        negative inside. If point lies on the scaled surface s*ellipsoid,
+        the true distance is at least |s-1| times the shortest axis, which is
+        what is returned; exact along the shortest axis and for spheres.
+        Points is array of shape (N,3); returns array of shape (N,)
+        """
+        delta = np.asarray(points, dtype=float) - np.array(self.get_location(), dtype=float)
+        scaled = delta @ self._form
+        scale = np.sqrt(np.einsum('...i,...i->...', scaled, scaled))
+        return (scale - 1.0) * min(self._a, self._b, self._c)
+
+    def gradient(self, points):
+        """
+        Returns (N,3) array of unit outward normals of the scaled ellipsoid
+        through each point (direction of steepest increase of distance);
+        zero at the center
+        """
+        delta = np.asarray(points, dtype=float) - np.array(self.get_location(), dtype=float)
+        # Gradient of |delta @ form|**2 is 2 * form @ form.T @ delta
+        normal = (delta @ self._form) @ self._form.T
+        norm = np.sqrt(np.sum(normal**2, axis=-1, keepdims=True))
+        return np.divide(normal, norm, out=np.zeros_like(normal), where=norm > 0)
 
  
-    def draw_shape(self, ax, color='r', line_size=2.5):
+    def get_wireframe(self):
         """
-        Plots the shape using maplotlib wireframe surface 
+        Returns meridians and parallels of the ellipsoid as polylines
         """
-        # Get center and lengths of semi_principal axes (a, b, c)
-        xc, yc, zc = self.get_location()
-        a = self.get_a()
-        b = self.get_b()
-        c = self.get_c()
-        # Use spherical angles to set grid co-ordinates:
-        u, v = np.mgrid[0:2*np.pi:20j, 0:np.pi:10j]
-        x= a * np.cos(u)*np.sin(v) + xc
-        y= b * np.sin(u)*np.sin(v) + yc
-        z= c * np.cos(v) + zc
-        # Plot shape as transparent wireframe:
-        ax.plot_wireframe(x, y, z, color=color,lw= line_size)
-
-       
+        return ellipsoid_wireframe(self.get_location(), (self.get_a(), self.get_b(), self.get_c()),
+                                   self._matrix)
 
     def set_plot_size(self, ax):
         """
@@ -347,3 +685,185 @@ class Ellipsoid(Shape3d):
         ax.set_ylim3d([-max_size,max_size])
         ax.set_zlim3d([-max_size,max_size])
 
+
+class CompoundShape3d(Shape3d):
+    """
+    Super class for shapes built from two other shapes (constructive solid
+    geometry). The compound is located at the center of its first shape and
+    moving it moves both shapes together.
+    """
+
+    def __init__(self, shape1, shape2):
+        """
+        Initializes the compound shape from shape1 and shape2
+        """
+        Shape3d.__init__(self, shape1.get_location())
+        self._shape1 = shape1
+        self._shape2 = shape2
+
+    def __str__(self):
+        """
+        Creates printable output for shape
+        """
+        return self._name + " of (" + str(self._shape1) + ") and (" + str(self._shape2) + ")"
+
+    def get_shapes(self):
+        """
+        Returns the two shapes the compound is built from
+        """
+        return self._shape1, self._shape2
+
+    def get_location(self):
+        """
+        Returns current location of compound (center of first shape)
+        """
+        return self._shape1.get_location()
+
+    def move(self, new_location):
+        """
+        Moves the compound, keeping the relative position of its shapes
+        """
+        old = np.array(self.get_location(), dtype=float)
+        for shape in (self._shape1, self._shape2):
+            offset = np.array(shape.get_location(), dtype=float) - old
+            shape.move(tuple(np.asarray(new_location, dtype=float) + offset))
+        self._location = self.get_location()
+
+    def volume(self, num_points=VOLUME_POINTS, seed=0):
+        """
+        Returns Monte Carlo estimate of the volume of the compound (it has no
+        closed form): the share of num_points uniform random points of the
+        bounding box inside the compound, times the box volume. The points
+        are drawn from seed, so the estimate is the same on every call.
+        """
+        lower, upper = (np.asarray(corner, dtype=float) for corner in self.get_bounding_box())
+        if np.any(upper <= lower):
+            return 0.0          # Empty bounding box (e.g. disjoint intersection)
+        points = np.random.default_rng(seed).uniform(lower, upper, size=(num_points, 3))
+        inside = np.count_nonzero(self.contains(points))
+        return float(np.prod(upper - lower) * inside / num_points)
+
+    def _pick(self, points):
+        """
+        Returns signed distances of both shapes at points, as used by the
+        compound, and mask where the first one sets the compound distance
+        """
+        raise NotImplementedError
+
+    def signed_distance(self, points):
+        """
+        Returns bound on distance from points to surface of compound, negative
+        inside. Points is array of shape (N,3); returns array of shape (N,)
+        """
+        dist1, dist2, first = self._pick(points)
+        return np.where(first, dist1, dist2)
+
+    def gradient(self, points):
+        """
+        Returns (N,3) array of gradients of signed distance at points, taken
+        from the shape that sets the distance
+        """
+        points = np.asarray(points, dtype=float)
+        dist1, dist2, first = self._pick(points)
+        grad2 = self._shape2.gradient(points) * self._sign2
+        return np.where(first[..., None], self._shape1.gradient(points), grad2)
+
+    def get_wireframe(self):
+        """
+        Returns polylines of the wireframes of both shapes of the compound
+        """
+        return self._shape1.get_wireframe() + self._shape2.get_wireframe()
+
+    def set_plot_size(self, ax):
+        """
+        Sets plot size (limits) from the first shape
+        """
+        self._shape1.set_plot_size(ax)
+
+
+class Union3d(CompoundShape3d):
+    """
+    Class to represent the union of two shapes: inside if inside either one
+    """
+    _name  = "Union"
+    _sign2 = 1.0
+
+    def get_bounding_box(self):
+        """
+        Returns corners of box containing both shapes
+        """
+        (low1, high1), (low2, high2) = self._shape1.get_bounding_box(), self._shape2.get_bounding_box()
+        return tuple(np.minimum(low1, low2).tolist()), tuple(np.maximum(high1, high2).tolist())
+
+    def contains(self, points):
+        """
+        Checks which of the points are inside either shape
+        """
+        return self._shape1.contains(points) | self._shape2.contains(points)
+
+    def _pick(self, points):
+        """
+        Union distance is the smaller of the two distances
+        """
+        dist1 = self._shape1.signed_distance(points)
+        dist2 = self._shape2.signed_distance(points)
+        return dist1, dist2, dist1 <= dist2
+
+
+class Intersection3d(CompoundShape3d):
+    """
+    Class to represent the intersection of two shapes: inside if inside both
+    """
+    _name  = "Intersection"
+    _sign2 = 1.0
+
+    def get_bounding_box(self):
+        """
+        Returns corners of box containing the overlap of the shapes
+        """
+        (low1, high1), (low2, high2) = self._shape1.get_bounding_box(), self._shape2.get_bounding_box()
+        return tuple(np.maximum(low1, low2).tolist()), tuple(np.minimum(high1, high2).tolist())
+
+    def contains(self, points):
+        """
+        Checks which of the points are inside both shapes
+        """
+        return self._shape1.contains(points) & self._shape2.contains(points)
+
+    def _pick(self, points):
+        """
+        Intersection distance is the larger of the two distances
+        """
+        dist1 = self._shape1.signed_distance(points)
+        dist2 = self._shape2.signed_distance(points)
+        return dist1, dist2, dist1 >= dist2
+
+
+class Difference3d(CompoundShape3d):
+    """
+    Class to represent the first shape with the second cut out of it:
+    inside if inside the first shape and not inside the second
+    """
+    _name  = "Difference"
+    _sign2 = -1.0
+
+    def get_bounding_box(self):
+        """
+        Returns corners of box containing the first shape
+        """
+        return self._shape1.get_bounding_box()
+
+    def contains(self, points):
+        """
+        Checks which of the points are inside first shape but not the second
+        """
+        return self._shape1.contains(points) & ~self._shape2.contains(points)
+
+    def _pick(self, points):
+        """
+        Difference distance is the larger of the first distance and the
+        negated second distance
+        """
+        dist1 = self._shape1.signed_distance(points)
+        dist2 = -self._shape2.signed_distance(points)
+        return dist1, dist2, dist1 >= dist2